@@ -101,7 +101,7 @@ async function main() {
     dnsInstrument.run(config.browser_id);
   }
 
-  await browser.profileDirIO.writeFile("OPENWPM_STARTUP_SUCCESS.txt", "");
+  await loggingDB.announceStartup(config.startup_address);
 }
 
 main();
@@ -6,6 +6,47 @@ let debugging = false;
 let storageController = null;
 let logAggregator = null;
 let listeningSocket = null;
+let browserManager = null;
+
+// The requests started during the current visit that haven't completed yet
+const pendingRequests = new Set<string>();
+// When a record was last saved for the current visit
+let lastRecordTime = 0;
+// How long the current visit has to be quiet before it is finalized
+const FINALIZE_GRACE_MS = 500;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const onRequestStarted = (details) => {
+  if (visitID) {
+    pendingRequests.add(details.requestId);
+  }
+};
+
+const onRequestFinished = (details) => {
+  pendingRequests.delete(details.requestId);
+};
+
+/**
+ * Waits until the requests of the current visit have completed and no
+ * instrument saved a record for it in the last FINALIZE_GRACE_MS, but at
+ * most `timeout` seconds.
+ */
+const drainVisit = async (timeout: number) => {
+  const deadline = Date.now() + timeout * 1000;
+  const busy = () =>
+    pendingRequests.size > 0 || Date.now() - lastRecordTime < FINALIZE_GRACE_MS;
+  while (busy() && Date.now() < deadline) {
+    await sleep(100);
+  }
+  if (pendingRequests.size > 0) {
+    logDebug(
+      `Finalizing visit_id ${visitID} with ` +
+        `${pendingRequests.size} requests still in flight`,
+    );
+  }
+  pendingRequests.clear();
+};
 
 const listeningSocketCallback = async (data) => {
   // This works even if data is an int
@@ -30,10 +71,26 @@ const listeningSocketCallback = async (data) => {
             `Current visit_id ${newVisitID}, received visit_id ${visitID}.`,
         );
       }
-      data.browser_id = crawlID;
-      data.success = true;
-      storageController.send(JSON.stringify(["meta_information", data]));
+      // Everything the instruments still save belongs to this visit. The
+      // BrowserManager waits for our reply before it starts the next one.
+      await drainVisit(data.drain_timeout || 0);
       visitID = null;
+      storageController.send(
+        JSON.stringify([
+          "meta_information",
+          {
+            action: action,
+            visit_id: newVisitID,
+            browser_id: crawlID,
+            success: true,
+          },
+        ]),
+      );
+      if (browserManager != null) {
+        browserManager.send(
+          JSON.stringify({ action: "Finalized", visit_id: newVisitID }),
+        );
+      }
       break;
     default:
       // Just making sure that it's a valid number before logging
@@ -80,15 +137,33 @@ export const open = async function (
   // Listen for incoming urls as visit ids
   listeningSocket = new socket.ListeningSocket(listeningSocketCallback);
   console.log("Starting socket listening for incoming connections.");
-  await listeningSocket.startListening().then(() => {
-    browser.profileDirIO.writeFile(
-      "extension_port.txt",
-      `${listeningSocket.port}`,
-    );
-  });
+  await listeningSocket.startListening();
+
+  const filter = { urls: ["<all_urls>"] };
+  browser.webRequest.onBeforeRequest.addListener(onRequestStarted, filter);
+  browser.webRequest.onCompleted.addListener(onRequestFinished, filter);
+  browser.webRequest.onErrorOccurred.addListener(onRequestFinished, filter);
+};
+
+/**
+ * Tells the BrowserManager waiting on `startupAddress` that the extension
+ * has started up and which port it listens on for commands
+ */
+export const announceStartup = async function (startupAddress: any[]) {
+  if (debugging || startupAddress == null) {
+    return;
+  }
+  // The socket only queues the data for sending, closing it right away
+  // could drop the announcement. It's kept open like the other sockets.
+  browserManager = new socket.SendingSocket();
+  await browserManager.connect(startupAddress[0], startupAddress[1]);
+  browserManager.send(JSON.stringify({ port: listeningSocket.port }));
 };
 
 export const close = function () {
+  if (browserManager != null) {
+    browserManager.close();
+  }
   if (storageController != null) {
     storageController.close();
   }
@@ -184,6 +259,9 @@ export const dataReceiver = {
 
 export const saveRecord = function (instrument, record) {
   record.visit_id = visitID;
+  if (visitID) {
+    lastRecordTime = Date.now();
+  }
 
   if (!visitID && !debugging) {
     // Navigations to about:blank can be triggered by OpenWPM. We drop those.
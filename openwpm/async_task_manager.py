@@ -0,0 +1,122 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Type
+
+from .command_sequence import CommandSequence
+from .commands.types import CommandResults
+from .config import BrowserParams, ManagerParams
+from .storage.storage_providers import (
+    StructuredStorageProvider,
+    UnstructuredStorageProvider,
+)
+from .task_manager import TaskManager
+from .types import BrowserId, VisitId
+
+
+@dataclass
+class VisitResult:
+    """The outcome of a CommandSequence run by `AsyncTaskManager.visit`"""
+
+    url: str
+    site_rank: Optional[int]
+    visit_id: Optional[VisitId]
+    browser_id: Optional[BrowserId]
+    success: bool
+    """Whether all commands succeeded and all data of the visit was saved"""
+    results: CommandResults
+    """The values returned by the commands, keyed by command name"""
+
+
+class AsyncTaskManager:
+    """asyncio front-end of the TaskManager
+
+    Lets an asyncio application run visits without blocking its event loop:
+
+    async with AsyncTaskManager(manager_params, browser_params, provider) as manager:
+        result = await manager.visit(sequence)
+
+    Visits are handed to `TaskManager.submit`, so they are scheduled like
+    any other submitted CommandSequence, and their completion is delivered
+    through its futures. Starting and closing the TaskManager and waiting
+    for room in a full submission queue happen in worker threads.
+    """
+
+    def __init__(
+        self,
+        manager_params: ManagerParams,
+        browser_params: List[BrowserParams],
+        structured_storage_provider: StructuredStorageProvider,
+        unstructured_storage_provider: Optional[UnstructuredStorageProvider] = None,
+        logger_kwargs: Dict[Any, Any] = {},
+    ) -> None:
+        self._args = (
+            manager_params,
+            browser_params,
+            structured_storage_provider,
+            unstructured_storage_provider,
+            logger_kwargs,
+        )
+        self.task_manager: Optional[TaskManager] = None
+        # Submissions block while the submission queue is full, running them
+        # one at a time keeps them in order
+        self._submitter = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="OpenWPM-async-submit"
+        )
+
+    async def start(self) -> None:
+        """Launch the StorageController and the browsers"""
+        loop = asyncio.get_running_loop()
+        self.task_manager = await loop.run_in_executor(
+            None, lambda: TaskManager(*self._args)
+        )
+
+    async def visit(
+        self, command_sequence: CommandSequence, index: Optional[int] = None
+    ) -> VisitResult:
+        """Run `command_sequence` and wait until all of its data is saved
+
+        See `TaskManager.submit` for `index`. Raises the same exceptions as
+        `TaskManager.execute_command_sequence` once the TaskManager has
+        failed, and `asyncio.CancelledError` if the visit was cancelled
+        before it started. Cancelling the awaiting task cancels the visit
+        unless it has already started.
+        """
+        assert self.task_manager is not None, "AsyncTaskManager wasn't started"
+        loop = asyncio.get_running_loop()
+        if self.task_manager.failure_status:
+            # Shuts the TaskManager down and raises the failure
+            await loop.run_in_executor(None, self.task_manager._check_failure_status)
+        future = await loop.run_in_executor(
+            self._submitter, self.task_manager.submit, command_sequence, index
+        )
+        success = await asyncio.wrap_future(future)
+        return VisitResult(
+            url=command_sequence.url,
+            site_rank=command_sequence.site_rank,
+            visit_id=command_sequence.visit_id,
+            browser_id=command_sequence.browser_id,
+            success=success,
+            results=command_sequence.results,
+        )
+
+    async def close(self, relaxed: bool = True) -> None:
+        """Shut down the TaskManager, see `TaskManager.close`"""
+        if self.task_manager is None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.task_manager.close, relaxed)
+        self._submitter.shutdown(wait=False)
+
+    async def __aenter__(self) -> "AsyncTaskManager":
+        await self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        await self.close()
@@ -1,8 +1,10 @@
-import errno
+import contextlib
+import copy
 import json
 import logging
 import os
 import pickle
+import queue
 import shutil
 import signal
 import sys
@@ -12,35 +14,57 @@ import time
 import traceback
 from pathlib import Path
 from queue import Empty as EmptyQueue
-from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Type, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 import psutil
 from multiprocess import Process, Queue
 from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.firefox.service import Service
 from tblib import Traceback, pickling_support
 
 from .command_sequence import CommandSequence
-from .commands.browser_commands import FinalizeCommand
+from .commands.browser_commands import FinalizeCommand, InitializeCommand
 from .commands.profile_commands import dump_profile
-from .commands.types import BaseCommand, ShutdownSignal
+from .commands.types import BaseCommand, CommandResults, ShutdownSignal
 from .commands.utils.webdriver_utils import parse_neterror
 from .config import BrowserParamsInternal, ManagerParamsInternal
 from .deploy_browsers import deploy_firefox
+from .deploy_browsers.selenium_firefox import FirefoxLogInterceptor
 from .errors import BrowserConfigError, BrowserCrashError, ProfileLoadError
-from .socket_interface import ClientSocket
+from .scheduler import site_domain
+from .socket_interface import ExtensionSocket, ServerSocket
 from .storage.storage_providers import TableName
 from .types import BrowserId, VisitId
 from .utilities.multiprocess_utils import (
     kill_process_and_children,
     parse_traceback_for_sentry,
 )
+from .utilities.platform_utils import get_firefox_binary_path, get_geckodriver_path
+from .utilities.profile_snapshot import ProfileSnapshot
 from .utilities.storage_watchdog import profile_size_exceeds_max_size
 
 pickling_support.install()
 
 if TYPE_CHECKING:
+    from .standby_pool import StandbyPool
     from .task_manager import TaskManager
 
+# A CommandSequence assigned to a browser and the event to set once it has run
+Assignment = Tuple[CommandSequence, threading.Event]
+
+COMMAND_WAIT_TIMEOUT = 1  # seconds
+EXTENSION_STARTUP_TIMEOUT = 10  # seconds
+
 
 class BrowserManagerHandle:
     """The BrowserManagerHandle class is responsible for holding all the
@@ -64,6 +88,7 @@ class BrowserManagerHandle:
 
         # manager parameters
         self.current_profile_path: Optional[Path] = None
+        self.profile_snapshot: Optional[ProfileSnapshot] = None
         self.db_socket_address = manager_params.storage_controller_address
         assert browser_params.browser_id is not None
         self.browser_id: BrowserId = browser_params.browser_id
@@ -73,14 +98,25 @@ class BrowserManagerHandle:
 
         # Queues and process IDs for BrowserManager
 
-        self.command_thread: Optional[threading.Thread] = None
-        """thread to run commands issued from TaskManager"""
+        self.worker: Optional[threading.Thread] = None
+        """thread that runs the CommandSequences put into `inbox`"""
+        self.inbox: "queue.Queue[Optional[Assignment]]" = queue.Queue()
+        """CommandSequences assigned to this browser that haven't started yet"""
+        self.assigned = 0
+        """number of assigned CommandSequences that haven't finished yet"""
+        self.finalizing = False
+        """whether the running CommandSequence is at its FinalizeCommand"""
+        self.idle = threading.Event()
+        """set while no CommandSequence is assigned to this browser"""
+        self.idle.set()
         self.command_queue: Optional[Queue] = None
         """queue for passing command objects to BrowserManager"""
         self.status_queue: Optional[Queue] = None
         """queue for receiving command execution status from BrowserManager"""
         self.geckodriver_pid: Optional[int] = None
         """pid for browser instance controlled by BrowserManager"""
+        self.geckodriver: Optional[Service] = None
+        """the geckodriver that outlives restarts with `reuse_geckodriver`"""
         self.display_pid: Optional[int] = None
         """the pid of the display for the Xvfb display (if it exists)"""
         self.display_port: Optional[int] = None
@@ -95,12 +131,76 @@ class BrowserManagerHandle:
         """timeout of the current command"""
         self.browser_manager: Optional[Process] = None
         """process that controls browser"""
+        self.launch_timings: Dict[str, float] = dict()
+        """seconds each stage of the last successful launch took, see
+        `launch_browser_manager`"""
 
         self.logger = logging.getLogger("openwpm")
 
-    def ready(self):
-        """return if the browser is ready to accept a command"""
-        return self.command_thread is None or not self.command_thread.is_alive()
+    def ready(self) -> bool:
+        """return if the browser is ready to accept a command
+
+        A browser that is running its FinalizeCommand already accepts the
+        next CommandSequence, which its worker starts right afterwards.
+        """
+        return self.assigned == 0 or (self.assigned == 1 and self.finalizing)
+
+    def start_worker(
+        self, run: Callable[["BrowserManagerHandle", CommandSequence], None]
+    ) -> None:
+        """Start the thread that calls `run` for each assigned CommandSequence"""
+        self.worker = threading.Thread(target=self._work, args=(run,))
+        self.worker.name = f"BrowserManagerHandle-{self.browser_id}"
+        self.worker.daemon = True
+        self.worker.start()
+
+    def _work(
+        self, run: Callable[["BrowserManagerHandle", CommandSequence], None]
+    ) -> None:
+        while True:
+            assignment = self.inbox.get()
+            if assignment is None:
+                return
+            command_sequence, done = assignment
+            try:
+                run(self, command_sequence)
+            finally:
+                done.set()
+
+    def assign(self, command_sequence: CommandSequence) -> threading.Event:
+        """Queue `command_sequence` for the worker
+
+        Returns an event that is set once the CommandSequence has run.
+        """
+        self.assigned += 1
+        self.idle.clear()
+        done = threading.Event()
+        self.inbox.put((command_sequence, done))
+        return done
+
+    def finished(self) -> None:
+        """Called once an assigned CommandSequence has run or was dropped"""
+        self.assigned -= 1
+        self.finalizing = False
+        if not self.assigned:
+            self.idle.set()
+
+    def stop_worker(self) -> List[CommandSequence]:
+        """Stop the worker once it's done with the running CommandSequence
+
+        Returns the assigned CommandSequences that haven't started yet.
+        """
+        dropped = []
+        while True:
+            try:
+                assignment = self.inbox.get_nowait()
+            except EmptyQueue:
+                break
+            if assignment is not None:
+                dropped.append(assignment[0])
+                assignment[1].set()
+        self.inbox.put(None)
+        return dropped
 
     def set_visit_id(self, visit_id):
         self.curr_visit_id = visit_id
@@ -115,16 +215,20 @@ class BrowserManagerHandle:
         # if this is restarting from a crash, update the tar location
         # to be a tar of the crashed browser's history
         if self.current_profile_path is not None:
-            # tar contents of crashed profile to a temp dir
-            tempdir = tempfile.mkdtemp(prefix="openwpm_profile_archive_")
-            tar_path = Path(tempdir) / "profile.tar"
-
-            dump_profile(
-                browser_profile_path=self.current_profile_path,
-                tar_path=tar_path,
-                compress=False,
-                browser_params=self.browser_params,
-            )
+            if self.browser_params.incremental_recovery:
+                # only snapshot the state files that changed since the last crash
+                tar_path = self._update_profile_snapshot(self.current_profile_path)
+            else:
+                # tar contents of crashed profile to a temp dir
+                tempdir = tempfile.mkdtemp(prefix="openwpm_profile_archive_")
+                tar_path = Path(tempdir) / "profile.tar"
+
+                dump_profile(
+                    browser_profile_path=self.current_profile_path,
+                    tar_path=tar_path,
+                    compress=False,
+                    browser_params=self.browser_params,
+                )
 
             # make sure browser loads crashed profile
             self.browser_params.recovery_tar = tar_path
@@ -134,15 +238,25 @@ class BrowserManagerHandle:
         self.logger.info("BROWSER %i: Launching browser..." % self.browser_id)
         self.is_fresh = not crash_recovery
 
+        # Look the binaries up in this process, so the BrowserManagers forked
+        # from it find them in the cache. Errors are left to the BrowserManager.
+        with contextlib.suppress(RuntimeError):
+            get_firefox_binary_path()
+            get_geckodriver_path()
+
         # Try to spawn the browser within the timelimit
         unsuccessful_spawns = 0
         success = False
 
-        def check_queue(launch_status: Dict[str, bool]) -> Any:
+        def check_queue(
+            launch_status: Dict[str, bool], timings: Dict[str, float]
+        ) -> Any:
             assert self.status_queue is not None
             result = self.status_queue.get(True, self._SPAWN_TIMEOUT)
             if result[0] == "STATUS":
                 launch_status[result[1]] = True
+                # Time since the previous stage completed
+                timings[result[1]] = time.time() - launch_start - sum(timings.values())
                 return result[2]
             elif result[0] == "CRITICAL":
                 _, exc, tb = pickle.loads(result[1])
@@ -158,32 +272,39 @@ class BrowserManagerHandle:
             (self.command_queue, self.status_queue) = (Queue(), Queue())
 
             # builds and launches the browser_manager
-
+            launch_start = time.time()
+            geckodriver = None
+            if self.manager_params.reuse_geckodriver:
+                geckodriver = self._start_geckodriver()
             self.browser_manager = BrowserManager(
                 self.command_queue,
                 self.status_queue,
                 self.browser_params,
                 self.manager_params,
                 crash_recovery,
+                geckodriver,
             )
             self.browser_manager.daemon = True
             self.browser_manager.start()
 
             # Read success status of browser manager
             launch_status: Dict[str, bool] = dict()
+            timings: Dict[str, float] = dict()
             try:
                 # 1. Browser profile created
-                browser_profile_path = check_queue(launch_status)
+                browser_profile_path = check_queue(launch_status, timings)
                 # 2. Profile tar loaded (if necessary)
-                check_queue(launch_status)
+                check_queue(launch_status, timings)
                 # 3. Display launched (if necessary)
-                self.display_pid, self.display_port = check_queue(launch_status)
+                self.display_pid, self.display_port = check_queue(
+                    launch_status, timings
+                )
                 # 4. Browser launch attempted
-                check_queue(launch_status)
+                check_queue(launch_status, timings)
                 # 5. Browser launched
-                self.geckodriver_pid = check_queue(launch_status)
+                self.geckodriver_pid = check_queue(launch_status, timings)
 
-                ready = check_queue(launch_status)
+                ready = check_queue(launch_status, timings)
                 if ready != "READY":
                     self.logger.error(
                         "BROWSER %i: Mismatch of status queue return values, "
@@ -220,7 +341,12 @@ class BrowserManagerHandle:
         # current profile path class variable and clean up the tempdir
         # and previous profile path.
         if success:
-            self.logger.debug("BROWSER %i: Browser spawn successful!" % self.browser_id)
+            timings["Total"] = sum(timings.values())
+            self.launch_timings = timings
+            self.logger.debug(
+                "BROWSER %i: Browser spawn successful! Launch stages took %s"
+                % (self.browser_id, self._format_timings(timings))
+            )
             previous_profile_path = self.current_profile_path
             self.current_profile_path = browser_profile_path
             if previous_profile_path is not None:
@@ -230,10 +356,63 @@ class BrowserManagerHandle:
 
         return success
 
-    def restart_browser_manager(self, clear_profile=False):
+    def _start_geckodriver(self) -> Tuple[int, int]:
+        """Starts the long-lived geckodriver unless it is still running
+        and returns its port and pid"""
+        if self.geckodriver is None or self.geckodriver.process.poll() is not None:
+            if self.geckodriver is not None:
+                self.geckodriver.stop()
+            interceptor = FirefoxLogInterceptor(self.browser_id)
+            interceptor.start()
+            self.geckodriver = Service(
+                executable_path=get_geckodriver_path(),
+                log_output=open(interceptor.fifo, "w"),
+            )
+            self.geckodriver.start()
+            self.logger.debug(
+                "BROWSER %i: Started geckodriver with pid %i"
+                % (self.browser_id, self.geckodriver.process.pid)
+            )
+        return self.geckodriver.port, self.geckodriver.process.pid
+
+    def _stop_geckodriver(self) -> None:
+        if self.geckodriver is not None:
+            self.geckodriver.stop()
+            self.geckodriver = None
+
+    def _update_profile_snapshot(self, profile_path: Path) -> Path:
+        """Updates the snapshot of the browsing state in profile_path and
+        returns its location"""
+        if self.profile_snapshot is None:
+            self.profile_snapshot = ProfileSnapshot(
+                Path(
+                    tempfile.mkdtemp(
+                        prefix="openwpm_profile_snapshot_",
+                        dir=self.browser_params.tmp_profile_dir,
+                    )
+                ),
+                compress=self.browser_params.compress_recovery_snapshots,
+            )
+        start_time = time.time()
+        copied = self.profile_snapshot.update(profile_path)
+        self.logger.debug(
+            "BROWSER %i: Updated %d files of the profile snapshot in %.2f seconds"
+            % (self.browser_id, len(copied), time.time() - start_time)
+        )
+        return self.profile_snapshot.path
+
+    @staticmethod
+    def _format_timings(timings: Dict[str, float]) -> str:
+        return ", ".join("%s: %.2fs" % (stage, t) for stage, t in timings.items())
+
+    def restart_browser_manager(
+        self, clear_profile: bool = False, standby_pool: Optional["StandbyPool"] = None
+    ) -> bool:
         """
         kill and restart the two worker processes
         <clear_profile> marks whether we want to wipe the old profile
+        <standby_pool> provides spare BrowserManagers to swap in when the
+        profile is wiped anyway
         """
         self.logger.info(
             "BROWSER %i: BrowserManager restart initiated. "
@@ -246,6 +425,16 @@ class BrowserManagerHandle:
             )
             return True
 
+        if clear_profile and standby_pool is not None:
+            standby = standby_pool.take(self.browser_id)
+            if standby is not None:
+                self.logger.info(
+                    "BROWSER %i: Swapping in a standby browser" % self.browser_id
+                )
+                standby_pool.retire(self.swap_in(standby))
+                self.browser_params.recovery_tar = None
+                return True
+
         self.close_browser_manager()
 
         # if crawl should be stateless we can clear profile
@@ -256,6 +445,29 @@ class BrowserManagerHandle:
 
         return self.launch_browser_manager()
 
+    def swap_in(self, standby: "BrowserManagerHandle") -> "BrowserManagerHandle":
+        """Take over the already launched BrowserManager of `standby`
+
+        Returns a handle on the BrowserManager that was controlled by this
+        handle until now, which the caller has to shut down.
+        """
+        retired = copy.copy(self)
+        # The retired BrowserManager isn't running any commands anymore
+        retired.worker = None
+        retired.assigned = 0
+        # The snapshot stays with the browser slot
+        retired.profile_snapshot = None
+        self.browser_manager = standby.browser_manager
+        self.command_queue = standby.command_queue
+        self.status_queue = standby.status_queue
+        self.geckodriver_pid = standby.geckodriver_pid
+        self.geckodriver = standby.geckodriver
+        self.display_pid = standby.display_pid
+        self.display_port = standby.display_port
+        self.current_profile_path = standby.current_profile_path
+        self.is_fresh = True
+        return retired
+
     def close_browser_manager(self, force: bool = False) -> None:
         """Attempt to close the webdriver and browser manager processes
         from this thread.
@@ -267,28 +479,28 @@ class BrowserManagerHandle:
             if force:
                 return
 
-            # Join current command thread (if it exists)
-            in_command_thread = threading.current_thread() == self.command_thread
-            if not in_command_thread and self.command_thread is not None:
+            # Wait for the assigned CommandSequences (if any)
+            in_worker = threading.current_thread() == self.worker
+            if not in_worker and self.assigned:
                 self.logger.debug(
-                    "BROWSER %i: Joining command thread" % self.browser_id
+                    "BROWSER %i: Waiting for the worker to finish" % self.browser_id
                 )
                 start_time = time.time()
                 if self.current_timeout is not None:
-                    self.command_thread.join(self.current_timeout + 10)
+                    self.idle.wait(self.current_timeout + 10)
                 else:
-                    self.command_thread.join(60)
+                    self.idle.wait(60)
 
-                # If command thread is still alive, process is locked
-                if self.command_thread.is_alive():
+                # If the worker is still busy, process is locked
+                if not self.idle.is_set():
                     self.logger.debug(
-                        "BROWSER %i: command thread failed to join during close. "
+                        "BROWSER %i: worker failed to finish during close. "
                         "Assuming the browser process is locked..." % self.browser_id
                     )
                     return
 
                 self.logger.debug(
-                    "BROWSER %i: %f seconds to join command thread"
+                    "BROWSER %i: %f seconds to wait for the worker"
                     % (self.browser_id, time.time() - start_time)
                 )
 
@@ -373,11 +585,28 @@ class BrowserManagerHandle:
         assert self.command_queue is not None
         assert self.status_queue is not None
 
+        timeouts = task_manager.timeouts
+        domain = (
+            site_domain(command_sequence.url)
+            if timeouts is not None and timeouts.per_domain
+            else None
+        )
         for command_and_timeout in command_sequence.get_commands_with_timeout():
             command, timeout = command_and_timeout
+            command_name = type(command).__name__
+            # Time the command spends sleeping on purpose, which isn't learned
+            wait = getattr(command, "sleep", 0)
+            if timeouts is not None:
+                timeout = timeouts.timeout(command.name, timeout, domain, wait)
             command.set_visit_browser_id(self.curr_visit_id, self.browser_id)
             command.set_start_time(time.time())
             self.current_timeout = timeout
+            if type(command) is FinalizeCommand:
+                # Let the TaskManager hand us the next CommandSequence while
+                # the browser finishes this visit
+                with task_manager._browser_ready:
+                    self.finalizing = True
+                    task_manager._browser_ready.notify_all()
 
             # Adding timer to track performance of commands
             t1 = time.time_ns()
@@ -389,6 +618,7 @@ class BrowserManagerHandle:
             error_text = None
             tb = None
             status = None
+            result = None
             try:
                 status = self.status_queue.get(True, self.current_timeout)
             except EmptyQueue:
@@ -404,6 +634,12 @@ class BrowserManagerHandle:
                 pass
             elif status == "OK":
                 command_status = "ok"
+            elif status == "SKIPPED":
+                command_status = "skipped"
+            elif status[0] == "OK":
+                command_status = "ok"
+                result = status[1]
+                command_sequence.results[command.name] = result
             elif status[0] == "CRITICAL":
                 command_status = "critical"
                 self.logger.critical(
@@ -435,13 +671,22 @@ class BrowserManagerHandle:
             else:
                 raise ValueError("Unknown browser status message %s" % status)
 
+            if timeouts is not None:
+                if command_status == "ok":
+                    timeouts.record(
+                        command.name, (time.time_ns() - t1) / 1e9, domain, wait
+                    )
+                elif command_status == "timeout":
+                    # The command took at least as long as its timeout
+                    timeouts.record(command.name, timeout, domain, wait)
+
             task_manager.sock.store_record(
                 TableName("crawl_history"),
                 self.curr_visit_id,
                 {
                     "browser_id": self.browser_id,
                     "visit_id": self.curr_visit_id,
-                    "command": type(command).__name__,
+                    "command": command_name,
                     "arguments": json.dumps(
                         command.__dict__, default=lambda x: repr(x)
                     ).encode("utf-8"),
@@ -450,6 +695,11 @@ class BrowserManagerHandle:
                     "error": error_text,
                     "traceback": tb,
                     "duration": int((time.time_ns() - t1) / 1000000),
+                    "result": (
+                        json.dumps(result, default=lambda x: repr(x))
+                        if result is not None
+                        else None
+                    ),
                 },
             )
 
@@ -460,7 +710,7 @@ class BrowserManagerHandle:
                 )
                 return
 
-            if command_status != "ok":
+            if command_status not in ("ok", "skipped"):
                 with task_manager.threadlock:
                     task_manager.failure_count += 1
                 if task_manager.failure_count > task_manager.failure_limit:
@@ -495,10 +745,6 @@ class BrowserManagerHandle:
             self.curr_visit_id,
             self.browser_id,
         )
-        # Sleep after executing CommandSequence to provide extra time for
-        # internal buffers to drain. Stopgap in support of #135
-        time.sleep(2)
-
         if task_manager.closing:
             return
 
@@ -513,7 +759,9 @@ class BrowserManagerHandle:
             )
 
         if self.restart_required or reset:
-            success = self.restart_browser_manager(clear_profile=reset)
+            success = self.restart_browser_manager(
+                clear_profile=reset, standby_pool=task_manager.standby_pool
+            )
             if not success:
                 self.logger.critical(
                     "BROWSER %i: Exceeded the maximum allowable consecutive "
@@ -596,7 +844,8 @@ class BrowserManagerHandle:
         if self.geckodriver_pid is not None:
             """`geckodriver_pid` is the geckodriver process. We first kill
             the child processes (i.e. firefox) and then kill the geckodriver
-            process."""
+            process, unless it is the long-lived `geckodriver` that outlives
+            restarts."""
             try:
                 geckodriver_process = psutil.Process(pid=self.geckodriver_pid)
             except psutil.NoSuchProcess:
@@ -605,13 +854,18 @@ class BrowserManagerHandle:
                     " exited" % (self.browser_id, self.geckodriver_pid)
                 )
                 return
-            kill_process_and_children(geckodriver_process, self.logger)
+            if self.geckodriver is None:
+                kill_process_and_children(geckodriver_process, self.logger)
+            else:
+                for child in geckodriver_process.children():
+                    kill_process_and_children(child, self.logger)
 
     def shutdown_browser(self, during_init: bool, force: bool = False) -> None:
         """Runs the closing tasks for this Browser/BrowserManager"""
         # Close BrowserManager process and children
         self.logger.debug("BROWSER %i: Closing browser manager..." % self.browser_id)
         self.close_browser_manager(force=force)
+        self._stop_geckodriver()
 
         # Archive browser profile (if requested)
         self.logger.debug(
@@ -639,6 +893,8 @@ class BrowserManagerHandle:
         # Clean up temporary files
         if self.current_profile_path is not None:
             shutil.rmtree(self.current_profile_path, ignore_errors=True)
+        if self.profile_snapshot is not None:
+            shutil.rmtree(self.profile_snapshot.path, ignore_errors=True)
 
 
 class BrowserManager(Process):
@@ -657,6 +913,7 @@ class BrowserManager(Process):
         browser_params: BrowserParamsInternal,
         manager_params: ManagerParamsInternal,
         crash_recovery: bool,
+        geckodriver: Optional[Tuple[int, int]] = None,
     ) -> None:
         super().__init__()
         self.logger = logging.getLogger("openwpm")
@@ -665,6 +922,8 @@ class BrowserManager(Process):
         self.browser_params = browser_params
         self.manager_params = manager_params
         self.crash_recovery = crash_recovery
+        self.geckodriver = geckodriver
+        self._parent_pid = os.getpid()
 
         self.critical_exceptions: Tuple[Type[BaseException], ...] = (
             ProfileLoadError,
@@ -673,57 +932,52 @@ class BrowserManager(Process):
         if self.manager_params.testing:
             self.critical_exceptions += (AssertionError,)
 
-    def _start_extension(self, browser_profile_path: Path) -> ClientSocket:
+    def _next_command(self) -> Union[ShutdownSignal, BaseCommand]:
+        """Blocks until the TaskManager sends the next command
+
+        Wakes up every COMMAND_WAIT_TIMEOUT seconds to check whether the
+        TaskManager is still around and shuts down if it isn't.
+        """
+        while True:
+            try:
+                return self.command_queue.get(timeout=COMMAND_WAIT_TIMEOUT)
+            except EmptyQueue:
+                if os.getppid() != self._parent_pid:
+                    self.logger.error(
+                        "BROWSER %i: TaskManager process is gone, shutting down"
+                        % self.browser_params.browser_id
+                    )
+                    return ShutdownSignal()
+
+    def _start_extension(self, startup_socket: ServerSocket) -> ExtensionSocket:
         """Start up the extension
-        Blocks until the extension has fully started up
+        Blocks until the extension has fully started up and announced the
+        port it listens on through `startup_socket`. The extension keeps
+        that connection open to reply to commands.
         """
         assert self.browser_params.browser_id is not None
         self.logger.debug(
-            "BROWSER %i: Looking for extension port information "
-            "in %s" % (self.browser_params.browser_id, browser_profile_path)
+            "BROWSER %i: Waiting for the extension to start up"
+            % self.browser_params.browser_id
         )
-        elapsed = 0.0
-        port = None
-        ep_filename = browser_profile_path / "extension_port.txt"
-        while elapsed < 5:
-            try:
-                with open(ep_filename, "rt") as f:
-                    port = int(f.read().strip())
-                    break
-            except IOError as e:
-                if e.errno != errno.ENOENT:
-                    raise
-            time.sleep(0.1)
-            elapsed += 0.1
-        if port is None:
-            # try one last time, allowing all exceptions to propagate
-            with open(ep_filename, "rt") as f:
-                port = int(f.read().strip())
-
-        ep_filename.unlink()
-        self.logger.debug(
-            "BROWSER %i: Connecting to extension on port %i"
-            % (self.browser_params.browser_id, port)
-        )
-        extension_socket = ClientSocket(serialization="json")
-        extension_socket.connect("127.0.0.1", int(port))
-
-        success_filename = browser_profile_path / "OPENWPM_STARTUP_SUCCESS.txt"
-        startup_successful = False
-        while elapsed < 10:
-            if success_filename.exists():
-                startup_successful = True
-                break
-            time.sleep(0.1)
-            elapsed += 0.1
-
-        if not startup_successful:
+        try:
+            startup = startup_socket.queue.get(timeout=EXTENSION_STARTUP_TIMEOUT)
+        except EmptyQueue:
             self.logger.error(
                 "BROWSER %i: Failed to complete extension startup in time",
                 self.browser_params.browser_id,
             )
             raise BrowserConfigError("The extension did not boot up in time")
-        success_filename.unlink()
+        finally:
+            startup_socket.close()
+
+        port = int(startup["port"])
+        self.logger.debug(
+            "BROWSER %i: Connecting to extension on port %i"
+            % (self.browser_params.browser_id, port)
+        )
+        extension_socket = ExtensionSocket(startup_socket.queue)
+        extension_socket.connect("127.0.0.1", port)
         return extension_socket
 
     def run(self) -> None:
@@ -731,15 +985,23 @@ class BrowserManager(Process):
         display = None
 
         try:
+            # The extension connects to this socket once it has started up
+            startup_socket = ServerSocket(
+                name="ExtensionStartup-%i" % self.browser_params.browser_id
+            )
+            startup_socket.start_accepting()
+
             # Start Xvfb (if necessary), webdriver, and browser
             driver, browser_profile_path, display = deploy_firefox.deploy_firefox(
                 self.status_queue,
                 self.browser_params,
                 self.manager_params,
                 self.crash_recovery,
+                startup_socket.sock.getsockname(),
+                self.geckodriver,
             )
 
-            extension_socket = self._start_extension(browser_profile_path)
+            extension_socket = self._start_extension(startup_socket)
 
             self.logger.debug(
                 "BROWSER %i: BrowserManager ready." % self.browser_params.browser_id
@@ -750,14 +1012,12 @@ class BrowserManager(Process):
             self.browser_params.profile_path = browser_profile_path
 
             assert extension_socket is not None
+            # return values of the commands of the current visit,
+            # used to evaluate the run_if/skip_if predicates
+            visit_results: CommandResults = dict()
             # starts accepting arguments until told to die
             while True:
-                # no command for now -> sleep to avoid pegging CPU on blocking get
-                if self.command_queue.empty():
-                    time.sleep(0.001)
-                    continue
-
-                command: Union[ShutdownSignal, BaseCommand] = self.command_queue.get()
+                command = self._next_command()
 
                 if isinstance(command, ShutdownSignal):
                     driver.quit()
@@ -765,6 +1025,27 @@ class BrowserManager(Process):
                     return
 
                 assert isinstance(command, BaseCommand)
+                if isinstance(command, InitializeCommand):
+                    visit_results = dict()
+
+                try:
+                    should_run = command.should_run(visit_results)
+                except Exception:
+                    self.logger.error(
+                        "BROWSER %i: Error evaluating the predicates of %s"
+                        % (self.browser_params.browser_id, str(command)),
+                        exc_info=True,
+                    )
+                    self.status_queue.put(("FAILED", pickle.dumps(sys.exc_info())))
+                    continue
+                if not should_run:
+                    self.logger.info(
+                        "BROWSER %i: SKIPPING COMMAND: %s"
+                        % (self.browser_params.browser_id, str(command))
+                    )
+                    self.status_queue.put("SKIPPED")
+                    continue
+
                 self.logger.info(
                     "BROWSER %i: EXECUTING COMMAND: %s"
                     % (self.browser_params.browser_id, str(command))
@@ -774,13 +1055,18 @@ class BrowserManager(Process):
                 # if command fails for whatever reason, tell the TaskManager to
                 # kill and restart its worker processes
                 try:
-                    command.execute(
+                    result = command.execute(
                         driver,
                         self.browser_params,
                         self.manager_params,
                         extension_socket,
                     )
-                    self.status_queue.put("OK")
+                    visit_results[command.name] = result
+                    # Only ship the result back if the command produced one
+                    if result is None:
+                        self.status_queue.put("OK")
+                    else:
+                        self.status_queue.put(("OK", result))
                 except WebDriverException:
                     # We handle WebDriverExceptions separately here because they
                     # are quite common, and we often still have a handle to the
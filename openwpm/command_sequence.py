@@ -1,3 +1,4 @@
+from concurrent.futures import Future
 from pathlib import Path
 from typing import Callable, List, Optional, Tuple
 
@@ -12,8 +13,9 @@ from .commands.browser_commands import (
     ScreenshotFullPageCommand,
 )
 from .commands.profile_commands import DumpProfileCommand
-from .commands.types import BaseCommand
+from .commands.types import BaseCommand, CommandResults, Predicate
 from .errors import CommandExecutionError
+from .types import BrowserId, VisitId
 
 
 class CommandSequence:
@@ -73,6 +75,13 @@ class CommandSequence:
         self.contains_get_or_browse = False
         self.site_rank = site_rank
         self.callback = callback
+        self.future: "Optional[Future[bool]]" = None
+        """Set by `TaskManager.submit` and resolved alongside the callback"""
+        self.visit_id: Optional[VisitId] = None
+        """Assigned once the CommandSequence is handed to a browser"""
+        self.browser_id: Optional[BrowserId] = None
+        self.results: CommandResults = dict()
+        """The values returned by the commands, keyed by command name"""
 
     def get(self, sleep=0, timeout=60):
         """goes to a url"""
@@ -184,12 +193,49 @@ class CommandSequence:
         command = RecursiveDumpPageSourceCommand(suffix)
         self._commands_with_timeout.append((command, timeout))
 
-    def append_command(self, command: BaseCommand, timeout: int = 30) -> None:
+    def append_command(
+        self,
+        command: BaseCommand,
+        timeout: int = 30,
+        run_if: Optional[Predicate] = None,
+        skip_if: Optional[Predicate] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        """Appends a custom command to the sequence
+
+        `run_if` and `skip_if` are evaluated in the browser process right
+        before the command would run. They get passed a dict mapping the name
+        of every previous command of this visit to its return value
+        (commands that failed or were skipped are missing) and decide whether
+        the command runs or gets recorded as `skipped` in `crawl_history`.
+        A command's name is its class name unless `name` is given, e.g.
+
+        .. code-block:: Python
+
+            sequence.append_command(GetPrebids())
+            sequence.append_command(
+                AdSearch(),
+                run_if=lambda results: results.get("GetPrebids", {}).get("bids", 0) > 0,
+            )
+
+        See `openwpm.commands.prebid` for predicates like this one.
+
+        As the predicates are sent to the browser process they need to be
+        picklable with dill.
+        """
+        if run_if is not None:
+            command.run_if = run_if
+        if skip_if is not None:
+            command.skip_if = skip_if
+        if name is not None:
+            command.result_name = name
         self._commands_with_timeout.append((command, timeout))
 
     def mark_done(self, success: bool) -> None:
         if self.callback is not None:
             self.callback(success)
+        if self.future is not None and not self.future.done():
+            self.future.set_result(success)
 
     def get_commands_with_timeout(self) -> List[Tuple[BaseCommand, int]]:
         """Returns a list of all commands in the command_sequence
@@ -9,27 +9,126 @@ Steps to have a custom command run as part of a CommandSequence
 
 """
 
+import hashlib
+import io
 import logging
+import time
+from typing import Any, Dict, List, Optional
 
+from PIL import Image
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver import Firefox
 from selenium.webdriver.common.by import By
 
+from openwpm.commands.prebid import PREBID_GLOBAL_SCRIPT, wait_for_prebid
 from openwpm.commands.types import BaseCommand
-from openwpm.config import BrowserParams, ManagerParams
+from openwpm.config import BrowserParams, ManagerParamsInternal
 from openwpm.socket_interface import ClientSocket
-import time
+from openwpm.storage.storage_controller import DataSocket
+
+SLOT_RECTS_SCRIPT = """const ids = arguments[0];
+const scrollX = window.scrollX;
+const scrollY = window.scrollY;
+return {
+  device_pixel_ratio: window.devicePixelRatio || 1,
+  slots: ids.map(id => {
+    const el = document.getElementById(id);
+    if (!el) return { id: id, found: false };
+    const rect = el.getBoundingClientRect();
+    return {
+      id: id,
+      found: true,
+      x: rect.left + scrollX,
+      y: rect.top + scrollY,
+      width: rect.width,
+      height: rect.height,
+      has_iframe: el.querySelector("iframe") !== null,
+    };
+  }),
+};"""
+
+# Prebid's loader stub defines its global before the library is loaded
+BID_RESPONSES_SCRIPT = (
+    PREBID_GLOBAL_SCRIPT
+    + """const pbjs = prebidGlobal();
+if (!pbjs || typeof pbjs.getBidResponses !== "function") return {};
+return pbjs.getBidResponses();"""
+)
+
+LANDING_HREF_SCRIPT = """const link = document.querySelector("a[href]");
+return link ? link.href : null;"""
+
+
+def crop_slot(
+    page: Image.Image, slot: Dict[str, Any], device_pixel_ratio: float = 1
+) -> Optional[Image.Image]:
+    """Cut the area of `slot` out of a full page screenshot
+
+    `slot` holds the document coordinates returned by `SLOT_RECTS_SCRIPT`.
+    Returns None if the slot doesn't cover any visible part of the page.
+    """
+    left = max(0, int(slot["x"] * device_pixel_ratio))
+    top = max(0, int(slot["y"] * device_pixel_ratio))
+    right = min(page.width, int((slot["x"] + slot["width"]) * device_pixel_ratio))
+    bottom = min(page.height, int((slot["y"] + slot["height"]) * device_pixel_ratio))
+    if right <= left or bottom <= top:
+        return None
+    return page.crop((left, top, right, bottom))
+
+
+def store_creative(sock: DataSocket, png: bytes) -> str:
+    """Store a PNG encoded creative keyed by its SHA-256 hash
+
+    Returns the hash, which is also the name of the blob in the
+    UnstructuredStorageProvider. Identical creatives are only stored once.
+    """
+    content_hash = hashlib.sha256(png).hexdigest()
+    sock.store_content(png, content_hash)
+    return content_hash
 
 
 class AdSearch(BaseCommand):
-    """This command logs how many links it found on any given page"""
+    """This command clicks on and screenshots every Prebid ad slot on the page
 
-    def __init__(self) -> None:
+    It waits at most `deadline` seconds for the auctions on the page
+    to settle, see `wait_for_prebid` for the supported `wait_mode`s.
+    Pages without Prebid are detected up front and the command returns
+    right away without failing.
+
+    In `batch` mode all slots are located with a single script call and
+    cropped out of a single full page screenshot. Click-throughs are only
+    done for slots that rendered a creative with a landing page we haven't
+    visited yet, and happen in a new tab so the page is never reloaded.
+    Without `batch` every slot is clicked in place and the page is
+    reloaded afterwards.
+
+    Creatives are cropped to their slot and stored through the
+    UnstructuredStorageProvider under the SHA-256 hash of the PNG, so make
+    sure to pass one to the TaskManager. The mapping from slot ID to hash is
+    part of the command's result in `crawl_history`.
+    """
+
+    def __init__(
+        self,
+        deadline: float = 20,
+        wait_mode: str = "auction",
+        batch: bool = True,
+        click_through: bool = True,
+        click_through_sleep: float = 2,
+    ) -> None:
+        self.deadline = deadline
+        self.wait_mode = wait_mode
+        self.batch = batch
+        self.click_through = click_through
+        self.click_through_sleep = click_through_sleep
         self.logger = logging.getLogger("openwpm")
 
     # While this is not strictly necessary, we use the repr of a command for logging
     # So not having a proper repr will make your logs a lot less useful
     def __repr__(self) -> str:
-        return "AdSearchCommand"
+        return "AdSearchCommand({},{},{},{})".format(
+            self.deadline, self.wait_mode, self.batch, self.click_through
+        )
 
     # Have a look at openwpm.commands.types.BaseCommand.execute to see
     # an explanation of each parameter
@@ -37,31 +136,147 @@ class AdSearch(BaseCommand):
         self,
         webdriver: Firefox,
         browser_params: BrowserParams,
-        manager_params: ManagerParams,
+        manager_params: ManagerParamsInternal,
         extension_socket: ClientSocket,
-    ) -> None:
+    ) -> Dict[str, Any]:
         current_url = webdriver.current_url
         # let PBJS populate its bid responses
-        time.sleep(20)
+        readiness = wait_for_prebid(webdriver, self.deadline, self.wait_mode)
+        self.logger.info(
+            "Waited %d ms for Prebid on %s (%s)",
+            readiness["wait_time"],
+            current_url,
+            readiness["state"],
+        )
+        if readiness["state"] == "absent":
+            self.logger.info("No pbjs found on %s, ending execution.", current_url)
+            return readiness
 
         # grab all adslot keys from PBJS
-        adslot_ids = webdriver.execute_script(
-            "const resp = pbjs.getBidResponses(); return resp"
-        )
+        adslot_ids = webdriver.execute_script(BID_RESPONSES_SCRIPT)
 
         # convert dict of bid responses to a list of slot IDs
         adslot_ids = list(adslot_ids.keys())
         self.logger.info("Ad slot IDs: %s", adslot_ids)
-        
+
         # exit early if no adslot ids found
         if not adslot_ids:
             self.logger.info("No ad slot IDs found, ending execution.")
-            return
+            return readiness
         self.logger.info("found: %s", adslot_ids)
 
+        assert manager_params.storage_controller_address is not None
+        sock = DataSocket(
+            manager_params.storage_controller_address, f"AdSearch-{self.browser_id}"
+        )
+        try:
+            if self.batch:
+                readiness.update(self._capture_slots(webdriver, sock, adslot_ids))
+            else:
+                readiness.update(
+                    self._capture_slots_with_reload(
+                        webdriver, sock, adslot_ids, current_url
+                    )
+                )
+        finally:
+            sock.close()
+        return readiness
+
+    def _capture_slots(
+        self,
+        webdriver: Firefox,
+        sock: DataSocket,
+        adslot_ids: List[str],
+    ) -> Dict[str, Any]:
+        """Capture all slots from one full page screenshot without reloading"""
+        layout = webdriver.execute_script(SLOT_RECTS_SCRIPT, adslot_ids)
+        device_pixel_ratio = layout["device_pixel_ratio"]
+        page = Image.open(io.BytesIO(webdriver.get_full_page_screenshot_as_png()))
+
+        creatives: Dict[str, str] = dict()
+        for slot in layout["slots"]:
+            slot_id = slot["id"]
+            if not slot["found"]:
+                self.logger.warning("Could not find container for slot %s", slot_id)
+                continue
+            creative = crop_slot(page, slot, device_pixel_ratio)
+            if creative is None:
+                self.logger.info("Slot %s isn't visible on the page", slot_id)
+                continue
+            png = io.BytesIO()
+            creative.save(png, format="PNG")
+            creatives[slot_id] = store_creative(sock, png.getvalue())
+            self.logger.info(
+                "Stored creative %s for slot %s", creatives[slot_id], slot_id
+            )
+
+        landing_pages: Dict[str, str] = dict()
+        if self.click_through:
+            visited = set()
+            for slot in layout["slots"]:
+                if not slot["found"] or not slot["has_iframe"]:
+                    continue
+                landing_page = self._click_through_in_new_tab(
+                    webdriver, slot["id"], visited
+                )
+                if landing_page is not None:
+                    landing_pages[slot["id"]] = landing_page
+
+        return {"creatives": creatives, "landing_pages": landing_pages}
+
+    def _click_through_in_new_tab(
+        self, webdriver: Firefox, slot_id: str, visited: set
+    ) -> Optional[str]:
+        """Open the landing page of the creative in `slot_id` in a new tab
+
+        Returns the URL the landing page ended up on, or None if the slot
+        has no landing page or it was already visited during this command.
+        """
+        try:
+            slot_div = webdriver.find_element(By.ID, slot_id)
+            iframe = slot_div.find_element(By.TAG_NAME, "iframe")
+            webdriver.switch_to.frame(iframe)
+            try:
+                href = webdriver.execute_script(LANDING_HREF_SCRIPT)
+            finally:
+                webdriver.switch_to.default_content()
+        except WebDriverException as e:
+            self.logger.warning("Could not inspect slot %s: %s", slot_id, e)
+            return None
+
+        if not href or href in visited:
+            return None
+        visited.add(href)
+
+        main_handle = webdriver.current_window_handle
+        webdriver.switch_to.new_window("tab")
+        try:
+            try:
+                webdriver.get(href)
+            except TimeoutException:
+                pass
+            time.sleep(self.click_through_sleep)
+            landing_page = webdriver.current_url
+            self.logger.info("Slot %s leads to %s", slot_id, landing_page)
+            return landing_page
+        except WebDriverException as e:
+            self.logger.warning("Could not click through slot %s: %s", slot_id, e)
+            return None
+        finally:
+            webdriver.close()
+            webdriver.switch_to.window(main_handle)
+
+    def _capture_slots_with_reload(
+        self,
+        webdriver: Firefox,
+        sock: DataSocket,
+        adslot_ids: List[str],
+        current_url: str,
+    ) -> Dict[str, Any]:
+        """Screenshot and click every slot in place, reloading the page after each"""
+        creatives: Dict[str, str] = dict()
         for slot_id in adslot_ids:
             try:
-                # find the div by id and click it
                 # find the ad slot container
                 slot_div = webdriver.find_element(By.ID, slot_id)
 
@@ -69,7 +284,14 @@ class AdSearch(BaseCommand):
                 iframe = slot_div.find_element(By.TAG_NAME, "iframe")
 
                 webdriver.execute_script("arguments[0].scrollIntoView(true);", iframe)
-                
+
+                # screenshot just the slot container before clicking it
+                # might navigate us away from the page
+                creatives[slot_id] = store_creative(sock, slot_div.screenshot_as_png)
+                self.logger.info(
+                    "Stored creative %s for slot %s", creatives[slot_id], slot_id
+                )
+
                 # switch into the iframe context and click inside it
                 webdriver.switch_to.frame(iframe)
                 body = webdriver.find_element(By.TAG_NAME, "body")
@@ -79,14 +301,6 @@ class AdSearch(BaseCommand):
                 # switch back to the main document
                 webdriver.switch_to.default_content()
 
-                # take a screenshot of the full page (or crop externally if needed)
-                screenshot_name = f"screenshot_{slot_id}.png"
-                pages_dir = manager_params.data_directory / "ads"
-                pages_dir.mkdir(parents=True, exist_ok=True)
-                screenshot_path = pages_dir / screenshot_name
-                webdriver.save_screenshot(str(screenshot_path))
-                self.logger.info("Saved screenshot %s for slot %s", screenshot_name, slot_id)
-
             except Exception as e:
                 self.logger.warning("Could not process slot %s: %s", slot_id, e)
 
@@ -94,5 +308,5 @@ class AdSearch(BaseCommand):
                 # return to the original URL before the next iteration
                 webdriver.get(current_url)
                 time.sleep(2)
-        
-        
+
+        return {"creatives": creatives}
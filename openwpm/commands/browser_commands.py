@@ -8,6 +8,7 @@ import time
 import traceback
 from glob import glob
 from hashlib import md5
+from queue import Empty as EmptyQueue
 
 from PIL import Image
 from selenium.common.exceptions import (
@@ -36,6 +37,8 @@ from .utils.webdriver_utils import (
 NUM_MOUSE_MOVES = 10  # Times to randomly move the mouse
 RANDOM_SLEEP_LOW = 1  # low (in sec) for random sleep between page loads
 RANDOM_SLEEP_HIGH = 7  # high (in sec) for random sleep between page loads
+# Time the extension gets to confirm a Finalize on top of its drain timeout
+FINALIZE_REPLY_MARGIN = 1  # seconds
 logger = logging.getLogger("openwpm")
 
 
@@ -465,6 +468,12 @@ class FinalizeCommand(BaseCommand):
 
     It's apperance means there won't be any more commands for this
     visit_id
+
+    The extension finalizes the visit once the requests that are still in
+    flight are done and its instruments stopped saving data, but at most
+    `sleep` seconds later. Until then all data is attributed to this visit,
+    so the command waits for the extension to confirm before the next visit
+    is initialized.
     """
 
     def __init__(self, sleep):
@@ -482,11 +491,25 @@ class FinalizeCommand(BaseCommand):
     ):
         """Informs the extension that a visit is done"""
         tab_restart_browser(webdriver)
-        # This doesn't immediately stop data saving from the current
-        # visit so we sleep briefly before unsetting the visit_id.
-        time.sleep(self.sleep)
-        msg = {"action": "Finalize", "visit_id": self.visit_id}
+        msg = {
+            "action": "Finalize",
+            "visit_id": self.visit_id,
+            "drain_timeout": self.sleep,
+        }
         extension_socket.send(msg)
+        deadline = time.time() + self.sleep + FINALIZE_REPLY_MARGIN
+        while True:
+            try:
+                reply = extension_socket.receive(max(0, deadline - time.time()))
+            except EmptyQueue:
+                logger.warning(
+                    "BROWSER %i: The extension didn't confirm finalizing visit %i"
+                    % (self.browser_id, self.visit_id)
+                )
+                return
+            # Replies to earlier Finalize commands may arrive late
+            if reply == {"action": "Finalized", "visit_id": self.visit_id}:
+                return
 
 
 class InitializeCommand(BaseCommand):
@@ -3,49 +3,268 @@
 
 import logging
 import time
+from typing import Any, Dict, List
 
 from selenium.webdriver import Firefox
 from selenium.webdriver.common.by import By
 
-from openwpm.commands.types import BaseCommand
-from openwpm.config import BrowserParams, ManagerParams
+from openwpm.commands.types import BaseCommand, CommandResults
+from openwpm.config import BrowserParams, ManagerParamsInternal
 from openwpm.socket_interface import ClientSocket
+from openwpm.storage.storage_controller import DataSocket
+from openwpm.storage.storage_providers import TableName
 
-script = """const resp = pbjs.getBidResponses();
-const pairs = Object
-  .values(resp)  // Parse the values out                          
-  .flatMap(unit =>  // map for iterating through each value, creating a keypair for bidder + bid value (if they exist)
-    unit.bids.map(bid => [
-      bid.adapterCode || bid.bidderCode,   
-      bid.adserverTargeting?.hb_pb          
-    ])
+WAIT_MODES = ["auction", "sleep"]
+"""How the Prebid commands wait for bids before reading them:
+    * 'auction' returns as soon as the auctions on the page have settled,
+      or the deadline has passed
+    * 'sleep' always sleeps for the full deadline
+"""
+PREBID_POLL_INTERVAL = 0.25  # seconds between checks of pbjs.getBidResponses()
+SCRIPT_TIMEOUT_MARGIN = 5  # seconds the webdriver waits past the deadline
+
+# Defines prebidGlobal(), which returns the Prebid global of the page.
+# Sites can rename it from window.pbjs, Prebid lists the names it is
+# available under in window._pbjsGlobals. Prepended to the scripts below.
+PREBID_GLOBAL_SCRIPT = """function prebidGlobal() {
+  for (const name of (window._pbjsGlobals || []).concat(["pbjs"])) {
+    if (window[name]) return window[name];
+  }
+  return null;
+}
+"""
+
+# Globals set by the loaders of common header bidding libraries,
+# even before the libraries themselves have finished loading
+HEADER_BIDDING_PROBE_SCRIPT = (
+    PREBID_GLOBAL_SCRIPT
+    + """const libraries = [];
+if (prebidGlobal() || (window._pbjsGlobals || []).length > 0) libraries.push("prebid");
+if (window.apstag) libraries.push("amazon");
+if (window.headertag) libraries.push("index_exchange");
+if (window.PWT) libraries.push("openwrap");
+return libraries;"""
+)
+
+READINESS_SCRIPT = (
+    PREBID_GLOBAL_SCRIPT
+    + """const deadline = arguments[0] * 1000;
+const pollInterval = arguments[1] * 1000;
+const done = arguments[arguments.length - 1];
+const start = performance.now();
+let finished = false;
+let hooked = null;
+
+function finish(state) {
+  if (finished) return;
+  finished = true;
+  // Don't leave our listeners behind on the page
+  if (hooked && typeof hooked.offEvent === "function") {
+    hooked.offEvent("auctionEnd", onSettled);
+    hooked.offEvent("bidWon", onSettled);
+  }
+  done({ state: state, wait_time: Math.round(performance.now() - start) });
+}
+
+function onSettled() {
+  finish("settled");
+}
+
+function hasBidResponses(pbjs) {
+  try {
+    return Object.keys(pbjs.getBidResponses() || {}).length > 0;
+  } catch (e) {
+    return false;
+  }
+}
+
+function check() {
+  if (finished) return;
+  const pbjs = prebidGlobal();
+  if (pbjs && typeof pbjs.getBidResponses === "function") {
+    if (!hooked && typeof pbjs.onEvent === "function") {
+      hooked = pbjs;
+      pbjs.onEvent("auctionEnd", onSettled);
+      pbjs.onEvent("bidWon", onSettled);
+    }
+    // The auction might have ended before we got to hook into it
+    if (hasBidResponses(pbjs)) {
+      finish("settled");
+      return;
+    }
+  }
+  if (performance.now() - start >= deadline) {
+    finish(pbjs ? "timeout" : "absent");
+    return;
+  }
+  setTimeout(check, pollInterval);
+}
+check();"""
+)
+
+script = (
+    PREBID_GLOBAL_SCRIPT
+    + """const pbjs = prebidGlobal();
+if (!pbjs || typeof pbjs.getBidResponses !== "function") return [];
+const resp = pbjs.getBidResponses();
+const bids = Object
+  .entries(resp)  // Parse the ad unit codes and values out
+  .flatMap(([code, unit]) =>  // one row per bid, holding the columns of prebid_bids
+    unit.bids.map(bid => ({
+      ad_unit_code: bid.adUnitCode || code,
+      bidder: bid.adapterCode || bid.bidderCode,
+      cpm: bid.cpm,
+      currency: bid.currency,
+      size: bid.size || (bid.width && bid.height ? bid.width + "x" + bid.height : null),
+      time_to_respond: bid.timeToRespond,
+      hb_pb: bid.adserverTargeting?.hb_pb
+    }))
   );
-return pairs;"""
+return bids;"""
+)
+
+
+def detect_header_bidding(webdriver: Firefox) -> List[str]:
+    """Return the header bidding libraries loaded on the current page
+
+    This is a single synchronous script call, so it is cheap enough to run
+    before anything that would otherwise wait for auctions that never happen.
+    """
+    return webdriver.execute_script(HEADER_BIDDING_PROBE_SCRIPT)
+
+
+def wait_for_prebid(
+    webdriver: Firefox, deadline: float, wait_mode: str = "auction"
+) -> Dict[str, Any]:
+    """Wait until the Prebid auctions on the current page have settled
+
+    In 'auction' mode this hooks into `pbjs.onEvent('auctionEnd'/'bidWon')`
+    and polls `pbjs.getBidResponses()` from an async script, returning as
+    soon as either reports bids or `deadline` seconds have passed.
+    In 'sleep' mode it simply sleeps for `deadline` seconds.
+
+    Returns a dict with the observed `wait_time` (in milliseconds) and the
+    `state` the page was in once we stopped waiting, which is one of
+    'settled', 'timeout' (pbjs present but no bids) or 'absent' (no pbjs).
+    'sleep' mode doesn't inspect the page and reports 'slept'.
+
+    Pages that don't load Prebid at all are detected up front with
+    `detect_header_bidding` and reported as 'absent' without waiting.
+    """
+    if wait_mode not in WAIT_MODES:
+        raise ValueError(
+            "Unsupported wait_mode %s, supported values are %s"
+            % (wait_mode, WAIT_MODES)
+        )
+    if "prebid" not in detect_header_bidding(webdriver):
+        return {"state": "absent", "wait_time": 0}
+    if wait_mode == "sleep":
+        time.sleep(deadline)
+        return {"state": "slept", "wait_time": int(deadline * 1000)}
+
+    previous_timeout = webdriver.timeouts.script
+    webdriver.set_script_timeout(deadline + SCRIPT_TIMEOUT_MARGIN)
+    try:
+        return webdriver.execute_async_script(
+            READINESS_SCRIPT, deadline, PREBID_POLL_INTERVAL
+        )
+    finally:
+        webdriver.set_script_timeout(previous_timeout)
+
+
+def prebid_detected(results: CommandResults) -> bool:
+    """`run_if` predicate for commands that need Prebid on the page
+
+    Looks at the result of a preceding `DetectHeaderBidding` command.
+    """
+    return "prebid" in results.get("DetectHeaderBidding", {}).get("libraries", [])
+
+
+def bids_found(results: CommandResults) -> bool:
+    """`run_if` predicate for commands that need a preceding `GetPrebids`
+    to have collected at least one bid"""
+    return results.get("GetPrebids", {}).get("bids", 0) > 0
+
+
+class DetectHeaderBidding(BaseCommand):
+    """Probe the current page for header bidding libraries
+
+    The command result in `crawl_history` lists the detected libraries, see
+    `HEADER_BIDDING_PROBE_SCRIPT`. An empty list means that `GetPrebids`
+    and `AdSearch` have nothing to collect on this page.
+    """
+
+    def __init__(self) -> None:
+        self.logger = logging.getLogger("openwpm")
+
+    def __repr__(self) -> str:
+        return "DetectHeaderBidding()"
+
+    def execute(
+        self,
+        webdriver: Firefox,
+        browser_params: BrowserParams,
+        manager_params: ManagerParamsInternal,
+        extension_socket: ClientSocket,
+    ) -> Dict[str, Any]:
+        libraries = detect_header_bidding(webdriver)
+        self.logger.info(
+            "Header bidding libraries on %s: %s", webdriver.current_url, libraries
+        )
+        return {"libraries": libraries}
+
 
 class GetPrebids(BaseCommand):
     """
-    Runs the given JS snippet and stores its return value
-    into the OpenWPM SQLite under extension_messages.
+    Collects all bids from `pbjs.getBidResponses()` and stores them
+    in the `prebid_bids` table.
+    All bids of a visit are sent to the StorageController in a single message.
+
+    The command waits at most `deadline` seconds for the auctions on the
+    page to settle, see `wait_for_prebid` for the supported `wait_mode`s.
     """
-    def __init__(self):
-        super().__init__()          
+
+    def __init__(self, deadline: float = 15, wait_mode: str = "auction") -> None:
+        super().__init__()
         self.script = script
+        self.deadline = deadline
+        self.wait_mode = wait_mode
         self.logger = logging.getLogger("openwpm")
 
     def __repr__(self):
-        return f"GetPrebids({self.script!r})"
+        return f"GetPrebids({self.deadline!r},{self.wait_mode!r})"
 
     def execute(
         self,
         webdriver: Firefox,
         browser_params: BrowserParams,
-        manager_params: ManagerParams,
+        manager_params: ManagerParamsInternal,
         extension_socket: ClientSocket,
-    ) -> None:
+    ) -> Dict[str, Any]:
         current_url = webdriver.current_url
 
-        time.sleep(15) # delay webdriver from pre-render
-        result = webdriver.execute_script(self.script)  
-        self.logger.info("The bids: %s links on %s", result, current_url)
+        readiness = wait_for_prebid(webdriver, self.deadline, self.wait_mode)
+        self.logger.info(
+            "Waited %d ms for Prebid on %s (%s)",
+            readiness["wait_time"],
+            current_url,
+            readiness["state"],
+        )
+        if readiness["state"] == "absent":
+            return readiness
 
+        bids = webdriver.execute_script(self.script)
+        for bid in bids:
+            bid["browser_id"] = self.browser_id
 
+        if bids:
+            assert manager_params.storage_controller_address is not None
+            sock = DataSocket(
+                manager_params.storage_controller_address,
+                f"GetPrebids-{self.browser_id}",
+            )
+            sock.store_records(TableName("prebid_bids"), self.visit_id, bids)
+            sock.close()
+        self.logger.info("Stored %d bids for %s", len(bids), current_url)
+        readiness["bids"] = len(bids)
+        return readiness
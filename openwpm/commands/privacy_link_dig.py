@@ -1,98 +1,327 @@
-import os
-import time
 import logging
-import urllib.parse
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_for_futures
+from typing import Dict, List, Optional, Tuple
 
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver import Firefox
-from selenium.webdriver.common.by import By
 
 from openwpm.commands.types import BaseCommand
-from openwpm.config import BrowserParams, ManagerParams
+from openwpm.config import BrowserParams, ManagerParamsInternal
 from openwpm.socket_interface import ClientSocket
-from bs4 import BeautifulSoup
-import html2text
+from openwpm.storage.policy_index import PolicyEntry, PolicyIndex, normalize_url
+from openwpm.storage.storage_controller import DataSocket
+
+# All target phrases, lowercase
+TARGET_PHRASES = [
+    "dnsmpi",
+    "privacy policy",
+    "do not sell my information",
+    "do not sell my info",
+    "do not sell my personal info",
+    "do not sell or share my personal information",
+    "do not sell or share my information",
+    "do not sell or share my info",
+    "do not sell or share my personal info",
+]
+
+# Collects [href, text] of every <a> whose visible text contains one of
+# the phrases passed as the first argument, in a single round trip
+MATCHING_LINKS_SCRIPT = """const phrases = arguments[0];
+const page = document.URL.split("#")[0];
+const seen = new Set();
+const matches = [];
+for (const link of document.querySelectorAll("a[href]")) {
+  const href = link.href;
+  if (!href || seen.has(href)) continue;
+  // Skip javascript:, mailto: and similar links, which don't load a page,
+  // and links to the page we are already on
+  if (link.protocol !== "http:" && link.protocol !== "https:") continue;
+  if (href.split("#")[0] === page) continue;
+  const text = (link.innerText || "").trim().toLowerCase();
+  if (phrases.some(phrase => text.includes(phrase))) {
+    seen.add(href);
+    matches.push([href, text]);
+  }
+}
+return matches;"""
+
+TAB_LOADED_SCRIPT = """return document.readyState === "complete"
+  && document.URL !== "about:blank";"""
+
+# Reads the ETag and Last-Modified validators of the loaded page from the
+# browser's cache, without sending another request
+PAGE_VALIDATORS_SCRIPT = """const done = arguments[arguments.length - 1];
+const timer = setTimeout(() => done([null, null]), arguments[0]);
+fetch(document.URL, { cache: "only-if-cached", mode: "same-origin" })
+  .then((r) => done([r.headers.get("ETag"), r.headers.get("Last-Modified")]))
+  .catch(() => done([null, null]))
+  .finally(() => clearTimeout(timer));"""
+PAGE_VALIDATORS_TIMEOUT = 1000  # ms
+
+KNOWN_POLICY_MODES = ["revalidate", "skip", "refetch"]
+"""What DNSMPISearch does with policies that are already in the PolicyIndex:
+    * 'revalidate' sends a conditional HEAD request with the stored
+      ETag/Last-Modified and only loads the policy if it changed
+    * 'skip' never loads them again
+    * 'refetch' always loads them again
+"""
+REVALIDATION_DEADLINE = 5  # seconds for all revalidations of a page
+MAX_CONCURRENT_REVALIDATIONS = 8
+
+# Whether a policy is unchanged, and the ETag and Last-Modified the server sent
+Revalidation = Tuple[bool, Optional[str], Optional[str]]
+# ETag and Last-Modified of a policy
+Validators = Tuple[Optional[str], Optional[str]]
+
+
+def revalidate(
+    url: str,
+    entry: PolicyEntry,
+    timeout: float = REVALIDATION_DEADLINE,
+    user_agent: Optional[str] = None,
+) -> Revalidation:
+    """Check with a HEAD request whether `url` changed since `entry` was indexed
+
+    Returns whether the policy is unchanged, together with the ETag and
+    Last-Modified validators the server sent.
+    Any error counts as changed, so the policy gets loaded in the browser.
+    """
+    request = urllib.request.Request(url, method="HEAD")
+    if user_agent is not None:
+        request.add_header("User-Agent", user_agent)
+    if entry.etag:
+        request.add_header("If-None-Match", entry.etag)
+    if entry.last_modified:
+        request.add_header("If-Modified-Since", entry.last_modified)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return True, entry.etag, entry.last_modified
+        return False, None, None
+    except Exception:
+        return False, None, None
+    # Some servers ignore conditional HEAD requests but still send validators
+    unchanged = (etag is not None and etag == entry.etag) or (
+        last_modified is not None and last_modified == entry.last_modified
+    )
+    return unchanged, etag, last_modified
+
+
+def revalidate_all(
+    entries: Dict[str, PolicyEntry],
+    user_agent: Optional[str] = None,
+    deadline: float = REVALIDATION_DEADLINE,
+) -> Dict[str, Revalidation]:
+    """Revalidate the indexed policies in `entries` concurrently
+
+    Policies that couldn't be revalidated within `deadline` seconds count
+    as changed.
+    """
+    if not entries:
+        return dict()
+    executor = ThreadPoolExecutor(
+        max_workers=min(len(entries), MAX_CONCURRENT_REVALIDATIONS),
+        thread_name_prefix="OpenWPM-revalidate",
+    )
+    futures = {
+        url: executor.submit(revalidate, url, entry, deadline, user_agent)
+        for url, entry in entries.items()
+    }
+    done, _ = wait_for_futures(futures.values(), timeout=deadline)
+    # The requests that are still running end on their own timeout
+    executor.shutdown(wait=False, cancel_futures=True)
+    return {
+        url: future.result() if future in done else (False, None, None)
+        for url, future in futures.items()
+    }
 
 
 class DNSMPISearch(BaseCommand):
     """Find <a> tags by VISIBLE TEXT (DNSMPI / Privacy Policy / Do-Not-Sell phrases),
-       then for each href: re-find it, click, save HTML, and return."""
+    then load every matching href in background tabs and save its content
+    as Markdown.
 
-    def __init__(self) -> None:
+    The conversion to Markdown happens in the StorageController's
+    post-processing pool (see `ManagerParams.post_processing_workers`) and
+    the result is stored through the UnstructuredStorageProvider as
+    `<sha256 of the Markdown>.md`, so make sure to pass one to the TaskManager.
+    Policies are tracked by normalized URL in the PolicyIndex at
+    `ManagerParams.policy_index_path`, which decides together with
+    `known_policies` (see `KNOWN_POLICY_MODES`) whether an already indexed
+    policy is loaded again. New Markdown is only written if its text changed.
+
+    At most `max_tabs` pages are loaded at the same time and every page
+    gets `page_timeout` seconds to finish loading.
+    The tab the site was loaded in is never navigated away.
+    """
+
+    def __init__(
+        self,
+        max_tabs: int = 4,
+        page_timeout: float = 30,
+        known_policies: str = "revalidate",
+    ) -> None:
+        if known_policies not in KNOWN_POLICY_MODES:
+            raise ValueError(
+                "Unsupported known_policies %s, supported values are %s"
+                % (known_policies, KNOWN_POLICY_MODES)
+            )
+        self.max_tabs = max_tabs
+        self.page_timeout = page_timeout
+        self.known_policies = known_policies
         self.logger = logging.getLogger("openwpm")
 
     def __repr__(self) -> str:
-        return "DNSMPISearch"
+        return "DNSMPISearch({},{},{})".format(
+            self.max_tabs, self.page_timeout, self.known_policies
+        )
 
     def execute(
         self,
         webdriver: Firefox,
         browser_params: BrowserParams,
-        manager_params: ManagerParams,
+        manager_params: ManagerParamsInternal,
         extension_socket: ClientSocket,
-    ) -> None:
+    ) -> Dict[str, List[str]]:
         original_url = webdriver.current_url
         self.logger.info("Scanning %s for qualifying <a> text", original_url)
 
-        # 1. All target phrases, lowercase
-        target_phrases = [
-            "dnsmpi",
-            "privacy policy",
-            "do not sell my information",
-            "do not sell my info",
-            "do not sell my personal info",
-            "do not sell or share my personal information",
-            "do not sell or share my information",
-            "do not sell or share my info",
-            "do not sell or share my personal info",
-        ]
-
-        # 2. First, collect hrefs of any <a> whose VISIBLE text contains a target phrase
-        hrefs_to_click = []
-        all_links = webdriver.find_elements(By.TAG_NAME, "a")
-        hrefs_to_click = [
-            link.get_attribute("href")
-            for link in all_links
-            if link.get_attribute("href") and any(
-                phrase in ((link.text or "").strip().lower())
-                for phrase in target_phrases
+        matches: List[Tuple[str, str]] = webdriver.execute_script(
+            MATCHING_LINKS_SCRIPT, TARGET_PHRASES
+        )
+        hrefs = list({normalize_url(href): href for href, _ in matches}.values())
+        self.logger.info("hrefs: %s", hrefs)
+
+        assert manager_params.policy_index_path is not None
+        policy_index = PolicyIndex(manager_params.policy_index_path, read_only=True)
+        try:
+            validators, unchanged = self._select_policies(
+                webdriver, hrefs, policy_index
             )
-        ]
-        
-        self.logger.info("hrefs: %s", hrefs_to_click)
-
-        for url in hrefs_to_click:
-            try:
-                webdriver.get(url)
-                time.sleep(2)
-
-                print("HELLO?")
-                page_html = webdriver.page_source
-
-                # parse the page HTML
-
-                soup = BeautifulSoup(page_html, "html.parser")
-                body = soup.body or soup
-
-                # convert to Markdown
-                converter = html2text.HTML2Text()
-                converter.ignore_images = True
-                converter.ignore_links = True
-                markdown = converter.handle(str(body))
-
-                # construct a filename based on the URL
-                parsed = urllib.parse.urlparse(url)
-                safe_netloc = parsed.netloc.replace(".", "_")
-                filename_only = f"{safe_netloc}.md"
-
-                # Use manager_params.data_directory to construct the output path
-                pages_dir = manager_params.data_directory / "pages"
-                os.makedirs(pages_dir, exist_ok=True)
-                path = pages_dir / filename_only
-
-                # write Markdown to disk
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(markdown)
-                self.logger.info("Converted page %s to Markdown at %s", url, path)
-            except Exception as e:
-                self.logger.error("Error processing %s: %s", url, e)
+        finally:
+            policy_index.close()
+        hrefs_to_visit = list(validators.keys())
+        result: Dict[str, List[str]] = {"loaded": [], "unchanged": unchanged}
+        if not hrefs_to_visit:
+            return result
+
+        assert manager_params.storage_controller_address is not None
+        sock = DataSocket(
+            manager_params.storage_controller_address,
+            f"DNSMPISearch-{self.browser_id}",
+        )
+        try:
+            for i in range(0, len(hrefs_to_visit), self.max_tabs):
+                pages = self._load_in_tabs(
+                    webdriver, hrefs_to_visit[i : i + self.max_tabs]
+                )
+                for url, (page_html, page_validators) in pages.items():
+                    # Prefer the validators of the response the browser got
+                    etag, last_modified = (
+                        page_validators if any(page_validators) else validators[url]
+                    )
+                    sock.store_markdown(
+                        self.visit_id, url, page_html, etag, last_modified
+                    )
+                    result["loaded"].append(url)
+                    self.logger.info("Sent page %s for conversion", url)
+        finally:
+            sock.close()
+        return result
+
+    def _select_policies(
+        self, webdriver: Firefox, hrefs: List[str], policy_index: PolicyIndex
+    ) -> Tuple[Dict[str, Validators], List[str]]:
+        """Decide which of `hrefs` need to be loaded in the browser
+
+        Returns the hrefs to load, mapped to the ETag and Last-Modified
+        validators a revalidation found for them, and the hrefs that are
+        left out because they didn't change.
+        """
+        validators: Dict[str, Validators] = dict()
+        unchanged: List[str] = []
+        known: Dict[str, PolicyEntry] = dict()
+        for href in hrefs:
+            entry = (
+                policy_index.lookup(href) if self.known_policies != "refetch" else None
+            )
+            if entry is None:
+                # Nothing to revalidate against
+                validators[href] = (None, None)
+            elif self.known_policies == "skip":
+                unchanged.append(href)
+            else:
+                known[href] = entry
+        if not known:
+            return validators, unchanged
+
+        user_agent = webdriver.execute_script("return navigator.userAgent;")
+        for href, (is_unchanged, etag, last_modified) in revalidate_all(
+            known, user_agent
+        ).items():
+            if is_unchanged:
+                self.logger.info("Skipping unchanged policy %s", href)
+                unchanged.append(href)
+            else:
+                validators[href] = (etag, last_modified)
+        return validators, unchanged
+
+    def _load_in_tabs(
+        self, webdriver: Firefox, urls: List[str]
+    ) -> Dict[str, Tuple[str, Validators]]:
+        """Load all `urls` concurrently, each in its own new tab
+
+        Returns the page source of every url that could be loaded, together
+        with the ETag and Last-Modified of its response if the browser
+        cached it.
+        All tabs are closed and the original tab is focused again afterwards.
+        """
+        main_handle = webdriver.current_window_handle
+        tabs: Dict[str, str] = dict()
+        pages: Dict[str, Tuple[str, Validators]] = dict()
+        try:
+            # Start all navigations without waiting for any of them to finish
+            for url in urls:
+                webdriver.switch_to.new_window("tab")
+                tabs[webdriver.current_window_handle] = url
+                webdriver.execute_script("window.location.href = arguments[0];", url)
 
+            deadline = time.time() + self.page_timeout
+            for handle, url in tabs.items():
+                try:
+                    webdriver.switch_to.window(handle)
+                    while time.time() < deadline:
+                        try:
+                            if webdriver.execute_script(TAB_LOADED_SCRIPT):
+                                break
+                        except WebDriverException:
+                            # The tab is still navigating, e.g. "Document
+                            # was unloaded", so it isn't loaded yet
+                            pass
+                        time.sleep(0.25)
+                    else:
+                        self.logger.info("Timed out loading %s", url)
+                        continue
+                    page_html = webdriver.page_source
+                    etag, last_modified = webdriver.execute_async_script(
+                        PAGE_VALIDATORS_SCRIPT, PAGE_VALIDATORS_TIMEOUT
+                    )
+                    pages[url] = (page_html, (etag, last_modified))
+                except WebDriverException as e:
+                    self.logger.error("Error loading %s: %s", url, e)
+        finally:
+            for handle in tabs:
+                try:
+                    webdriver.switch_to.window(handle)
+                    webdriver.close()
+                except WebDriverException:
+                    pass
+            webdriver.switch_to.window(main_handle)
+        return pages
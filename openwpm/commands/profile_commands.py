@@ -8,6 +8,7 @@ from openwpm.config import BrowserParamsInternal, ManagerParamsInternal
 
 from ..errors import ProfileLoadError
 from ..socket_interface import ClientSocket
+from ..utilities.profile_snapshot import ProfileSnapshot
 from .types import BaseCommand
 from .utils.firefox_profile import sleep_until_sqlite_checkpoint
 
@@ -111,9 +112,19 @@ def load_profile(
     """
     Loads a zipped cookie-based profile stored at <tar_path> and unzips
     it to <browser_profile_path>. The tar will remain unmodified.
+    <tar_path> can also be the directory of a ProfileSnapshot, whose state
+    files are then copied to <browser_profile_path>.
     """
     assert browser_params.browser_id is not None
     try:
+        if tar_path.is_dir():
+            restored = ProfileSnapshot.restore(tar_path, browser_profile_path)
+            logger.debug(
+                "BROWSER %i: Restored %d files from profile snapshot"
+                % (browser_params.browser_id, restored)
+            )
+            return
+
         assert tar_path.is_file()
         # Untar the loaded profile
         if tar_path.name.endswith("tar.gz"):
@@ -1,10 +1,16 @@
 from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional
 
 from selenium.webdriver import Firefox
 
 from ..config import BrowserParamsInternal, ManagerParamsInternal
 from ..socket_interface import ClientSocket
 
+CommandResults = Dict[str, Any]
+"""The results of the commands that already ran during the current visit,
+keyed by `BaseCommand.name`"""
+Predicate = Callable[[CommandResults], bool]
+
 
 class BaseCommand(ABC):
     """
@@ -15,6 +21,25 @@ class BaseCommand(ABC):
     all commands that are already implemented
     """
 
+    result_name: Optional[str] = None
+    run_if: Optional[Predicate] = None
+    skip_if: Optional[Predicate] = None
+
+    @property
+    def name(self) -> str:
+        """The key under which the result of this command is available
+        to the predicates of later commands in the same visit"""
+        return self.result_name or type(self).__name__
+
+    def should_run(self, results: CommandResults) -> bool:
+        """Evaluates the `run_if` and `skip_if` predicates
+        against the results of the previous commands of this visit"""
+        if self.run_if is not None and not self.run_if(results):
+            return False
+        if self.skip_if is not None and self.skip_if(results):
+            return False
+        return True
+
     def set_visit_browser_id(self, visit_id, browser_id):
         self.visit_id = visit_id
         self.browser_id = browser_id
@@ -29,7 +54,7 @@ class BaseCommand(ABC):
         browser_params: BrowserParamsInternal,
         manager_params: ManagerParamsInternal,
         extension_socket: ClientSocket,
-    ) -> None:
+    ) -> Any:
         """This method gets called in the Browser process
 
         :parameter webdriver: WebDriver is a Selenium class used to control
@@ -42,6 +67,12 @@ class BaseCommand(ABC):
 
             TODO: Further document this once the StorageProvider PR has landed
             This allows you to send data to be persisted to storage.
+
+        Any value other than `None` returned by this method is sent back to
+        the TaskManager and saved as JSON in the `result` column of
+        `crawl_history`, so it needs to be picklable.
+        Later commands in the same visit can also base their `run_if` and
+        `skip_if` predicates on it, see `CommandSequence.append_command`.
         """
         pass
 
@@ -1,3 +1,4 @@
+import importlib.util
 import tempfile
 from dataclasses import dataclass, field
 from json import JSONEncoder
@@ -139,6 +140,34 @@ class BrowserParams(DataClassJsonMixin):
 
     """
 
+    use_profile_template: bool = False
+    """
+    Start new browsers from a clone of an already initialized profile instead
+    of an empty one, skipping the work Firefox does on its first start.
+
+    The template is built once in tmp_profile_dir by the first browser that
+    launches, and rebuilt whenever the preferences, the Firefox binary or the
+    extension change. Clones share the template's blocks on file systems that
+    support reflinks. Not used when the profile is loaded from a seed_tar or
+    from a recovery_tar holding a whole profile.
+    """
+
+    incremental_recovery: bool = False
+    """
+    When a browser crashes, only carry its cookies, history and site storage
+    over to the new browser, instead of archiving and restoring its whole
+    profile.
+
+    The state files are kept in a snapshot in tmp_profile_dir, which is
+    updated with just the files that changed on every further crash.
+    """
+
+    compress_recovery_snapshots: bool = False
+    """
+    Compress the snapshots used by incremental_recovery with zstd.
+    Requires the zstandard package.
+    """
+
     recovery_tar: Optional[Path] = None
     donottrack: bool = False
     tracking_protection: bool = False
@@ -179,6 +208,62 @@ class ManagerParams(DataClassJsonMixin):
     """
 
     num_browsers: int = 1
+    launch_concurrency: int = 4
+    """Maximum number of browsers the TaskManager launches at the same time
+    during startup. Launching is CPU heavy, so launching all browsers at once
+    on a small machine slows down every launch"""
+    post_processing_workers: int = 2
+    """The number of processes the StorageController uses to post-process
+    data before storing it, e.g. converting page sources to Markdown for
+    `DNSMPISearch`"""
+    storage_high_watermark: int = 10000
+    """Number of unfinished records in the StorageController at which the
+    TaskManager stops handing out CommandSequences. Submission resumes once
+    the backlog has dropped to `storage_low_watermark`"""
+    storage_low_watermark: int = 5000
+    storage_memory_high_watermark: Optional[int] = None
+    """Like `storage_high_watermark` but for the memory usage of the
+    StorageController in MB. Not enforced by default"""
+    storage_memory_low_watermark: Optional[int] = None
+    """Defaults to `storage_memory_high_watermark`"""
+    submission_queue_size: int = 100
+    """Maximum number of CommandSequences passed to `TaskManager.submit`
+    that wait to be dispatched. Further calls to `submit` block"""
+    adaptive_timeouts: bool = False
+    """Learn the timeout of every command from how long it took before.
+    Once a command has run often enough, its timeout becomes the
+    `adaptive_timeout_percentile` of its recent durations plus
+    `adaptive_timeout_margin` seconds, capped at the timeout it was given.
+    Commands are told apart by their name (see
+    `CommandSequence.append_command`), and the time they `sleep` is added
+    on top of what was learned"""
+    adaptive_timeout_percentile: float = 99.0
+    adaptive_timeout_margin: float = 10.0
+    adaptive_timeouts_per_domain: bool = False
+    """Additionally learn the timeouts per eTLD+1, for crawls that visit
+    each site many times"""
+    max_visits_per_domain: Optional[int] = None
+    """Maximum number of CommandSequences visiting the same eTLD+1 at the
+    same time, so a site list with many entries of one domain doesn't get
+    the crawl rate limited. Unlimited by default"""
+    num_standby_browsers: int = 0
+    """Number of spare browsers that are launched ahead of time, spread over
+    the browser slots. A browser that restarts with a clean profile swaps in
+    its spare instead of launching a new browser, and a new spare is launched
+    in the background. Restarts that recover a crashed profile can't use them"""
+    reuse_geckodriver: bool = False
+    """Keep one geckodriver per browser running across browser restarts and
+    start each new browser as a new session of it, instead of starting a new
+    geckodriver for every browser. A geckodriver whose browser crashed is
+    replaced"""
+    policy_index_path: Optional[Path] = field(
+        default=None,
+        metadata=DCJConfig(encoder=path_to_str, decoder=str_to_path),
+    )
+    """The SQLite database in which `DNSMPISearch` keeps track of the privacy
+    policies it has stored. Reuse it across crawls to skip or revalidate
+    policies that were already collected. Defaults to
+    `data_directory/policy_index.sqlite`"""
     _failure_limit: Optional[int] = None
     """The number of command failures the platform will tolerate before raising a
         `CommandExecutionError` exception. Otherwise the default is set to 2 x the
@@ -290,6 +375,15 @@ def validate_browser_params(browser_params: BrowserParams) -> None:
             "Please check values provided for BrowserParams are of expected types"
         )
 
+    if (
+        browser_params.compress_recovery_snapshots
+        and importlib.util.find_spec("zstandard") is None
+    ):
+        raise ConfigError(
+            "compress_recovery_snapshots requires the zstandard package, "
+            "install it with `pip install zstandard`"
+        )
+
 
 def validate_manager_params(manager_params: ManagerParams) -> None:
     if ManagerParams() == manager_params:
@@ -314,6 +408,59 @@ def validate_manager_params(manager_params: ManagerParams) -> None:
             )
         )
 
+    if not 0 < manager_params.adaptive_timeout_percentile <= 100:
+        raise ConfigError(
+            "adaptive_timeout_percentile must be in (0, 100], got %s"
+            % manager_params.adaptive_timeout_percentile
+        )
+    if manager_params.adaptive_timeout_margin < 0:
+        raise ConfigError(
+            "adaptive_timeout_margin must not be negative, got %s"
+            % manager_params.adaptive_timeout_margin
+        )
+    if manager_params.launch_concurrency < 1:
+        raise ConfigError(
+            "launch_concurrency must be at least 1, got %d"
+            % manager_params.launch_concurrency
+        )
+    if (
+        manager_params.max_visits_per_domain is not None
+        and manager_params.max_visits_per_domain < 1
+    ):
+        raise ConfigError(
+            "max_visits_per_domain must be at least 1, got %d"
+            % manager_params.max_visits_per_domain
+        )
+    if manager_params.num_standby_browsers < 0:
+        raise ConfigError(
+            "num_standby_browsers must not be negative, got %d"
+            % manager_params.num_standby_browsers
+        )
+
+    if manager_params.storage_low_watermark > manager_params.storage_high_watermark:
+        raise ConfigError(
+            "storage_low_watermark (%d) must not be above "
+            "storage_high_watermark (%d)"
+            % (
+                manager_params.storage_low_watermark,
+                manager_params.storage_high_watermark,
+            )
+        )
+    if (
+        manager_params.storage_memory_low_watermark is not None
+        and manager_params.storage_memory_high_watermark is not None
+        and manager_params.storage_memory_low_watermark
+        > manager_params.storage_memory_high_watermark
+    ):
+        raise ConfigError(
+            "storage_memory_low_watermark (%d) must not be above "
+            "storage_memory_high_watermark (%d)"
+            % (
+                manager_params.storage_memory_low_watermark,
+                manager_params.storage_memory_high_watermark,
+            )
+        )
+
     # This check is necessary to not cause any internal error
     if not isinstance(manager_params.failure_limit, int):
         raise ConfigError(
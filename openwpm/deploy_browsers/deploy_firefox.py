@@ -1,7 +1,6 @@
 import json
 import logging
 import os.path
-import subprocess
 import tempfile
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple
@@ -15,9 +14,10 @@ from selenium.webdriver.firefox.service import Service
 
 from ..commands.profile_commands import load_profile
 from ..config import BrowserParamsInternal, ConfigEncoder, ManagerParamsInternal
-from ..utilities.platform_utils import get_firefox_binary_path
+from ..utilities.platform_utils import get_firefox_binary_path, get_geckodriver_path
 from . import configure_firefox
-from .selenium_firefox import FirefoxLogInterceptor
+from .profile_template import TEMPLATES_DIR_NAME, clone_profile_template
+from .selenium_firefox import AttachedService, FirefoxLogInterceptor
 
 DEFAULT_SCREEN_RES = (1366, 768)
 logger = logging.getLogger("openwpm")
@@ -28,9 +28,15 @@ def deploy_firefox(
     browser_params: BrowserParamsInternal,
     manager_params: ManagerParamsInternal,
     crash_recovery: bool,
+    extension_startup_address: Optional[Tuple[str, int]] = None,
+    geckodriver: Optional[Tuple[int, int]] = None,
 ) -> Tuple[webdriver.Firefox, Path, Optional[Display]]:
     """
     launches a firefox instance with parameters set by the input dictionary
+
+    The extension reports its startup to `extension_startup_address`.
+    `geckodriver` is the port and pid of an already running geckodriver that
+    should start the browser. Otherwise a new geckodriver is started.
     """
     firefox_binary_path = get_firefox_binary_path()
 
@@ -52,7 +58,48 @@ def deploy_firefox(
     fo.add_argument("-profile")
     fo.add_argument(str(browser_profile_path))
     assert browser_params.browser_id is not None
-    if browser_params.seed_tar and not crash_recovery:
+
+    # TODO restore detailed logging
+    # fo.set_preference("extensions.@openwpm.sdk.console.logLevel", "all")
+
+    # Configure privacy settings
+    configure_firefox.privacy(browser_params, fo)
+
+    # Set various prefs to improve speed and eliminate traffic to Mozilla
+    configure_firefox.optimize_prefs(fo)
+
+    # Set custom prefs. These are set after all of the default prefs to allow
+    # our defaults to be overwritten.
+    for name, value in browser_params.prefs.items():
+        logger.info(
+            "BROWSER %i: Setting custom preference: %s = %s"
+            % (browser_params.browser_id, name, value)
+        )
+        fo.set_preference(name, value)
+
+    geckodriver_path = get_geckodriver_path()
+    ext_loc = os.path.join(root_dir, "../../Extension/openwpm.xpi")
+    ext_loc = os.path.normpath(ext_loc)
+
+    load_seed = browser_params.seed_tar is not None and not crash_recovery
+    recovery_tar = browser_params.recovery_tar
+    if (
+        browser_params.use_profile_template
+        and not load_seed
+        and (recovery_tar is None or recovery_tar.is_dir())
+    ):
+        # A profile snapshot only holds the browsing state, so it is
+        # restored on top of the template
+        logger.debug("BROWSER %i: Cloning profile template" % browser_params.browser_id)
+        clone_profile_template(
+            browser_profile_path,
+            browser_params.tmp_profile_dir / TEMPLATES_DIR_NAME,
+            fo,
+            firefox_binary_path,
+            geckodriver_path,
+            ext_loc,
+        )
+    if load_seed:
         logger.info(
             "BROWSER %i: Loading initial browser profile from: %s"
             % (browser_params.browser_id, browser_params.seed_tar)
@@ -62,15 +109,15 @@ def deploy_firefox(
             browser_params,
             browser_params.seed_tar,
         )
-    elif browser_params.recovery_tar:
+    elif recovery_tar:
         logger.debug(
             "BROWSER %i: Loading recovered browser profile from: %s"
-            % (browser_params.browser_id, browser_params.recovery_tar)
+            % (browser_params.browser_id, recovery_tar)
         )
         load_profile(
             browser_profile_path,
             browser_params,
-            browser_params.recovery_tar,
+            recovery_tar,
         )
     status_queue.put(("STATUS", "Profile Tar", None))
 
@@ -106,6 +153,7 @@ def deploy_firefox(
         manager_params.storage_controller_address
     )
     extension_config["testing"] = manager_params.testing
+    extension_config["startup_address"] = extension_startup_address
     ext_config_file = browser_profile_path / "browser_params.json"
     with open(ext_config_file, "w") as f:
         json.dump(extension_config, f, cls=ConfigEncoder)
@@ -114,47 +162,30 @@ def deploy_firefox(
         % (browser_params.browser_id, ext_config_file)
     )
 
-    # TODO restore detailed logging
-    # fo.set_preference("extensions.@openwpm.sdk.console.logLevel", "all")
-
-    # Configure privacy settings
-    configure_firefox.privacy(browser_params, fo)
-
-    # Set various prefs to improve speed and eliminate traffic to Mozilla
-    configure_firefox.optimize_prefs(fo)
-
-    # Intercept logging at the Selenium level and redirect it to the
-    # main logger.
-    webdriver_interceptor = FirefoxLogInterceptor(browser_params.browser_id)
-    webdriver_interceptor.start()
-
-    # Set custom prefs. These are set after all of the default prefs to allow
-    # our defaults to be overwritten.
-    for name, value in browser_params.prefs.items():
-        logger.info(
-            "BROWSER %i: Setting custom preference: %s = %s"
-            % (browser_params.browser_id, name, value)
-        )
-        fo.set_preference(name, value)
-
     # Launch the webdriver
     status_queue.put(("STATUS", "Launch Attempted", None))
 
     fo.binary_location = firefox_binary_path
-    geckodriver_path = subprocess.check_output(
-        "which geckodriver", encoding="utf-8", shell=True
-    ).strip()
-    driver = webdriver.Firefox(
-        options=fo,
-        service=Service(
+    service: Service
+    if geckodriver is not None:
+        geckodriver_port, pid = geckodriver
+        if display_port is not None:
+            # The geckodriver doesn't run on the virtual display of this
+            # BrowserManager, so neither would the Firefox it starts
+            fo.add_argument("--display=:{}".format(display_port))
+        service = AttachedService(geckodriver_path, geckodriver_port)
+    else:
+        # Intercept logging at the Selenium level and redirect it to the
+        # main logger.
+        webdriver_interceptor = FirefoxLogInterceptor(browser_params.browser_id)
+        webdriver_interceptor.start()
+        service = Service(
             executable_path=geckodriver_path,
             log_output=open(webdriver_interceptor.fifo, "w"),
-        ),
-    )
+        )
+    driver = webdriver.Firefox(options=fo, service=service)
 
     # Install extension
-    ext_loc = os.path.join(root_dir, "../../Extension/openwpm.xpi")
-    ext_loc = os.path.normpath(ext_loc)
     driver.install_addon(ext_loc, temporary=True)
     logger.debug(
         "BROWSER %i: OpenWPM Firefox extension loaded" % browser_params.browser_id
@@ -164,10 +195,11 @@ def deploy_firefox(
     driver.set_window_size(*DEFAULT_SCREEN_RES)
 
     # Get browser process pid
-    if hasattr(driver, "service") and hasattr(driver.service, "process"):
-        pid = driver.service.process.pid
-    else:
-        raise RuntimeError("Unable to identify Firefox process ID.")
+    if geckodriver is None:
+        if hasattr(driver, "service") and hasattr(driver.service, "process"):
+            pid = driver.service.process.pid
+        else:
+            raise RuntimeError("Unable to identify Firefox process ID.")
 
     status_queue.put(("STATUS", "Browser Launched", int(pid)))
 
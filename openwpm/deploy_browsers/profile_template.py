@@ -0,0 +1,139 @@
+"""Fully initialized Firefox profiles that new browser profiles are cloned from
+
+On its first start in an empty profile Firefox creates its databases,
+certificate store, search engine configuration and so on, which makes up a
+large part of a browser's launch time. With `BrowserParams.use_profile_template`
+this is done once in a template profile, which every later launch with the
+same Firefox binary, preferences and extension clones instead of starting
+from an empty profile.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from selenium import webdriver
+from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.firefox.service import Service
+
+logger = logging.getLogger("openwpm")
+
+TEMPLATES_DIR_NAME = "openwpm_profile_templates"
+# Files Firefox uses to lock a profile that is in use
+LOCK_FILES = ("lock", ".parentlock", "parent.lock")
+# ioctl request number of FICLONE on Linux, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+
+def template_key(
+    preferences: Dict[str, Any], firefox_binary_path: str, extension_path: str
+) -> str:
+    """Identifies the template for the given launch configuration
+
+    Changing any of the preferences, the Firefox binary or the extension
+    results in a different key, so an outdated template is never used.
+    """
+    binary_stat = os.stat(firefox_binary_path)
+    with open(extension_path, "rb") as f:
+        extension_digest = hashlib.sha256(f.read()).hexdigest()
+    config = {
+        "preferences": preferences,
+        "firefox_binary": [
+            os.path.abspath(firefox_binary_path),
+            binary_stat.st_size,
+            binary_stat.st_mtime_ns,
+        ],
+        "extension": extension_digest,
+    }
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def _clone_file(src: str, dst: str) -> None:
+    """Copies src to dst, sharing its blocks if the file system supports
+    reflinks (e.g. btrfs or XFS)"""
+    try:
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    except OSError:
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+def _build_template(
+    template_path: Path,
+    fo: Options,
+    firefox_binary_path: str,
+    geckodriver_path: str,
+) -> None:
+    """Lets Firefox initialize an empty profile and moves it to
+    template_path once Firefox has quit"""
+    build_path = Path(
+        tempfile.mkdtemp(prefix=template_path.name + ".", dir=template_path.parent)
+    )
+    template_options = Options()
+    template_options.add_argument("-profile")
+    template_options.add_argument(str(build_path))
+    template_options.add_argument("--headless")
+    for name, value in fo.preferences.items():
+        template_options.set_preference(name, value)
+    template_options.binary_location = firefox_binary_path
+    try:
+        driver = webdriver.Firefox(
+            options=template_options,
+            service=Service(executable_path=geckodriver_path),
+        )
+        driver.quit()
+        for name in LOCK_FILES:
+            (build_path / name).unlink(missing_ok=True)
+        os.rename(build_path, template_path)
+    except BaseException:
+        shutil.rmtree(build_path, ignore_errors=True)
+        raise
+
+
+def clone_profile_template(
+    browser_profile_path: Path,
+    templates_dir: Path,
+    fo: Options,
+    firefox_binary_path: str,
+    geckodriver_path: str,
+    extension_path: str,
+) -> None:
+    """Fills the empty browser_profile_path with a clone of the template
+    profile matching the preferences in `fo`
+
+    The template is built first if it doesn't exist yet. Browsers that are
+    launched concurrently wait for the one building it.
+    """
+    key = template_key(fo.preferences, firefox_binary_path, extension_path)
+    template_path = templates_dir / key
+    templates_dir.mkdir(parents=True, exist_ok=True)
+    with open(templates_dir / (key + ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not template_path.is_dir():
+                start_time = time.time()
+                _build_template(
+                    template_path, fo, firefox_binary_path, geckodriver_path
+                )
+                logger.info(
+                    "Built profile template %s in %.1f seconds"
+                    % (template_path, time.time() - start_time)
+                )
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    shutil.copytree(
+        template_path,
+        browser_profile_path,
+        copy_function=_clone_file,
+        dirs_exist_ok=True,
+    )
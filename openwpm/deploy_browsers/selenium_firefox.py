@@ -3,14 +3,19 @@ Workarounds for Selenium headaches.
 """
 
 import errno
+import json
 import logging
 import os
 import tempfile
 import threading
+import urllib.request
+
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.firefox.service import Service
 
 from openwpm.types import BrowserId
 
-__all__ = ["FirefoxLogInterceptor"]
+__all__ = ["AttachedService", "FirefoxLogInterceptor"]
 
 
 def mktempfifo(suffix="", prefix="tmp", dir=None):
@@ -76,3 +81,41 @@ class FirefoxLogInterceptor(threading.Thread):
             if self.fifo is not None:
                 os.unlink(self.fifo)
                 self.fifo = None
+
+
+class AttachedService(Service):
+    """
+    Service for a geckodriver that is already running.
+
+    webdriver.Firefox starts its Service when it is created and stops it
+    when it quits. This Service leaves the geckodriver alone, so one
+    geckodriver can serve the sessions of consecutive browsers.
+    """
+
+    def __init__(self, executable_path: str, port: int) -> None:
+        super().__init__(executable_path=executable_path, port=port)
+
+    def ready(self) -> bool:
+        """Whether the geckodriver accepts a new session, which it only
+        does while it has none
+
+        Service.is_connectable only checks this in recent Selenium versions,
+        older ones merely connect to the port.
+        """
+        # Bypass any proxy configured in the environment
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        try:
+            with opener.open("http://localhost:%i/status" % self.port, timeout=1) as r:
+                status = json.load(r)
+        except (OSError, ValueError):
+            return False
+        return status.get("value", {}).get("ready") is True
+
+    def start(self) -> None:
+        if not self.ready():
+            raise WebDriverException(
+                "The geckodriver on port %i isn't ready for a new session" % self.port
+            )
+
+    def stop(self) -> None:
+        pass
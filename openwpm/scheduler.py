@@ -0,0 +1,150 @@
+import bisect
+import itertools
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import domain_utils as du
+
+from .command_sequence import CommandSequence
+
+# A CommandSequence passed to `TaskManager.submit`, the index of the browser
+# it should run on and the future to resolve once its data is saved
+Submission = Tuple[CommandSequence, Optional[int], "Future[bool]"]
+
+
+def site_domain(url: str) -> str:
+    """The eTLD+1 of `url`, which the per-domain limit applies to"""
+    return du.get_ps_plus_1(url) or url
+
+
+@dataclass(order=True)
+class _Entry:
+    rank: Tuple[int, int]
+    order: int
+    domain: str = field(compare=False)
+    pinned: bool = field(compare=False)
+    submission: Submission = field(compare=False)
+
+
+class SiteScheduler:
+    """Decides which submitted CommandSequence each browser runs next
+
+    Every browser has its own queue. Submissions pinned to a browser with an
+    `index` go into that browser's queue. All others go into the queue that
+    already holds submissions for the same eTLD+1, or else into the shortest
+    queue, so visits to one domain tend to stay on one browser.
+    A browser takes the best submission from its own queue and, once that
+    has nothing it may run, steals the best unpinned submission from the
+    longest other queue. A slow site therefore only holds up its own queue.
+
+    Submissions are ordered by `site_rank`, lowest first, and then by
+    submission order. Submissions whose eTLD+1 already has `max_per_domain`
+    visits running are passed over until one of those visits finishes.
+
+    The scheduler isn't thread-safe, the TaskManager only uses it while
+    holding its `_browser_ready` lock.
+    """
+
+    def __init__(self, num_browsers: int, max_per_domain: Optional[int]) -> None:
+        self.max_per_domain = max_per_domain
+        self.steals = 0
+        """How often a browser took a submission from another browser's queue"""
+        self._queues: List[List[_Entry]] = [[] for _ in range(num_browsers)]
+        self._home: Dict[str, int] = dict()
+        self._next_home = 0
+        self._queued: Dict[str, int] = defaultdict(int)
+        self._running: Dict[str, int] = defaultdict(int)
+        self._order = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues)
+
+    def put(self, submission: Submission) -> None:
+        command_sequence, index, _ = submission
+        domain = site_domain(command_sequence.url)
+        pinned = index is not None
+        if index is None:
+            home = self._home.get(domain)
+            if home is None:
+                # Spread new domains round-robin over equally long queues
+                num_queues = len(self._queues)
+                home = min(
+                    range(num_queues),
+                    key=lambda i: (
+                        len(self._queues[i]),
+                        (i - self._next_home) % num_queues,
+                    ),
+                )
+                self._next_home = (home + 1) % num_queues
+                self._home[domain] = home
+            index = home
+        site_rank = command_sequence.site_rank
+        entry = _Entry(
+            (0, site_rank) if site_rank is not None else (1, 0),
+            next(self._order),
+            domain,
+            pinned,
+            submission,
+        )
+        bisect.insort(self._queues[index], entry)
+        self._queued[domain] += 1
+
+    def can_run(self, url: str) -> bool:
+        """Whether a visit to `url` wouldn't exceed the per-domain limit"""
+        return self._can_run(site_domain(url))
+
+    def _can_run(self, domain: str) -> bool:
+        return (
+            self.max_per_domain is None
+            or self._running.get(domain, 0) < self.max_per_domain
+        )
+
+    def started(self, url: str) -> None:
+        self._running[site_domain(url)] += 1
+
+    def finished(self, url: str) -> None:
+        domain = site_domain(url)
+        self._running[domain] -= 1
+        if not self._running[domain]:
+            del self._running[domain]
+
+    def _pop(self, index: int, steal: bool) -> Optional[Submission]:
+        queue = self._queues[index]
+        for position, entry in enumerate(queue):
+            if (steal and entry.pinned) or not self._can_run(entry.domain):
+                continue
+            del queue[position]
+            self._queued[entry.domain] -= 1
+            if not self._queued[entry.domain]:
+                del self._queued[entry.domain]
+                self._home.pop(entry.domain, None)
+            return entry.submission
+        return None
+
+    def take(self, index: int) -> Optional[Submission]:
+        """Remove and return the submission browser `index` should run next"""
+        submission = self._pop(index, steal=False)
+        if submission is not None:
+            return submission
+        victims = sorted(
+            (i for i in range(len(self._queues)) if i != index),
+            key=lambda i: len(self._queues[i]),
+            reverse=True,
+        )
+        for victim in victims:
+            submission = self._pop(victim, steal=True)
+            if submission is not None:
+                self.steals += 1
+                return submission
+        return None
+
+    def clear(self) -> List[Submission]:
+        """Remove and return all queued submissions"""
+        submissions = [entry.submission for queue in self._queues for entry in queue]
+        for queue in self._queues:
+            queue.clear()
+        self._home.clear()
+        self._queued.clear()
+        return submissions
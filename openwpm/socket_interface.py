@@ -163,6 +163,22 @@ class ClientSocket:
         self.sock.close()
 
 
+class ExtensionSocket(ClientSocket):
+    """A ClientSocket to the extension, which also passes on the replies
+    the extension sends back through `replies`"""
+
+    def __init__(self, replies: Queue, verbose=False):
+        super().__init__(serialization="json", verbose=verbose)
+        self.replies = replies
+
+    def receive(self, timeout: float) -> Any:
+        """Returns the next reply of the extension
+
+        Raises queue.Empty if there was none within `timeout` seconds.
+        """
+        return self.replies.get(timeout=timeout)
+
+
 async def get_message_from_reader(reader: asyncio.StreamReader) -> Any:
     """Reads a message from the StreamReader
     To safely use this method, you should guard against the exception
@@ -0,0 +1,155 @@
+import copy
+import logging
+import threading
+from typing import Dict, List, Optional, Set
+
+from .browser_manager import BrowserManagerHandle
+from .types import BrowserId
+
+
+class StandbyPool:
+    """Spare BrowserManagers that are launched ahead of time
+
+    Launching a browser takes several seconds, during which its slot can't
+    run any CommandSequence. The pool keeps `size` spare BrowserManagers
+    running, spread round-robin over the browser slots. When a slot restarts
+    with a clean profile it takes over one of its spares instead of
+    launching a new browser, and a replacement spare is launched in the
+    background.
+
+    Spares are launched with the BrowserParams and browser_id of their slot,
+    so a swapped in browser records exactly the same data as a browser
+    launched by a regular restart.
+    """
+
+    def __init__(self, browsers: List[BrowserManagerHandle], size: int) -> None:
+        self.logger = logging.getLogger("openwpm")
+        self.closing = False
+        self.swaps = 0
+        """Restarts that were served by a spare"""
+        self.misses = 0
+        """Restarts that had to launch a browser because no spare was ready"""
+        self._lock = threading.Lock()
+        self._slots: Dict[BrowserId, BrowserManagerHandle] = {
+            browser.browser_id: browser for browser in browsers
+        }
+        self._targets: Dict[BrowserId, int] = {
+            browser.browser_id: 0 for browser in browsers
+        }
+        for i in range(size if browsers else 0):
+            self._targets[browsers[i % len(browsers)].browser_id] += 1
+        self._standbys: Dict[BrowserId, List[BrowserManagerHandle]] = {
+            browser_id: [] for browser_id in self._slots
+        }
+        self._launching: List[BrowserManagerHandle] = []
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """Launch the initial spares in the background"""
+        for browser_id, target in self._targets.items():
+            for _ in range(target):
+                self._in_background(
+                    self._launch_standby, browser_id, "standby-%i" % browser_id
+                )
+
+    def _in_background(self, target, arg, name: str) -> None:
+        thread = threading.Thread(target=target, args=(arg,))
+        thread.daemon = True
+        thread.name = "OpenWPM-" + name
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            self._threads.append(thread)
+        thread.start()
+
+    def _launch_standby(self, browser_id: BrowserId) -> None:
+        slot = self._slots[browser_id]
+        browser_params = copy.deepcopy(slot.browser_params)
+        browser_params.recovery_tar = None
+        standby = BrowserManagerHandle(slot.manager_params, browser_params)
+        with self._lock:
+            if self.closing:
+                return
+            self._launching.append(standby)
+        try:
+            success = standby.launch_browser_manager()
+        except Exception:
+            self.logger.exception(
+                "BROWSER %i: Failed to launch a standby browser" % browser_id
+            )
+            success = False
+        with self._lock:
+            self._launching.remove(standby)
+            if success and not self.closing:
+                self._standbys[browser_id].append(standby)
+                self.logger.debug("BROWSER %i: Standby browser is ready" % browser_id)
+                return
+        if not success:
+            self.logger.error(
+                "BROWSER %i: Couldn't launch a standby browser, restarts of "
+                "this browser will launch a new one instead" % browser_id
+            )
+        standby.shutdown_browser(during_init=True)
+
+    def take(self, browser_id: BrowserId) -> Optional[BrowserManagerHandle]:
+        """Hand out a ready spare for slot `browser_id`, if there is one
+
+        A replacement is launched in the background right away.
+        """
+        with self._lock:
+            if self.closing or not self._targets.get(browser_id):
+                return None
+            standbys = self._standbys[browser_id]
+            if not standbys:
+                self.misses += 1
+                return None
+            standby = standbys.pop(0)
+            self.swaps += 1
+        self._in_background(self._launch_standby, browser_id, "standby-%i" % browser_id)
+        return standby
+
+    def available(self, browser_id: BrowserId) -> int:
+        """Number of spares that are ready for slot `browser_id`"""
+        with self._lock:
+            return len(self._standbys[browser_id])
+
+    def retire(self, browser: BrowserManagerHandle) -> None:
+        """Close a swapped out BrowserManager and delete its profile in
+        the background"""
+        self._in_background(self._retire, browser, "retire-%i" % browser.browser_id)
+
+    def _retire(self, browser: BrowserManagerHandle) -> None:
+        browser.shutdown_browser(during_init=True)
+
+    def pids(self) -> Set[int]:
+        """The geckodriver and display pids of all spares"""
+        pids: Set[int] = set()
+        with self._lock:
+            standbys = self._launching + [
+                standby for slot in self._standbys.values() for standby in slot
+            ]
+        for standby in standbys:
+            if standby.geckodriver_pid is not None:
+                pids.add(standby.geckodriver_pid)
+            if standby.display_pid is not None:
+                pids.add(standby.display_pid)
+        return pids
+
+    def shutdown(self) -> None:
+        """Close all spares, including those that are still launching"""
+        with self._lock:
+            self.closing = True
+            standbys = [standby for slot in self._standbys.values() for standby in slot]
+            for slot in self._standbys.values():
+                slot.clear()
+            threads = list(self._threads)
+        for standby in standbys:
+            standby.shutdown_browser(during_init=True)
+        # Spares that finish launching now shut themselves down
+        for thread in threads:
+            thread.join()
+        if self.swaps or self.misses:
+            self.logger.info(
+                "Standby browsers served %d of %d restarts",
+                self.swaps,
+                self.swaps + self.misses,
+            )
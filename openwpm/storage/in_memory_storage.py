@@ -132,10 +132,11 @@ class MemoryUnstructuredProvider(UnstructuredStorageProvider):
         self,
         filename: str,
         blob: bytes,
+        overwrite: bool = False,
         compressed: bool = True,
         skip_if_exists: bool = True,
     ) -> None:
-        if skip_if_exists and filename in self.storage:
+        if skip_if_exists and not overwrite and filename in self.storage:
             return
         if compressed:
             bytesIO = self._compress(blob)
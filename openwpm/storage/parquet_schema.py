@@ -49,6 +49,7 @@ fields = [
     pa.field("error", pa.string()),
     pa.field("traceback", pa.string()),
     pa.field("duration", pa.int64()),
+    pa.field("result", pa.string()),
 ]
 PQ_SCHEMAS["crawl_history"] = pa.schema(fields)
 
@@ -244,3 +245,18 @@ fields = [
     pa.field("instance_id", pa.uint32(), nullable=False),
 ]
 PQ_SCHEMAS["dns_responses"] = pa.schema(fields)
+
+# prebid_bids
+fields = [
+    pa.field("browser_id", pa.uint32(), nullable=False),
+    pa.field("visit_id", pa.int64(), nullable=False),
+    pa.field("instance_id", pa.uint32(), nullable=False),
+    pa.field("ad_unit_code", pa.string()),
+    pa.field("bidder", pa.string()),
+    pa.field("cpm", pa.float64()),
+    pa.field("currency", pa.string()),
+    pa.field("size", pa.string()),
+    pa.field("time_to_respond", pa.int64()),
+    pa.field("hb_pb", pa.string()),
+]
+PQ_SCHEMAS["prebid_bids"] = pa.schema(fields)
@@ -0,0 +1,155 @@
+import sqlite3
+import time
+import urllib.parse
+from dataclasses import dataclass
+from pathlib import Path
+from sqlite3 import Connection, OperationalError
+from typing import Optional
+
+POLICY_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS policies (
+    url TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    first_seen REAL NOT NULL,
+    last_checked REAL NOT NULL,
+    last_changed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS policy_versions (
+    url TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    seen_at REAL NOT NULL
+);
+"""
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Normalize `url` so that trivially different links to the same
+    policy share an index entry
+
+    Lowercases scheme and host, drops default ports, fragments and
+    trailing slashes and sorts the query parameters.
+    """
+    parsed = urllib.parse.urlsplit(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = (parsed.hostname or "").lower()
+    if parsed.port is not None and parsed.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{parsed.port}"
+    path = parsed.path.rstrip("/") or "/"
+    query = urllib.parse.urlencode(
+        sorted(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True))
+    )
+    return urllib.parse.urlunsplit((scheme, netloc, path, query, ""))
+
+
+@dataclass
+class PolicyEntry:
+    url: str
+    content_hash: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    first_seen: float
+    last_checked: float
+    last_changed: float
+
+
+class PolicyIndex:
+    """On-disk index of all privacy policies ever stored, keyed by normalized URL
+
+    The index lives in a SQLite database so it persists across crawls.
+    The StorageController is its only writer. Commands open it with
+    `read_only` to decide which policies don't need to be fetched again.
+    Every change of a policy's content hash is kept in `policy_versions`.
+    """
+
+    def __init__(self, db_path: Path, read_only: bool = False) -> None:
+        self.db_path = db_path
+        self.read_only = read_only
+        self._db: Optional[Connection] = None
+
+    def _connect(self) -> Optional[Connection]:
+        if self._db is not None:
+            return self._db
+        if self.read_only:
+            try:
+                self._db = sqlite3.connect(
+                    f"file:{self.db_path}?mode=ro", uri=True, timeout=30
+                )
+            except OperationalError:
+                # Nothing has been indexed yet
+                return None
+        else:
+            self._db = sqlite3.connect(str(self.db_path), timeout=30)
+            # Let the browsers read while the StorageController writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(POLICY_INDEX_SCHEMA)
+            self._db.commit()
+        return self._db
+
+    def lookup(self, url: str) -> Optional[PolicyEntry]:
+        db = self._connect()
+        if db is None:
+            return None
+        try:
+            row = db.execute(
+                "SELECT url, content_hash, etag, last_modified, first_seen, "
+                "last_checked, last_changed FROM policies WHERE url = ?",
+                (normalize_url(url),),
+            ).fetchone()
+        except OperationalError:
+            # The StorageController hasn't created the tables yet
+            return None
+        return PolicyEntry(*row) if row is not None else None
+
+    def record(
+        self,
+        url: str,
+        content_hash: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> bool:
+        """Record that `url` currently has the content `content_hash`
+
+        Returns whether this is new content for `url`.
+        """
+        assert not self.read_only
+        db = self._connect()
+        assert db is not None
+        url = normalize_url(url)
+        now = time.time()
+        entry = self.lookup(url)
+        changed = entry is None or entry.content_hash != content_hash
+        with db:
+            if entry is None:
+                db.execute(
+                    "INSERT INTO policies VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, content_hash, etag, last_modified, now, now, now),
+                )
+            else:
+                db.execute(
+                    "UPDATE policies SET content_hash = ?, etag = ?, "
+                    "last_modified = ?, last_checked = ?, last_changed = ? "
+                    "WHERE url = ?",
+                    (
+                        content_hash,
+                        etag,
+                        last_modified,
+                        now,
+                        now if changed else entry.last_changed,
+                        url,
+                    ),
+                )
+            if changed:
+                db.execute(
+                    "INSERT INTO policy_versions VALUES (?, ?, ?)",
+                    (url, content_hash, now),
+                )
+        return changed
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -42,6 +42,7 @@ CREATE TABLE IF NOT EXISTS crawl_history (
     error TEXT,
     traceback TEXT,
     duration INTEGER,
+    result TEXT,
     dtg DATETIME DEFAULT (CURRENT_TIMESTAMP),
     FOREIGN KEY(browser_id) REFERENCES crawl(browser_id));
 
@@ -246,3 +247,19 @@ CREATE TABLE IF NOT EXISTS dns_responses (
   is_TRR INTEGER, 
   time_stamp DATETIME NOT NULL
  );
+
+/*
+# Prebid bids
+ */
+CREATE TABLE IF NOT EXISTS prebid_bids (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  browser_id INTEGER NOT NULL,
+  visit_id INTEGER NOT NULL,
+  ad_unit_code TEXT,
+  bidder TEXT,
+  cpm REAL,
+  currency TEXT,
+  size TEXT,
+  time_to_respond INTEGER,
+  hb_pb TEXT
+);
@@ -1,5 +1,6 @@
 import asyncio
 import base64
+import hashlib
 import logging
 import queue
 import random
@@ -8,15 +9,20 @@ import time
 from asyncio import IncompleteReadError, Task
 from asyncio.base_events import Server
 from collections import defaultdict
-from typing import Any, DefaultDict, Dict, List, NoReturn, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, DefaultDict, Dict, List, NoReturn, Optional, Set, Tuple
 
+import psutil
 from multiprocess import Queue
 
+from openwpm.utilities.html_conversion import html_to_markdown
 from openwpm.utilities.multiprocess_utils import Process
 
 from ..config import BrowserParamsInternal, ManagerParamsInternal
 from ..socket_interface import ClientSocket, get_message_from_reader
 from ..types import BrowserId, VisitId
+from .policy_index import PolicyIndex
 from .storage_providers import (
     StructuredStorageProvider,
     TableName,
@@ -25,6 +31,8 @@ from .storage_providers import (
 
 RECORD_TYPE_CONTENT = "page_content"
 RECORD_TYPE_META = "meta_information"
+RECORD_TYPE_BATCH = "record_batch"
+RECORD_TYPE_MARKDOWN = "page_markdown"
 ACTION_TYPE_FINALIZE = "Finalize"
 ACTION_TYPE_INITIALIZE = "Initialize"
 
@@ -53,6 +61,8 @@ class StorageController:
         status_queue: Queue,
         completion_queue: Queue,
         shutdown_queue: Queue,
+        post_processing_workers: int = 2,
+        policy_index_path: Optional[Path] = None,
     ) -> None:
         """
         Parameters
@@ -65,6 +75,11 @@ class StorageController:
             queue containing the visit_ids of saved records
         shutdown_queue
             queue that the main process can use to shut down the StorageController
+        post_processing_workers
+            number of processes converting page sources before they get stored
+        policy_index_path
+            location of the PolicyIndex used to deduplicate converted pages
+            across crawls
         """
         self.status_queue = status_queue
         self.completion_queue = completion_queue
@@ -76,13 +91,16 @@ class StorageController:
             list
         )
         """Contains all store_record tasks for a given visit_id"""
-        self.finalize_tasks: list[tuple[VisitId, Optional[Task[None]], bool]] = []
-        """Contains all information required for update_completion_queue to work
-            Tuple structure is: VisitId, optional completion token, success
-        """
+        self.pending_completions: Set[Task[None]] = set()
+        """Completion tokens of finalized visits whose data isn't saved yet"""
         self.structured_storage = structured_storage
         self.unstructured_storage = unstructured_storage
         self._last_record_received: Optional[float] = None
+        self.post_processing_workers = post_processing_workers
+        self.post_processing_pool: Optional[ProcessPoolExecutor] = None
+        self.policy_index: Optional[PolicyIndex] = (
+            PolicyIndex(policy_index_path) if policy_index_path is not None else None
+        )
 
     async def _handler(
         self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
@@ -156,6 +174,33 @@ class StorageController:
                 await self._handle_meta(visit_id, data)
                 continue
 
+            if record_type == RECORD_TYPE_MARKDOWN:
+                if self.unstructured_storage is None:
+                    self.logger.error(
+                        """Tried to save markdown while not having
+                        provided any unstructured storage provider."""
+                    )
+                    continue
+                # Converting can take a while, so it shouldn't block the socket
+                self.store_record_tasks[visit_id].append(
+                    asyncio.create_task(
+                        self.store_markdown(
+                            data["url"],
+                            data["page_html"],
+                            data.get("etag"),
+                            data.get("last_modified"),
+                        )
+                    )
+                )
+                continue
+
+            if record_type == RECORD_TYPE_BATCH:
+                table_name = TableName(data["table"])
+                for batch_record in data["records"]:
+                    batch_record["visit_id"] = visit_id
+                    await self.store_record(table_name, visit_id, batch_record)
+                continue
+
             table_name = TableName(record_type)
             await self.store_record(table_name, visit_id, data)
 
@@ -174,6 +219,43 @@ class StorageController:
             )
         )
 
+    async def store_markdown(
+        self,
+        url: str,
+        page_html: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """Convert `page_html` to Markdown in the post-processing pool
+        and store the result with the UnstructuredStorageProvider
+
+        The Markdown is stored as `<sha256 of the Markdown>.md`, so identical
+        pages are only written once. If a PolicyIndex is configured the new
+        content hash of `url` is recorded there as well. If the conversion
+        fails, only this page is lost.
+        """
+        assert self.unstructured_storage is not None
+        assert self.post_processing_pool is not None
+        loop = asyncio.get_running_loop()
+        try:
+            markdown = await loop.run_in_executor(
+                self.post_processing_pool, html_to_markdown, page_html
+            )
+        except Exception as e:
+            self.logger.error("Failed to convert %s to Markdown", url, exc_info=e)
+            return
+        blob = markdown.encode("utf-8")
+        content_hash = hashlib.sha256(blob).hexdigest()
+        entry = self.policy_index.lookup(url) if self.policy_index else None
+        if entry is None or entry.content_hash != content_hash:
+            await self.unstructured_storage.store_blob(
+                filename=f"{content_hash}.md", blob=blob
+            )
+        else:
+            self.logger.info("Content of %s didn't change since the last crawl", url)
+        if self.policy_index is not None:
+            self.policy_index.record(url, content_hash, etag, last_modified)
+
     async def _handle_meta(self, visit_id: VisitId, data: Dict[str, Any]) -> None:
         """
         Messages for the table RECORD_TYPE_SPECIAL are meta information
@@ -191,7 +273,7 @@ class StorageController:
         elif action == ACTION_TYPE_FINALIZE:
             success: bool = data["success"]
             completion_token = await self.finalize_visit_id(visit_id, success)
-            self.finalize_tasks.append((visit_id, completion_token, success))
+            self.complete_when_saved(visit_id, completion_token, success)
         else:
             raise ValueError("Unexpected action: %s", action)
 
@@ -234,9 +316,41 @@ class StorageController:
         )
         return completion_token
 
+    def complete_when_saved(
+        self, visit_id: VisitId, completion_token: Optional[Task[None]], success: bool
+    ) -> None:
+        """Puts the visit_id into the completion_queue as soon as
+        its completion token resolves"""
+        if completion_token is None or completion_token.done():
+            # Either way all data for the visit_id was saved out
+            self.completion_queue.put((visit_id, success))
+            return
+
+        def complete(token: Task[None]) -> None:
+            self.pending_completions.discard(token)
+            self.completion_queue.put((visit_id, success))
+
+        self.pending_completions.add(completion_token)
+        completion_token.add_done_callback(complete)
+
+    def memory_usage(self) -> int:
+        """Resident memory of the StorageController and its
+        post-processing workers in MB"""
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return rss // 2**20
+
     async def update_status_queue(self) -> NoReturn:
         """Send manager process a status update.
 
+        The status is the number of unfinished store tasks
+        and the memory usage in MB.
+
         This coroutine will get cancelled with an exception
         so there is no need for an orderly return
         """
@@ -248,17 +362,19 @@ class StorageController:
                 for task in task_list:
                     if not task.done():
                         task_count += 1
-            self.status_queue.put(task_count)
+            memory_usage = self.memory_usage()
+            self.status_queue.put((task_count, memory_usage))
             self.logger.debug(
                 (
                     "StorageController status: There are currently %d scheduled tasks "
-                    "for %d visit_ids"
+                    "for %d visit_ids, using %d MB"
                 ),
                 task_count,
                 visit_id_count,
+                memory_usage,
             )
 
-    async def shutdown(self, completion_queue_task: Task[None]) -> None:
+    async def shutdown(self) -> None:
         self.logger.info("Entering self.shutdown")
         completion_tokens = {}
         visit_ids = list(self.store_record_tasks.keys())
@@ -270,7 +386,9 @@ class StorageController:
             )
 
         await self.structured_storage.flush_cache()
-        await completion_queue_task
+        if self.pending_completions:
+            # Their done callbacks put them into the completion queue
+            await asyncio.wait(self.pending_completions)
         for visit_id, token in completion_tokens.items():
             if token:
                 await token
@@ -283,6 +401,11 @@ class StorageController:
             await self.unstructured_storage.flush_cache()
             await self.unstructured_storage.shutdown()
 
+        if self.post_processing_pool is not None:
+            self.post_processing_pool.shutdown()
+        if self.policy_index is not None:
+            self.policy_index.close()
+
     async def should_shutdown(self) -> None:
         """Returns when we should shut down"""
 
@@ -322,26 +445,13 @@ class StorageController:
                 await self.unstructured_storage.flush_cache()
             self._last_record_received = None
 
-    async def update_completion_queue(self) -> None:
-        """All completed finalize_visit_id tasks get put into the completion_queue here"""
-        while not (self._shutdown_flag and len(self.finalize_tasks) == 0):
-            # This list is needed because iterating over a list and changing it at the same time
-            # is forbidden
-            new_finalize_tasks: List[Tuple[VisitId, Optional[Task[None]], bool]] = []
-            for visit_id, token, success in self.finalize_tasks:
-                if (
-                    not token or token.done()
-                ):  # Either way all data for the visit_id was saved out
-                    self.completion_queue.put((visit_id, success))
-                else:
-                    new_finalize_tasks.append((visit_id, token, success))
-            self.finalize_tasks = new_finalize_tasks
-            await asyncio.sleep(5)
-
     async def _run(self) -> None:
         await self.structured_storage.init()
         if self.unstructured_storage:
             await self.unstructured_storage.init()
+        self.post_processing_pool = ProcessPoolExecutor(
+            max_workers=self.post_processing_workers
+        )
         server: Server = await asyncio.start_server(
             self._handler, "localhost", 0, family=socket.AF_INET
         )
@@ -355,10 +465,6 @@ class StorageController:
         timeout_check = asyncio.create_task(
             self.save_batch_if_past_timeout(), name="TimeoutCheck"
         )
-
-        update_completion_queue = asyncio.create_task(
-            self.update_completion_queue(), name="CompletionQueueFeeder"
-        )
         # Blocks until we should shut down
         await self.should_shutdown()
         self.logger.info(f"Closing Server")
@@ -374,7 +480,7 @@ class StorageController:
         await server.wait_closed()
         self.logger.info("Completed wait_closed")
 
-        await self.shutdown(update_completion_queue)
+        await self.shutdown()
 
     def run(self) -> None:
         logging.getLogger("asyncio").setLevel(logging.WARNING)
@@ -401,6 +507,59 @@ class DataSocket:
             )
         )
 
+    def store_records(
+        self, table_name: TableName, visit_id: VisitId, records: List[Dict[str, Any]]
+    ) -> None:
+        """Store several records for the same table and visit_id in one message"""
+        self.socket.send(
+            (
+                RECORD_TYPE_BATCH,
+                {"table": table_name, "visit_id": visit_id, "records": records},
+            )
+        )
+
+    def store_content(self, content: bytes, content_hash: str) -> None:
+        """Store `content` with the UnstructuredStorageProvider under `content_hash`
+
+        The provider won't overwrite existing blobs, so content that is
+        stored repeatedly under the same hash only gets written once.
+        """
+        self.socket.send(
+            (
+                RECORD_TYPE_CONTENT,
+                (base64.b64encode(content).decode("ascii"), content_hash),
+            )
+        )
+
+    def store_markdown(
+        self,
+        visit_id: VisitId,
+        url: str,
+        page_html: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """Convert the `page_html` of `url` to Markdown and store it
+
+        The conversion happens in the StorageController's post-processing pool,
+        so this returns as soon as the page source has been sent.
+        The visit isn't finalized before the Markdown has been stored.
+        `etag` and `last_modified` are the validators the server sent for `url`
+        and get recorded in the PolicyIndex for revalidation in later crawls.
+        """
+        self.socket.send(
+            (
+                RECORD_TYPE_MARKDOWN,
+                {
+                    "visit_id": visit_id,
+                    "url": url,
+                    "page_html": page_html,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                },
+            )
+        )
+
     def finalize_visit_id(self, visit_id: VisitId, success: bool) -> None:
         self.socket.send(
             (
@@ -426,6 +585,8 @@ class StorageControllerHandle:
         self,
         structured_storage: StructuredStorageProvider,
         unstructured_storage: Optional[UnstructuredStorageProvider],
+        post_processing_workers: int = 2,
+        policy_index_path: Optional[Path] = None,
     ) -> None:
         self.listener_address: Optional[Tuple[str, int]] = None
         self.listener_process: Optional[Process] = None
@@ -434,6 +595,8 @@ class StorageControllerHandle:
         self.shutdown_queue = Queue()
         self._last_status = None
         self._last_status_received: Optional[float] = None
+        self.last_memory_usage: Optional[int] = None
+        """Memory usage of the StorageController in MB, as of the last status"""
         self.logger = logging.getLogger("openwpm")
         self.storage_controller = StorageController(
             structured_storage,
@@ -441,6 +604,8 @@ class StorageControllerHandle:
             status_queue=self.status_queue,
             completion_queue=self.completion_queue,
             shutdown_queue=self.shutdown_queue,
+            post_processing_workers=post_processing_workers,
+            policy_index_path=policy_index_path,
         )
 
     def get_next_visit_id(self) -> VisitId:
@@ -507,19 +672,15 @@ class StorageControllerHandle:
 
         self.listener_address = self.status_queue.get()
 
-    def get_new_completed_visits(self) -> List[Tuple[int, bool]]:
+    def get_next_completed_visit(self) -> Optional[Tuple[VisitId, bool]]:
         """
-        Returns a list of all visit ids that have been processed since
-        the last time the method was called and whether or not they
-        ran successfully.
+        Blocks until the next visit id has been processed and returns it
+        and whether or not it ran successfully.
 
-        This method will return an empty list in case no visit ids have
-        been processed since the last time this method was called
+        Returns None once the storage controller has shut down and all
+        visit ids it processed have been returned.
         """
-        finished_visit_ids = list()
-        while not self.completion_queue.empty():
-            finished_visit_ids.append(self.completion_queue.get())
-        return finished_visit_ids
+        return self.completion_queue.get()
 
     def shutdown(self, relaxed: bool = True) -> None:
         """Terminate the storage controller process"""
@@ -528,6 +689,8 @@ class StorageControllerHandle:
         self.shutdown_queue.put((SHUTDOWN_SIGNAL, relaxed))
         start_time = time.time()
         self.storage_controller.join(300)
+        # Wakes up the reader of the completion queue once it's drained
+        self.completion_queue.put(None)
         self.logger.debug(
             "%s took %s seconds to close."
             % (type(self).__name__, str(time.time() - start_time))
@@ -542,8 +705,7 @@ class StorageControllerHandle:
 
         # Drain status queue until we receive most recent update
         while not self.status_queue.empty():
-            self._last_status = self.status_queue.get()
-            self._last_status_received = time.time()
+            self._receive_status(self.status_queue.get())
 
         # Check last status signal
         if (time.time() - self._last_status_received) > STATUS_TIMEOUT:
@@ -554,13 +716,15 @@ class StorageControllerHandle:
 
         return self._last_status
 
-    def get_status(self) -> int:
-        """Get listener process status. If the status queue is empty, block."""
+    def _receive_status(self, status: Tuple[int, int]) -> None:
+        self._last_status, self.last_memory_usage = status
+        self._last_status_received = time.time()
+
+    def get_status(self, timeout: float = STATUS_TIMEOUT) -> int:
+        """Get listener process status. If the status queue is empty,
+        block for up to `timeout` seconds."""
         try:
-            self._last_status = self.status_queue.get(
-                block=True, timeout=STATUS_TIMEOUT
-            )
-            self._last_status_received = time.time()
+            self._receive_status(self.status_queue.get(block=True, timeout=timeout))
         except queue.Empty:
             assert self._last_status_received is not None
             raise RuntimeError(
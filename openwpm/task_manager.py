@@ -3,9 +3,10 @@ import os
 import pickle
 import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import reduce
 from types import TracebackType
-from typing import Any, Dict, List, Optional, Set, Type
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
 
 import psutil
 import tblib
@@ -23,22 +24,24 @@ from .command_sequence import CommandSequence
 from .errors import CommandExecutionError
 from .js_instrumentation import clean_js_instrumentation_settings
 from .mp_logger import MPLogger
+from .scheduler import SiteScheduler, Submission
+from .standby_pool import StandbyPool
 from .storage.storage_controller import DataSocket, StorageControllerHandle
 from .storage.storage_providers import (
     StructuredStorageProvider,
     UnstructuredStorageProvider,
 )
+from .types import BrowserId
+from .utilities.adaptive_timeout import AdaptiveTimeouts
+from .utilities.backpressure import Backpressure
 from .utilities.multiprocess_utils import kill_process_and_children
 from .utilities.platform_utils import get_configuration_string, get_version
 from .utilities.storage_watchdog import StorageLogger
 
 tblib.pickling_support.install()
 
-SLEEP_CONS = 0.1  # command sleep constant (in seconds)
 BROWSER_MEMORY_LIMIT = 1500  # in MB
 
-STORAGE_CONTROLLER_JOB_LIMIT = 10000  # number of records in the queue
-
 
 class TaskManager:
     """User-facing Class for interfacing with OpenWPM
@@ -81,6 +84,11 @@ class TaskManager:
 
         manager_params.source_dump_path = manager_params.data_directory / "sources"
 
+        if manager_params.policy_index_path is None:
+            manager_params.policy_index_path = (
+                manager_params.data_directory / "policy_index.sqlite"
+            )
+
         self.manager_params: ManagerParamsInternal = manager_params
         self.browser_params: List[BrowserParamsInternal] = browser_params
         self._logger_kwargs = logger_kwargs
@@ -104,6 +112,31 @@ class TaskManager:
         self.failure_status: Optional[Dict[str, Any]] = None
         self.threadlock = threading.Lock()
         self.failure_count = 0
+        self._browser_ready = threading.Condition()
+        """Notified by the browser workers whenever a browser
+        becomes ready for the next CommandSequence"""
+        self.scheduler = SiteScheduler(
+            self.num_browsers, manager_params.max_visits_per_domain
+        )
+        """Holds the CommandSequences passed to `submit` that haven't been
+        dispatched yet and limits the concurrent visits per domain"""
+        self._draining = False
+        self.backpressure = Backpressure(
+            manager_params.storage_high_watermark,
+            manager_params.storage_low_watermark,
+            manager_params.storage_memory_high_watermark,
+            manager_params.storage_memory_low_watermark,
+        )
+        """Holds back CommandSequences while the StorageController is overloaded"""
+        self.timeouts: Optional[AdaptiveTimeouts] = None
+        """Learns the command timeouts if `ManagerParams.adaptive_timeouts` is set"""
+        if manager_params.adaptive_timeouts:
+            self.timeouts = AdaptiveTimeouts(
+                manager_params.adaptive_timeout_percentile,
+                manager_params.adaptive_timeout_margin,
+                manager_params.adaptive_timeouts_per_domain,
+            )
+        self._dispatcher: Optional[threading.Thread] = None
 
         self.failure_limit = manager_params.failure_limit
         # Start logging server thread
@@ -119,10 +152,20 @@ class TaskManager:
         self._launch_storage_controller(
             structured_storage_provider, unstructured_storage_provider
         )
+        thread = threading.Thread(target=self._monitor_storage_controller, args=())
+        thread.daemon = True
+        thread.name = "OpenWPM-storage-monitor"
+        thread.start()
 
         # Sets up the BrowserManager(s) + associated queues
         self.browsers = self._initialize_browsers(browser_params)
+        self.standby_pool = StandbyPool(
+            self.browsers, manager_params.num_standby_browsers
+        )
+        for browser in self.browsers:
+            browser.start_worker(self._run_command_sequence)
         self._launch_browsers()
+        self.standby_pool.start()
 
         # Start the manager watchdog
         thread = threading.Thread(target=self._manager_watchdog, args=())
@@ -194,21 +237,38 @@ class TaskManager:
         return browsers
 
     def _launch_browsers(self) -> None:
-        """launch each browser manager process / browser"""
-        for browser in self.browsers:
-            try:
-                success = browser.launch_browser_manager()
-            except Exception:
+        """launch the browser manager processes / browsers concurrently, at most
+        `manager_params.launch_concurrency` at a time"""
+        start_time = time.time()
+        with ThreadPoolExecutor(
+            max_workers=self.manager_params.launch_concurrency,
+            thread_name_prefix="OpenWPM-launcher",
+        ) as executor:
+            launches = [
+                executor.submit(browser.launch_browser_manager)
+                for browser in self.browsers
+            ]
+        for launch in launches:
+            if launch.exception() is not None:
                 self._shutdown_manager(during_init=True)
-                raise
-
-            if not success:
-                self.logger.critical(
-                    "Browser spawn failure during "
-                    "TaskManager initialization, exiting..."
-                )
-                self.close()
-                break
+                launch.result()
+
+        if not all(launch.result() for launch in launches):
+            self.logger.critical(
+                "Browser spawn failure during TaskManager initialization, exiting..."
+            )
+            self.close()
+            return
+        self.logger.info(
+            "Launched %d browsers in %.1f seconds",
+            len(self.browsers),
+            time.time() - start_time,
+        )
+
+    @property
+    def launch_timings(self) -> Dict[BrowserId, Dict[str, float]]:
+        """Seconds each stage of the last launch of every browser took"""
+        return {browser.browser_id: browser.launch_timings for browser in self.browsers}
 
     def _manager_watchdog(self) -> None:
         """
@@ -258,6 +318,10 @@ class TaskManager:
                         geckodriver_pids.add(browser.geckodriver_pid)
                     if browser.display_pid is not None:
                         display_pids.add(browser.display_pid)
+                # Spare browsers are launched in the background at any time
+                standby_pids = self.standby_pool.pids()
+                geckodriver_pids |= standby_pids
+                display_pids |= standby_pids
                 for process in psutil.process_iter():
                     if process.create_time() + 300 < check_time and (
                         (
@@ -283,7 +347,10 @@ class TaskManager:
         unstructured_storage_provider: Optional[UnstructuredStorageProvider],
     ) -> None:
         self.storage_controller_handle = StorageControllerHandle(
-            structured_storage_provider, unstructured_storage_provider
+            structured_storage_provider,
+            unstructured_storage_provider,
+            self.manager_params.post_processing_workers,
+            self.manager_params.policy_index_path,
         )
         self.storage_controller_handle.launch()
         self.manager_params.storage_controller_address = (
@@ -313,17 +380,28 @@ class TaskManager:
         """
         if self.closing:
             return
+        if relaxed and not self.failure_status:
+            # Everything that was submitted should still get executed
+            self._drain_submissions()
         self.closing = True
+        self.backpressure.release()
+        with self._browser_ready:
+            # Wake up everybody waiting for a browser so they notice we're closing
+            self._browser_ready.notify_all()
+        self._cancel_submissions()
+        self.logger.info("Submission throttling: %s", self.backpressure.metrics())
+        if self.scheduler.steals:
+            self.logger.info(
+                "Browsers stole %d queued CommandSequences", self.scheduler.steals
+            )
 
         for browser in self.browsers:
-            if (
-                relaxed is True
-                and browser.command_thread
-                and browser.command_thread.is_alive()
-            ):
-                # Waiting for the command_sequence to be finished
-                browser.command_thread.join()
+            if relaxed is True:
+                # Waiting for the assigned command_sequences to be finished
+                browser.idle.wait()
+            self._drop_assignments(browser, browser.stop_worker())
             browser.shutdown_browser(during_init, force=not relaxed)
+        self.standby_pool.shutdown()
 
         self.sock.close()  # close socket to storage controller
         self.storage_controller_handle.shutdown(relaxed=relaxed)
@@ -357,55 +435,187 @@ class TaskManager:
                 "failure limit.",
                 self.failure_status["CommandSequence"],
             )
+        if self.failure_status["ErrorType"] == "StorageControllerUnresponsive":
+            raise self.failure_status["Exception"]
         if self.failure_status["ErrorType"] == "CriticalChildException":
             _, exc, tb = pickle.loads(self.failure_status["Exception"])
             raise exc.with_traceback(tb)
 
     # CRAWLER COMMAND CODE
 
-    def _start_thread(
+    def _assign(
         self, browser: BrowserManagerHandle, command_sequence: CommandSequence
-    ) -> threading.Thread:
-        """starts the command execution thread"""
+    ) -> threading.Event:
+        """hands `command_sequence` to the worker of `browser`
+
+        Needs to be called while holding `self._browser_ready`, so no other
+        thread can hand the same browser a CommandSequence in the meantime.
+        Returns an event that is set once the CommandSequence has run.
+        """
 
-        # Check status flags before starting thread
+        # Check status flags before assigning
         if self.closing:
             self.logger.error("Attempted to execute command on a closed TaskManager")
             raise RuntimeError("Attempted to execute command on a closed TaskManager")
-        self._check_failure_status()
-        visit_id = self.storage_controller_handle.get_next_visit_id()
-        browser.set_visit_id(visit_id)
-        if command_sequence.callback:
-            self.unsaved_command_sequences[visit_id] = command_sequence
-
-        # Start command execution thread
-        args = (self, command_sequence)
-        thread = threading.Thread(target=browser.execute_command_sequence, args=args)
-        thread.name = f"BrowserManagerHandle-{browser.browser_id}"
-        browser.command_thread = thread
-        thread.daemon = True
-        thread.start()
-        return thread
+        self.scheduler.started(command_sequence.url)
+        return browser.assign(command_sequence)
+
+    def _drop_assignments(
+        self, browser: BrowserManagerHandle, command_sequences: List[CommandSequence]
+    ) -> None:
+        """Marks CommandSequences that were assigned to `browser` but will
+        never run as failed"""
+        for command_sequence in command_sequences:
+            with self._browser_ready:
+                browser.finished()
+                self.scheduler.finished(command_sequence.url)
+                self._browser_ready.notify_all()
+            command_sequence.mark_done(False)
+
+    def _monitor_storage_controller(self) -> None:
+        """Feeds the status updates of the StorageController into
+        `self.backpressure` until the TaskManager closes"""
+        while not self.closing:
+            try:
+                task_count = self.storage_controller_handle.get_status()
+            except RuntimeError as e:
+                if self.closing:
+                    return
+                self.logger.critical("StorageController is unresponsive: %s", e)
+                self.failure_status = {
+                    "ErrorType": "StorageControllerUnresponsive",
+                    "Exception": e,
+                }
+                # Unblock everybody so they notice the failure
+                self.backpressure.release()
+                with self._browser_ready:
+                    self._browser_ready.notify_all()
+                return
+            self.backpressure.update(
+                task_count, self.storage_controller_handle.last_memory_usage
+            )
+
+    def _run_command_sequence(
+        self, browser: BrowserManagerHandle, command_sequence: CommandSequence
+    ) -> None:
+        """Runs `command_sequence` on the worker thread of `browser`
+
+        Signals waiting dispatchers once the browser is ready again
+        """
+        if self.failure_status:
+            # Assigned while the previous CommandSequence was failing
+            self._drop_assignments(browser, [command_sequence])
+            return
+        try:
+            visit_id = self.storage_controller_handle.get_next_visit_id()
+            browser.set_visit_id(visit_id)
+            command_sequence.visit_id = visit_id
+            command_sequence.browser_id = browser.browser_id
+            if command_sequence.callback or command_sequence.future is not None:
+                self.unsaved_command_sequences[visit_id] = command_sequence
+            browser.current_timeout = command_sequence.total_timeout
+            browser.execute_command_sequence(self, command_sequence)
+        finally:
+            with self._browser_ready:
+                browser.finished()
+                self.scheduler.finished(command_sequence.url)
+                self._browser_ready.notify_all()
+
+    def _wait_for_browser(
+        self, index: Optional[int], url: str
+    ) -> Optional[BrowserManagerHandle]:
+        """Blocks until a browser is ready to accept a CommandSequence for `url`
+
+        Needs to be called while holding `self._browser_ready`.
+        Returns None if the TaskManager is closing or has failed in the meantime.
+        """
+        candidates = self.browsers if index is None else [self.browsers[index]]
+        while not (self.closing or self.failure_status):
+            if self.scheduler.can_run(url):
+                for browser in candidates:
+                    if browser.ready():
+                        return browser
+            self._browser_ready.wait()
+        return None
+
+    def _wait_for_submission(
+        self,
+    ) -> Optional[Tuple[BrowserManagerHandle, Submission]]:
+        """Blocks until a ready browser has a submission it may run
+
+        Needs to be called while holding `self._browser_ready`.
+        Returns None once the TaskManager is closing or has failed, or all
+        submissions have been dispatched while draining.
+        """
+        while not (self.closing or self.failure_status):
+            for index, browser in enumerate(self.browsers):
+                if browser.ready():
+                    submission = self.scheduler.take(index)
+                    if submission is not None:
+                        return browser, submission
+            if self._draining and not len(self.scheduler):
+                return None
+            self._browser_ready.wait()
+        return None
+
+    def _dispatch_submissions(self) -> None:
+        """Hands submitted CommandSequences to the browsers as they become
+        ready, in the order `self.scheduler` picks"""
+        while True:
+            # Block while the storage controller has too many unfinished records
+            self.backpressure.wait()
+            with self._browser_ready:
+                picked = self._wait_for_submission()
+                if picked is None:
+                    return
+                # Wake up submitters waiting for room in the scheduler
+                self._browser_ready.notify_all()
+                browser, (command_sequence, _, future) = picked
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    self._assign(browser, command_sequence)
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _drain_submissions(self) -> None:
+        """Waits until every submitted CommandSequence has been dispatched"""
+        dispatcher = self._dispatcher
+        if dispatcher is None or dispatcher is threading.current_thread():
+            return
+        with self._browser_ready:
+            self._draining = True
+            self._browser_ready.notify_all()
+        dispatcher.join()
+
+    def _cancel_submissions(self) -> None:
+        """Cancels all CommandSequences that haven't been dispatched yet"""
+        with self._browser_ready:
+            submissions = self.scheduler.clear()
+            self._browser_ready.notify_all()
+        for _, _, future in submissions:
+            future.cancel()
 
     def _mark_command_sequences_complete(self) -> None:
-        """Polls the storage controller for saved records
-        and calls their callbacks
+        """Waits for the storage controller to save the records of
+        each visit and calls their callbacks
         """
         while True:
-            if self.closing and not self.unsaved_command_sequences:
-                # we're shutting down and have no unprocessed callbacks
+            completed = self.storage_controller_handle.get_next_completed_visit()
+            if completed is None:
+                # The storage controller has shut down
                 break
-
-            visit_id_list = self.storage_controller_handle.get_new_completed_visits()
-            if not visit_id_list:
-                time.sleep(1)
-                continue
-
-            for visit_id, successful in visit_id_list:
-                self.logger.debug("Invoking callback of visit_id %d", visit_id)
-                cs = self.unsaved_command_sequences.pop(visit_id, None)
-                if cs:
-                    cs.mark_done(successful)
+            visit_id, successful = completed
+            self.logger.debug("Invoking callback of visit_id %d", visit_id)
+            cs = self.unsaved_command_sequences.pop(visit_id, None)
+            if cs:
+                cs.mark_done(successful)
+
+        for visit_id in list(self.unsaved_command_sequences):
+            self.logger.error(
+                "The storage controller didn't complete visit_id %d", visit_id
+            )
+            self.unsaved_command_sequences.pop(visit_id).mark_done(False)
 
     def execute_command_sequence(
         self, command_sequence: CommandSequence, index: Optional[int] = None
@@ -417,49 +627,73 @@ class TaskManager:
         int  -> index of browser to send command to
         """
 
-        # Block if the storage controller has too many unfinished records
-        agg_queue_size = self.storage_controller_handle.get_most_recent_status()
-        if agg_queue_size >= STORAGE_CONTROLLER_JOB_LIMIT:
-            while agg_queue_size >= STORAGE_CONTROLLER_JOB_LIMIT:
-                self.logger.info(
-                    "Blocking command submission until the storage controller "
-                    "is below the max queue size of %d. Current queue "
-                    "length %d. " % (STORAGE_CONTROLLER_JOB_LIMIT, agg_queue_size)
-                )
-                agg_queue_size = self.storage_controller_handle.get_status()
-
-        # Distribute command
-        if index is None:
-            # send to first browser available
-            command_executed = False
-            while True:
-                for browser in self.browsers:
-                    if browser.ready():
-                        browser.current_timeout = command_sequence.total_timeout
-                        thread = self._start_thread(browser, command_sequence)
-                        command_executed = True
-                        break
-                if command_executed:
-                    break
-                time.sleep(SLEEP_CONS)
-        elif 0 <= index < len(self.browsers):
-            # send the command to this specific browser
-            while True:
-                if self.browsers[index].ready():
-                    self.browsers[index].current_timeout = (
-                        command_sequence.total_timeout
-                    )
-                    thread = self._start_thread(self.browsers[index], command_sequence)
-                    break
-                time.sleep(SLEEP_CONS)
-        else:
+        # Block while the storage controller has too many unfinished records
+        self.backpressure.wait()
+
+        if index is not None and not 0 <= index < len(self.browsers):
             self.logger.info("Command index type is not supported or out of range")
             return
 
+        # Distribute command to the first available browser or the one at
+        # `index`, waking up whenever a browser finishes a CommandSequence
+        self._check_failure_status()
+        with self._browser_ready:
+            browser = self._wait_for_browser(index, command_sequence.url)
+            if browser is not None:
+                done = self._assign(browser, command_sequence)
+        if browser is None:
+            self._check_failure_status()
+            self.logger.error("Attempted to execute command on a closed TaskManager")
+            raise RuntimeError("Attempted to execute command on a closed TaskManager")
+
         if command_sequence.blocking:
-            thread.join()
+            done.wait()
             self._check_failure_status()
 
+    def submit(
+        self, command_sequence: CommandSequence, index: Optional[int] = None
+    ) -> "Future[bool]":
+        """Queue `command_sequence` for execution without blocking
+
+        The CommandSequences are dispatched by a background thread as the
+        browsers become ready. Among the queued CommandSequences, those with
+        the lowest `site_rank` go first and visits to a domain are limited
+        to `ManagerParams.max_visits_per_domain` at a time, see
+        `SiteScheduler`. `index` pins `command_sequence` to that browser.
+        Once `ManagerParams.submission_queue_size` CommandSequences are
+        waiting to be dispatched, this blocks until there is room again.
+        The returned future resolves once all data of the visit has been
+        saved, with the same success flag the callback receives.
+        CommandSequences that haven't been dispatched when the TaskManager is
+        closed with `relaxed=False` or fails are cancelled.
+        """
+        if self.closing:
+            raise RuntimeError("Attempted to submit command on a closed TaskManager")
+        future: "Future[bool]" = Future()
+        if index is not None and not 0 <= index < len(self.browsers):
+            self.logger.info("Command index type is not supported or out of range")
+            future.cancel()
+            return future
+        command_sequence.future = future
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(
+                target=self._dispatch_submissions, name="OpenWPM-dispatcher"
+            )
+            self._dispatcher.daemon = True
+            self._dispatcher.start()
+        with self._browser_ready:
+            while not (self.closing or self.failure_status) and (
+                len(self.scheduler) >= self.manager_params.submission_queue_size
+            ):
+                self._browser_ready.wait()
+            if self.closing or self.failure_status:
+                # We might have been waiting for room while closing
+                future.cancel()
+                return future
+            self.scheduler.put((command_sequence, index, future))
+            self._browser_ready.notify_all()
+        return future
+
     # DEFINITIONS OF HIGH LEVEL COMMANDS
     # NOTE: These wrappers are provided for convenience. To issue sequential
     # commands to the same browser in a single 'visit', use the CommandSequence
@@ -0,0 +1,132 @@
+import bisect
+import math
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+MIN_SAMPLES = 20
+"""Durations a command needs before its timeout is adapted"""
+COMMAND_WINDOW = 1000
+DOMAIN_WINDOW = 50
+MAX_DOMAINS = 10000
+
+
+class StreamingPercentile:
+    """Percentiles over the most recent `window` values
+
+    The values are kept sorted, so adding a value is linear in `window`
+    and querying a percentile is constant time.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._values: Deque[float] = deque()
+        self._sorted: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, value: float) -> None:
+        if len(self._values) == self.window:
+            oldest = self._values.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._values.append(value)
+        bisect.insort(self._sorted, value)
+
+    def percentile(self, percentile: float) -> float:
+        """Nearest-rank `percentile` (between 0 and 100) of the values"""
+        if not self._sorted:
+            raise ValueError("No values recorded")
+        rank = math.ceil(percentile / 100 * len(self._sorted))
+        return self._sorted[min(max(rank, 1), len(self._sorted)) - 1]
+
+
+class AdaptiveTimeouts:
+    """Learns command timeouts from the durations of earlier commands
+
+    Once a command type has run successfully `MIN_SAMPLES` times, its
+    timeout becomes the `percentile` of its recent durations plus `margin`
+    seconds, but never more than the timeout the command was appended with.
+    With `per_domain`, the durations are also tracked per site and a site's
+    own percentile is used once it has enough samples.
+
+    Commands that time out are recorded with the timeout they were given,
+    which is a lower bound of their real duration, so the timeouts grow
+    again when they turn out to be too tight.
+
+    Only the time a command takes beyond its deliberate `wait` (e.g. the
+    `sleep` of a GetCommand) is learned, and its own wait is added back to
+    its timeout. That way commands of the same type with different waits
+    share what was learned, without timing out the ones waiting longer.
+    """
+
+    def __init__(
+        self,
+        percentile: float,
+        margin: float,
+        per_domain: bool = False,
+    ) -> None:
+        self.percentile = percentile
+        self.margin = margin
+        self.per_domain = per_domain
+        self._lock = threading.Lock()
+        self._commands: Dict[str, StreamingPercentile] = dict()
+        self._domains: "OrderedDict[str, Dict[str, StreamingPercentile]]" = (
+            OrderedDict()
+        )
+
+    def _estimator(
+        self, command: str, domain: Optional[str]
+    ) -> Optional[StreamingPercentile]:
+        if self.per_domain and domain is not None:
+            estimator = self._domains.get(domain, {}).get(command)
+            if estimator is not None and len(estimator) >= MIN_SAMPLES:
+                return estimator
+        estimator = self._commands.get(command)
+        if estimator is not None and len(estimator) >= MIN_SAMPLES:
+            return estimator
+        return None
+
+    def timeout(
+        self,
+        command: str,
+        default: int,
+        domain: Optional[str] = None,
+        wait: float = 0,
+    ) -> int:
+        """The timeout for the next `command` that waits `wait` seconds,
+        at most `default` seconds"""
+        with self._lock:
+            estimator = self._estimator(command, domain)
+            if estimator is None:
+                return default
+            learned = wait + estimator.percentile(self.percentile) + self.margin
+        return min(default, math.ceil(learned))
+
+    def record(
+        self,
+        command: str,
+        duration: float,
+        domain: Optional[str] = None,
+        wait: float = 0,
+    ) -> None:
+        """Record that `command` took `duration` seconds, of which it
+        waited `wait` seconds"""
+        duration = max(0.0, duration - wait)
+        with self._lock:
+            if command not in self._commands:
+                self._commands[command] = StreamingPercentile(COMMAND_WINDOW)
+            self._commands[command].add(duration)
+            if not self.per_domain or domain is None:
+                return
+            if domain in self._domains:
+                self._domains.move_to_end(domain)
+            else:
+                self._domains[domain] = dict()
+                if len(self._domains) > MAX_DOMAINS:
+                    # Forget the domain that was visited least recently
+                    self._domains.popitem(last=False)
+            estimators = self._domains[domain]
+            if command not in estimators:
+                estimators[command] = StreamingPercentile(DOMAIN_WINDOW)
+            estimators[command].add(duration)
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+
+class Backpressure:
+    """Throttles producers while a consumer is overloaded
+
+    The consumer's load is reported through `update` as a number of pending
+    tasks and optionally its memory usage. Once either reaches its high
+    watermark the gate closes and `wait` blocks until both have dropped
+    to their low watermarks again, so the gate doesn't flap around a single
+    threshold.
+    """
+
+    def __init__(
+        self,
+        high_watermark: int,
+        low_watermark: int,
+        memory_high_watermark: Optional[int] = None,
+        memory_low_watermark: Optional[int] = None,
+    ) -> None:
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.memory_high_watermark = memory_high_watermark
+        self.memory_low_watermark = (
+            memory_low_watermark
+            if memory_low_watermark is not None
+            else memory_high_watermark
+        )
+        self.throttled = False
+        self._released = False
+        self._condition = threading.Condition()
+        self._throttled_since: Optional[float] = None
+        self._last_throttle_duration = 0.0
+        self.throttle_events = 0
+        """How often the gate has closed"""
+        self.throttled_time = 0.0
+        """Seconds the gate has been closed in total"""
+        self.blocked_time = 0.0
+        """Seconds producers spent blocked in `wait`, summed over all producers"""
+        self.waiting = 0
+        """Number of producers currently blocked in `wait`"""
+        self.logger = logging.getLogger("openwpm")
+
+    def _above_high(self, task_count: int, memory: Optional[int]) -> bool:
+        if task_count >= self.high_watermark:
+            return True
+        return (
+            self.memory_high_watermark is not None
+            and memory is not None
+            and memory >= self.memory_high_watermark
+        )
+
+    def _below_low(self, task_count: int, memory: Optional[int]) -> bool:
+        if task_count > self.low_watermark:
+            return False
+        return (
+            self.memory_low_watermark is None
+            or memory is None
+            or memory <= self.memory_low_watermark
+        )
+
+    def update(self, task_count: int, memory: Optional[int] = None) -> None:
+        """Report the current load of the consumer, `memory` is in MB"""
+        with self._condition:
+            if not self.throttled and self._above_high(task_count, memory):
+                self.throttled = True
+                self.throttle_events += 1
+                self._throttled_since = time.time()
+                self.logger.info(
+                    "Throttling command submission: %d pending storage tasks "
+                    "using %s MB (high watermarks: %d tasks, %s MB)",
+                    task_count,
+                    memory,
+                    self.high_watermark,
+                    self.memory_high_watermark,
+                )
+            elif self.throttled and self._below_low(task_count, memory):
+                self._open()
+                self.logger.info(
+                    "Resuming command submission: %d pending storage tasks "
+                    "using %s MB. Submission was throttled for %.1f seconds "
+                    "(%.1f seconds over %d episodes in total)",
+                    task_count,
+                    memory,
+                    self._last_throttle_duration,
+                    self.throttled_time,
+                    self.throttle_events,
+                )
+
+    def _open(self) -> None:
+        assert self._throttled_since is not None
+        self._last_throttle_duration = time.time() - self._throttled_since
+        self.throttled_time += self._last_throttle_duration
+        self._throttled_since = None
+        self.throttled = False
+        self._condition.notify_all()
+
+    def wait(self) -> float:
+        """Blocks while the gate is closed
+
+        Returns the number of seconds the caller was blocked.
+        """
+        with self._condition:
+            if not self.throttled or self._released:
+                return 0.0
+            start = time.time()
+            self.waiting += 1
+            self._condition.wait_for(lambda: not self.throttled or self._released)
+            self.waiting -= 1
+            blocked = time.time() - start
+            self.blocked_time += blocked
+            return blocked
+
+    def release(self) -> None:
+        """Opens the gate for good, e.g. when shutting down"""
+        with self._condition:
+            self._released = True
+            if self.throttled:
+                self._open()
+            self._condition.notify_all()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._condition:
+            throttled_time = self.throttled_time
+            if self._throttled_since is not None:
+                throttled_time += time.time() - self._throttled_since
+            return {
+                "throttle_events": self.throttle_events,
+                "throttled_time": throttled_time,
+                "blocked_time": self.blocked_time,
+                "waiting": self.waiting,
+            }
@@ -0,0 +1,17 @@
+import html2text
+from bs4 import BeautifulSoup
+
+
+def html_to_markdown(page_html: str) -> str:
+    """Convert the body of `page_html` to Markdown, dropping images and links
+
+    This is CPU heavy for large pages, so it is kept at module level to be
+    picklable and run in the StorageController's post-processing pool.
+    """
+    soup = BeautifulSoup(page_html, "html.parser")
+    body = soup.body or soup
+
+    converter = html2text.HTML2Text()
+    converter.ignore_images = True
+    converter.ignore_links = True
+    return converter.handle(str(body))
@@ -1,9 +1,12 @@
+import functools
 import json
 import os
+import shutil
 import subprocess
 from collections import OrderedDict
 from copy import deepcopy
 from sys import platform
+from typing import Optional
 
 from tabulate import tabulate
 
@@ -37,9 +40,15 @@ def get_firefox_binary_path():
     """
     If ../../firefox-bin/firefox-bin or os.environ["FIREFOX_BINARY"] exists,
     return it. Else, throw a RuntimeError.
+
+    The result is cached per process for each value of FIREFOX_BINARY.
     """
-    if "FIREFOX_BINARY" in os.environ:
-        firefox_binary_path = os.environ["FIREFOX_BINARY"]
+    return _find_firefox_binary(os.environ.get("FIREFOX_BINARY"))
+
+
+@functools.lru_cache(maxsize=None)
+def _find_firefox_binary(firefox_binary_path: Optional[str]) -> str:
+    if firefox_binary_path is not None:
         if not os.path.isfile(firefox_binary_path):
             raise RuntimeError(
                 "No file found at the path specified in "
@@ -66,6 +75,25 @@ def get_firefox_binary_path():
     return firefox_binary_path
 
 
+def get_geckodriver_path() -> str:
+    """Return the geckodriver on the PATH or throw a RuntimeError.
+
+    The result is cached per process for each value of PATH.
+    """
+    return _find_geckodriver(os.environ.get("PATH"))
+
+
+@functools.lru_cache(maxsize=None)
+def _find_geckodriver(path: Optional[str]) -> str:
+    geckodriver_path = shutil.which("geckodriver", path=path)
+    if geckodriver_path is None:
+        raise RuntimeError(
+            "geckodriver is not found on the PATH (did you run the install "
+            "script (`install.sh`)?)"
+        )
+    return geckodriver_path
+
+
 def get_version():
     """Return OpenWPM version tag/current commit and Firefox version"""
     try:
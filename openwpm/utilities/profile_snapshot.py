@@ -0,0 +1,120 @@
+"""Incremental snapshots of the browsing state in a Firefox profile
+
+Used to carry the cookies, history and site storage of a crashed browser
+over to the browser replacing it, without archiving the whole profile.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+STATE_FILES = (
+    "cookies.sqlite",  # cookies
+    "places.sqlite",  # history
+    "webappsstore.sqlite",  # localStorage
+)
+STATE_DIRS = ("storage",)  # IndexedDB, localStorage and other site storage
+# Committed transactions that haven't been checkpointed into the database yet
+SQLITE_WAL_SUFFIX = "-wal"
+MANIFEST_NAME = "manifest.json"
+FILES_DIR_NAME = "files"
+ZSTD_SUFFIX = ".zst"
+
+# Size and modification time in ns of a file in the profile
+FileStat = Tuple[int, int]
+
+
+def state_files(profile_path: Path) -> Iterator[str]:
+    """Paths of the files holding browsing state, relative to profile_path"""
+    for name in STATE_FILES:
+        for file_name in (name, name + SQLITE_WAL_SUFFIX):
+            if (profile_path / file_name).is_file():
+                yield file_name
+    for dir_name in STATE_DIRS:
+        for root, _, files in os.walk(profile_path / dir_name):
+            for file_name in files:
+                yield (Path(root) / file_name).relative_to(profile_path).as_posix()
+
+
+class ProfileSnapshot:
+    """A copy of the browsing state of a profile in `path`
+
+    Each `update` only copies the state files that changed since the
+    previous update, based on their size and modification time. Restored
+    files keep the modification time they had in the snapshotted profile,
+    so files that weren't touched since aren't copied again when a
+    restored profile is snapshotted.
+
+    With `compress`, files are stored compressed with zstd, which requires
+    the zstandard package.
+
+    Should only be updated when the browser is closed, to prevent
+    database corruption in the snapshot.
+    """
+
+    def __init__(self, path: Path, compress: bool = False) -> None:
+        self.path = path
+        self.compress = compress
+        self._manifest: Dict[str, FileStat] = dict()
+
+    def _stored_path(self, relative_path: str) -> Path:
+        suffix = ZSTD_SUFFIX if self.compress else ""
+        return self.path / FILES_DIR_NAME / (relative_path + suffix)
+
+    def _store(self, source: Path, relative_path: str) -> None:
+        target = self._stored_path(relative_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(target.name + ".partial")
+        if self.compress:
+            import zstandard
+
+            with open(source, "rb") as src, open(partial, "wb") as dst:
+                zstandard.ZstdCompressor(threads=-1).copy_stream(src, dst)
+        else:
+            shutil.copyfile(source, partial)
+        os.replace(partial, target)
+
+    def update(self, profile_path: Path) -> List[str]:
+        """Brings the snapshot up to date with the state files in
+        profile_path and returns the files that had to be copied"""
+        current: Dict[str, FileStat] = dict()
+        for relative_path in state_files(profile_path):
+            stat = os.stat(profile_path / relative_path)
+            current[relative_path] = (stat.st_size, stat.st_mtime_ns)
+
+        copied = []
+        for relative_path, file_stat in current.items():
+            if self._manifest.get(relative_path) == file_stat:
+                continue
+            self._store(profile_path / relative_path, relative_path)
+            copied.append(relative_path)
+        for relative_path in self._manifest.keys() - current.keys():
+            self._stored_path(relative_path).unlink(missing_ok=True)
+
+        self._manifest = current
+        with open(self.path / MANIFEST_NAME, "w") as f:
+            json.dump({"compress": self.compress, "files": current}, f)
+        return copied
+
+    @staticmethod
+    def restore(snapshot_path: Path, profile_path: Path) -> int:
+        """Copies the state files of the snapshot at snapshot_path into
+        profile_path and returns their number"""
+        with open(snapshot_path / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+        snapshot = ProfileSnapshot(snapshot_path, manifest["compress"])
+        for relative_path, (_, mtime_ns) in manifest["files"].items():
+            source = snapshot._stored_path(relative_path)
+            target = profile_path / relative_path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if snapshot.compress:
+                import zstandard
+
+                with open(source, "rb") as src, open(target, "wb") as dst:
+                    zstandard.ZstdDecompressor().copy_stream(src, dst)
+            else:
+                shutil.copyfile(source, target)
+            os.utime(target, ns=(mtime_ns, mtime_ns))
+        return len(manifest["files"])
@@ -0,0 +1,144 @@
+"""Helpers for driving large crawls from a list of sites
+
+Site lists are read lazily, so even a list of a million sites is never
+fully loaded into memory, and completed sites are recorded in a checkpoint
+file so an interrupted crawl can be resumed.
+"""
+
+import csv
+import itertools
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, Set, TextIO, Tuple
+
+SITE_LIST_FORMATS = ["auto", "csv", "tranco", "plain"]
+"""Supported site list formats:
+    * 'csv' has a header row with a `url`, `site` or `domain` column and
+      optionally a `rank` or `site_rank` column
+    * 'tranco' has `rank,domain` rows without a header, like the Tranco,
+      Alexa and Umbrella top lists
+    * 'plain' has one site per line, ranked by line number
+    * 'auto' picks one of the above based on the first line
+"""
+URL_COLUMNS = ["url", "site", "domain"]
+RANK_COLUMNS = ["site_rank", "rank"]
+
+
+def to_url(site: str) -> str:
+    """Turn a bare domain like `example.com` into a URL"""
+    site = site.strip()
+    if "://" in site:
+        return site
+    return "https://" + site
+
+
+def detect_format(first_line: str) -> str:
+    fields = next(csv.reader([first_line]), [])
+    if len(fields) < 2:
+        return "plain"
+    if fields[0].strip().isdigit():
+        return "tranco"
+    return "csv"
+
+
+def _read_csv(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    reader = csv.DictReader(lines)
+    columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+    url_column = next((columns[c] for c in URL_COLUMNS if c in columns), None)
+    if url_column is None:
+        raise ValueError(
+            "Site list has none of the columns %s in its header %s"
+            % (URL_COLUMNS, reader.fieldnames)
+        )
+    rank_column = next((columns[c] for c in RANK_COLUMNS if c in columns), None)
+    for index, row in enumerate(reader):
+        site = row[url_column]
+        if not site or not site.strip():
+            continue
+        rank = int(row[rank_column]) if rank_column else index
+        yield rank, to_url(site)
+
+
+def _read_tranco(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    for fields in csv.reader(lines):
+        if len(fields) < 2:
+            continue
+        yield int(fields[0]), to_url(fields[1])
+
+
+def _read_plain(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    rank = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        yield rank, to_url(line)
+        rank += 1
+
+
+def read_sites(source: TextIO, fmt: str = "auto") -> Iterator[Tuple[int, str]]:
+    """Lazily yield `(site_rank, url)` for every site in `source`
+
+    See `SITE_LIST_FORMATS` for the supported values of `fmt`.
+    """
+    if fmt not in SITE_LIST_FORMATS:
+        raise ValueError(
+            "Unsupported site list format %s, supported values are %s"
+            % (fmt, SITE_LIST_FORMATS)
+        )
+    lines: Iterator[str] = iter(source)
+    if fmt == "auto":
+        first_line = next(lines, None)
+        if first_line is None:
+            return
+        fmt = detect_format(first_line)
+        lines = itertools.chain([first_line], lines)
+    if fmt == "csv":
+        yield from _read_csv(lines)
+    elif fmt == "tranco":
+        yield from _read_tranco(lines)
+    else:
+        yield from _read_plain(lines)
+
+
+class Checkpoint:
+    """Append-only record of the site_ranks a crawl has completed
+
+    Every completed site is written to `path` as `<site_rank>,<success>`
+    right away, so the file survives a crash of the crawl.
+    """
+
+    def __init__(self, path: Path, retry_failed: bool = False) -> None:
+        self.path = path
+        self.retry_failed = retry_failed
+        self.completed: Set[int] = set()
+        self._lock = threading.Lock()
+        if path.exists():
+            with open(path, "r") as f:
+                for line in f:
+                    rank, _, success = line.strip().partition(",")
+                    if not rank:
+                        continue
+                    if retry_failed and success == "0":
+                        self.completed.discard(int(rank))
+                    else:
+                        self.completed.add(int(rank))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a")
+
+    def __contains__(self, site_rank: int) -> bool:
+        return site_rank in self.completed
+
+    def mark_done(self, site_rank: int, success: bool) -> None:
+        with self._lock:
+            if success or not self.retry_failed:
+                self.completed.add(site_rank)
+            self._file.write(f"{site_rank},{int(success)}\n")
+            self._file.flush()
+
+    def remaining(self, sites: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        """Filter out the sites that were completed by a previous run"""
+        return ((rank, url) for rank, url in sites if rank not in self.completed)
+
+    def close(self) -> None:
+        self._file.close()
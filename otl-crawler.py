@@ -1,81 +1,275 @@
+"""Crawl a list of sites for header bidding data, ad creatives and privacy policies
+
+Sites are streamed from a CSV file, a Tranco-style `rank,domain` file or
+stdin, so arbitrarily long lists can be crawled. Every option can also be
+set in a JSON config file passed with `--config`, using the option names
+below (e.g. `{"num_browsers": 4, "commands": ["prebids", "ads"]}`);
+flags given on the command line take precedence.
+
+Completed site ranks are appended to a checkpoint file. Rerunning the same
+crawl skips them, so an interrupted crawl picks up where it stopped.
+
+Examples:
+    python otl-crawler.py top-1m.csv --num-browsers 8 --limit 100000
+    echo "https://www.cnn.com/" | python otl-crawler.py - --commands dnsmpi
+"""
+
 import argparse
+import itertools
+import json
+import sys
 from pathlib import Path
-from typing import Literal
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-
-# OpenWPM commands imported
 from openwpm.command_sequence import CommandSequence
-from openwpm.commands.browser_commands import GetCommand, bot_mitigation, SaveScreenshotCommand
-from openwpm.commands.prebid import GetPrebids
-from openwpm.commands.privacy_link_dig import DNSMPISearch
 from openwpm.commands.ad_collection import AdSearch
-
-
+from openwpm.commands.browser_commands import GetCommand, SaveScreenshotCommand
+from openwpm.commands.prebid import (
+    DetectHeaderBidding,
+    GetPrebids,
+    bids_found,
+    prebid_detected,
+)
+from openwpm.commands.privacy_link_dig import DNSMPISearch
+from openwpm.commands.types import Predicate
 from openwpm.config import BrowserParams, ManagerParams
+from openwpm.storage.local_storage import LocalArrowProvider, LocalGzipProvider
 from openwpm.storage.sql_provider import SQLiteStorageProvider
+from openwpm.storage.storage_providers import (
+    StructuredStorageProvider,
+    UnstructuredStorageProvider,
+)
 from openwpm.task_manager import TaskManager
+from openwpm.utilities.site_list import SITE_LIST_FORMATS, Checkpoint, read_sites
+
+# Commands that can be run after the site has been loaded, in pipeline order
+COMMANDS: Dict[str, Callable[[], Any]] = {
+    "probe": DetectHeaderBidding,
+    "prebids": GetPrebids,
+    "ads": AdSearch,
+    "dnsmpi": DNSMPISearch,
+    "screenshot": lambda: SaveScreenshotCommand("jpg"),
+}
+DEFAULT_COMMANDS = ["probe", "ads", "screenshot"]
+STRUCTURED_STORAGE = ["sqlite", "parquet"]
+UNSTRUCTURED_STORAGE = ["gzip", "leveldb", "none"]
+
 
-#################
-# prebid script #
-#################
-
-sites = [
-    "https://www.cnn.com/",
-    "https://www.espn.com/",
-]
-
-NUM_BROWSERS = 1
-manager_params = ManagerParams(num_browsers=NUM_BROWSERS)
-browser_params = [BrowserParams(display_mode="headless", bot_mitigation=True) for _ in range(NUM_BROWSERS)]
-
-# Update browser configuration (use this for per-browser settings)
-for browser_param in browser_params:
-    # Record HTTP Requests and Responses, cookie changes, navigations, js calls, webreqs, DNS
-    browser_param.http_instrument = True
-    browser_param.cookie_instrument = True
-    browser_param.navigation_instrument = True
-    browser_param.js_instrument = True
-    browser_param.dns_instrument = True
-    browser_param.maximum_profile_size = 1000 * (10**20)  # 50 MB = 50 * 2^20 Bytes
-    browser_param.bot_mitigation = True
-    
-
-manager_params.data_directory = Path("./datadir/")
-manager_params.log_path = Path("./datadir/openwpm.log")
-manager_params.store_extension_messages = True
-
-with TaskManager(
-    manager_params,
-    browser_params,
-    SQLiteStorageProvider(Path("./datadir/crawl-data.sqlite")),
-    None,
-) as manager:
-    # Visits the sites
-    for index, site in enumerate(sites):
-
-        def callback(success: bool, val: str = site) -> None:
-            print(
-                f"CommandSequence for {val} ran {'successfully' if success else 'unsuccessfully'}"
+def parse_commands(value: str) -> List[str]:
+    commands = [name.strip() for name in value.split(",") if name.strip()]
+    for name in commands:
+        if name not in COMMANDS:
+            raise argparse.ArgumentTypeError(
+                "Unknown command %s, choose from %s" % (name, list(COMMANDS))
             )
- 
-        # Parallelize sites over all number of browsers set above.
+    return commands
+
+
+def run_condition(name: str, commands: List[str]) -> Optional[Predicate]:
+    """Skip the ad commands on sites where earlier commands found nothing"""
+    if name == "ads" and "prebids" in commands:
+        return bids_found
+    if name in ("prebids", "ads") and "probe" in commands:
+        return prebid_detected
+    return None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "sites",
+        nargs="?",
+        default="-",
+        help="site list to crawl, '-' reads it from stdin (default)",
+    )
+    parser.add_argument("--config", type=Path, help="JSON file with default options")
+    parser.add_argument("--format", choices=SITE_LIST_FORMATS, default="auto")
+    parser.add_argument(
+        "--limit", type=int, help="only crawl the first LIMIT sites of the list"
+    )
+    parser.add_argument("--num-browsers", type=int, default=1)
+    parser.add_argument(
+        "--standby-browsers",
+        type=int,
+        default=0,
+        help="spare browsers launched ahead of time, so that restarts with a "
+        "fresh profile don't have to wait for a browser launch",
+    )
+    parser.add_argument(
+        "--max-visits-per-domain",
+        type=int,
+        help="maximum number of browsers visiting the same eTLD+1 at a time",
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="visit every site with a fresh profile",
+    )
+    parser.add_argument(
+        "--commands",
+        type=parse_commands,
+        default=DEFAULT_COMMANDS,
+        help="comma separated commands to run after loading each site, "
+        "out of %s (default: %s). They always run in this order and the ad "
+        "commands are skipped if 'probe' or 'prebids' found no Prebid"
+        % (",".join(COMMANDS), ",".join(DEFAULT_COMMANDS)),
+    )
+    parser.add_argument(
+        "--display-mode", choices=["headless", "xvfb", "native"], default="headless"
+    )
+    parser.add_argument("--data-dir", type=Path, default=Path("./datadir/"))
+    parser.add_argument("--storage", choices=STRUCTURED_STORAGE, default="sqlite")
+    parser.add_argument(
+        "--content-storage", choices=UNSTRUCTURED_STORAGE, default="gzip"
+    )
+    parser.add_argument(
+        "--get-sleep", type=int, default=3, help="seconds to wait after each page load"
+    )
+    parser.add_argument(
+        "--get-timeout", type=int, default=60, help="timeout of each page load"
+    )
+    parser.add_argument(
+        "--adaptive-timeouts",
+        action="store_true",
+        help="shorten the command timeouts to what the commands took on "
+        "previous sites",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        help="file recording completed site ranks (default: DATA_DIR/checkpoint.csv)",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="crawl all sites, even those completed by a previous run",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="crawl sites again that failed in a previous run",
+    )
+    return parser
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = build_parser()
+    args, _ = parser.parse_known_args(argv)
+    if args.config is not None:
+        with open(args.config) as f:
+            config = json.load(f)
+        unknown = set(config) - {action.dest for action in parser._actions}
+        if unknown:
+            parser.error("Unknown options in %s: %s" % (args.config, sorted(unknown)))
+        if isinstance(config.get("commands"), list):
+            config["commands"] = parse_commands(",".join(config["commands"]))
+        for path_option in ["data_dir", "checkpoint"]:
+            if config.get(path_option) is not None:
+                config[path_option] = Path(config[path_option])
+        parser.set_defaults(**config)
+    return parser.parse_args(argv)
+
+
+def structured_provider(args: argparse.Namespace) -> StructuredStorageProvider:
+    if args.storage == "parquet":
+        return LocalArrowProvider(args.data_dir / "parquet")
+    return SQLiteStorageProvider(args.data_dir / "crawl-data.sqlite")
+
+
+def unstructured_provider(
+    args: argparse.Namespace,
+) -> Optional[UnstructuredStorageProvider]:
+    if args.content_storage == "none":
+        return None
+    if args.content_storage == "leveldb":
+        # plyvel is an optional dependency
+        from openwpm.storage.leveldb import LevelDbProvider
+
+        return LevelDbProvider(args.data_dir / "content.ldb")
+    # Ad creatives and policies are stored here, named by their SHA-256 hash
+    content_dir = args.data_dir / "content"
+    content_dir.mkdir(parents=True, exist_ok=True)
+    return LocalGzipProvider(content_dir)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+
+    manager_params = ManagerParams(
+        num_browsers=args.num_browsers,
+        num_standby_browsers=args.standby_browsers,
+        max_visits_per_domain=args.max_visits_per_domain,
+        adaptive_timeouts=args.adaptive_timeouts,
+    )
+    manager_params.data_directory = args.data_dir
+    manager_params.log_path = args.data_dir / "openwpm.log"
+    browser_params = [
+        BrowserParams(display_mode=args.display_mode, bot_mitigation=True)
+        for _ in range(args.num_browsers)
+    ]
+    for browser_param in browser_params:
+        # Record HTTP Requests and Responses, cookie changes, navigations,
+        # js calls, webreqs, DNS
+        browser_param.http_instrument = True
+        browser_param.cookie_instrument = True
+        browser_param.navigation_instrument = True
+        browser_param.js_instrument = True
+        browser_param.dns_instrument = True
+        browser_param.maximum_profile_size = 1000 * (10**20)
+
+    checkpoint = Checkpoint(
+        args.checkpoint or args.data_dir / "checkpoint.csv",
+        retry_failed=args.retry_failed,
+    )
+    source = sys.stdin if args.sites == "-" else open(args.sites, newline="")
+    sites: Iterator[Tuple[int, str]] = itertools.islice(
+        read_sites(source, args.format), args.limit
+    )
+    if not args.no_resume:
+        sites = checkpoint.remaining(sites)
+
+    try:
+        with TaskManager(
+            manager_params,
+            browser_params,
+            structured_provider(args),
+            unstructured_provider(args),
+        ) as manager:
+            for site_rank, site in sites:
 
-        command_sequence = CommandSequence(
-            site,
-            site_rank=index,
-            callback=callback,
-        )
+                def callback(
+                    success: bool, val: str = site, rank: int = site_rank
+                ) -> None:
+                    checkpoint.mark_done(rank, success)
+                    print(
+                        f"CommandSequence for {val} ran "
+                        f"{'successfully' if success else 'unsuccessfully'}"
+                    )
 
-        # Start by visiting the page
-        command_sequence.append_command(GetCommand(url=site, sleep=3), timeout=60)
+                command_sequence = CommandSequence(
+                    site, site_rank=site_rank, reset=args.reset, callback=callback
+                )
+                # Start by visiting the page
+                command_sequence.append_command(
+                    GetCommand(url=site, sleep=args.get_sleep),
+                    timeout=args.get_timeout,
+                )
+                for name in COMMANDS:
+                    if name in args.commands:
+                        command_sequence.append_command(
+                            COMMANDS[name](),
+                            run_if=run_condition(name, args.commands),
+                        )
 
-        # get the prebids
-        # command_sequence.append_command(GetPrebids())
-        
-      #  command_sequence.append_command(DNSMPISearch())
-        command_sequence.append_command(AdSearch())
+                # Queued sites are visited by site rank, see SiteScheduler
+                manager.submit(command_sequence)
+    finally:
+        checkpoint.close()
+        if source is not sys.stdin:
+            source.close()
 
-        # save SS to check if working
-        command_sequence.append_command(SaveScreenshotCommand("jpg"))
 
-        manager.execute_command_sequence(command_sequence)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
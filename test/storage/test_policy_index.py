@@ -0,0 +1,34 @@
+from pathlib import Path
+
+from openwpm.storage.policy_index import PolicyIndex, normalize_url
+
+
+def test_normalize_url() -> None:
+    assert (
+        normalize_url("HTTPS://Example.COM:443/privacy/?b=2&a=1#section")
+        == "https://example.com/privacy?a=1&b=2"
+    )
+    assert normalize_url("http://example.com") == "http://example.com/"
+    assert normalize_url("http://example.com:8080/") == "http://example.com:8080/"
+
+
+def test_record_detects_changes(tmp_path: Path) -> None:
+    db_path = tmp_path / "policy_index.sqlite"
+    assert PolicyIndex(db_path, read_only=True).lookup("https://a.com/") is None
+
+    index = PolicyIndex(db_path)
+    assert index.record("https://a.com/privacy", "hash_a", etag='"1"')
+    assert not index.record("https://a.com/privacy/", "hash_a", etag='"2"')
+    assert index.record("https://a.com/privacy", "hash_b")
+
+    reader = PolicyIndex(db_path, read_only=True)
+    entry = reader.lookup("https://A.com/privacy#top")
+    assert entry is not None
+    assert entry.content_hash == "hash_b"
+    assert entry.etag is None
+    versions = index._connect().execute(  # type: ignore[union-attr]
+        "SELECT content_hash FROM policy_versions ORDER BY seen_at"
+    )
+    assert [row[0] for row in versions] == ["hash_a", "hash_b"]
+    reader.close()
+    index.close()
@@ -1,16 +1,31 @@
+import asyncio
+import gzip
+import hashlib
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Tuple
+
 import pandas as pd
+import pytest
 from pandas.testing import assert_frame_equal
 
 from openwpm.mp_logger import MPLogger
+from openwpm.storage import storage_controller
 from openwpm.storage.in_memory_storage import (
     MemoryArrowProvider,
     MemoryStructuredProvider,
+    MemoryUnstructuredProvider,
 )
+from openwpm.storage.policy_index import PolicyIndex
 from openwpm.storage.storage_controller import (
     INVALID_VISIT_ID,
     DataSocket,
+    StorageController,
     StorageControllerHandle,
 )
+from openwpm.storage.storage_providers import TableName
+from openwpm.types import VisitId
 from test.storage.fixtures import dt_test_values
 
 
@@ -40,6 +55,35 @@ def test_startup_and_shutdown(mp_logger: MPLogger, test_values: dt_test_values)
         assert handle.storage[table] == [data]
 
 
+def test_completion_pushed_when_token_resolves() -> None:
+    completion_queue: "queue.Queue[Tuple[VisitId, bool]]" = queue.Queue()
+    controller = StorageController(
+        MemoryStructuredProvider(),
+        None,
+        status_queue=queue.Queue(),
+        completion_queue=completion_queue,
+        shutdown_queue=queue.Queue(),
+    )
+
+    async def run() -> None:
+        saved = asyncio.Event()
+        token = asyncio.create_task(saved.wait())
+        controller.complete_when_saved(VisitId(1), None, True)
+        controller.complete_when_saved(VisitId(2), token, False)
+        assert completion_queue.get_nowait() == (VisitId(1), True)
+        await asyncio.sleep(0)
+        assert completion_queue.empty()
+        assert controller.pending_completions == {token}
+
+        saved.set()
+        await token
+        await asyncio.sleep(0)
+        assert completion_queue.get_nowait() == (VisitId(2), False)
+        assert not controller.pending_completions
+
+    asyncio.run(run())
+
+
 def test_arrow_provider(mp_logger: MPLogger, test_values: dt_test_values) -> None:
     test_table, visit_ids = test_values
     structured = MemoryArrowProvider()
@@ -67,3 +111,120 @@ def test_arrow_provider(mp_logger: MPLogger, test_values: dt_test_values) -> Non
         t2 = pd.DataFrame({k: [v] for k, v in data.items()})
         # Since t2 doesn't get created schema the inferred types are different
         assert_frame_equal(t1, t2, check_dtype=False)
+
+
+def test_store_content(mp_logger: MPLogger) -> None:
+    structured = MemoryStructuredProvider()
+    unstructured = MemoryUnstructuredProvider()
+    controller_handle = StorageControllerHandle(structured, unstructured)
+    controller_handle.launch()
+    assert controller_handle.listener_address is not None
+    cs = DataSocket(controller_handle.listener_address, "Test")
+    cs.store_content(b"creative", "hash_a")
+    cs.store_content(b"creative", "hash_a")
+    cs.store_content(b"other creative", "hash_b")
+    cs.close()
+    controller_handle.shutdown()
+
+    handle = unstructured.handle
+    handle.poll_queue()
+    assert sorted(handle.storage.keys()) == ["hash_a", "hash_b"]
+    assert len(handle.storage["hash_a"]) == 1
+
+
+def test_store_records(mp_logger: MPLogger) -> None:
+    structured = MemoryStructuredProvider()
+    controller_handle = StorageControllerHandle(structured, None)
+    controller_handle.launch()
+    assert controller_handle.listener_address is not None
+    cs = DataSocket(controller_handle.listener_address, "Test")
+    visit_id = VisitId(1)
+    records = [
+        {"browser_id": 1, "bidder": "bidder_a", "cpm": 0.5},
+        {"browser_id": 1, "bidder": "bidder_b", "cpm": 1.5},
+    ]
+    cs.store_records(TableName("prebid_bids"), visit_id, records)
+    cs.finalize_visit_id(visit_id, True)
+    cs.close()
+    controller_handle.shutdown()
+
+    handle = structured.handle
+    handle.poll_queue()
+    assert handle.storage["prebid_bids"] == [
+        dict(record, visit_id=visit_id) for record in records
+    ]
+
+
+def test_store_markdown(mp_logger: MPLogger, tmp_path: Path) -> None:
+    structured = MemoryStructuredProvider()
+    unstructured = MemoryUnstructuredProvider()
+    index_path = tmp_path / "policy_index.sqlite"
+    controller_handle = StorageControllerHandle(
+        structured,
+        unstructured,
+        post_processing_workers=1,
+        policy_index_path=index_path,
+    )
+    controller_handle.launch()
+    assert controller_handle.listener_address is not None
+    cs = DataSocket(controller_handle.listener_address, "Test")
+    visit_id = VisitId(1)
+    policy = (
+        "<html><head><title>Skipped</title></head>"
+        "<body><h1>Privacy Policy</h1><p>We <b>do not</b> sell.</p></body></html>"
+    )
+    cs.store_markdown(visit_id, "https://a.example.com/privacy", policy, '"v1"')
+    cs.store_markdown(visit_id, "https://b.example.com/privacy/", policy)
+    cs.store_markdown(visit_id, "https://B.example.com/privacy#top", policy)
+    cs.finalize_visit_id(visit_id, True)
+    cs.close()
+    controller_handle.shutdown()
+
+    handle = unstructured.handle
+    handle.poll_queue()
+    assert len(handle.storage) == 1
+    (filename, blobs), *_ = handle.storage.items()
+    assert len(blobs) == 1
+    markdown = gzip.decompress(blobs[0]).decode("utf-8")
+    assert filename == hashlib.sha256(markdown.encode("utf-8")).hexdigest() + ".md"
+    assert "# Privacy Policy" in markdown
+    assert "We **do not** sell." in markdown
+    assert "Skipped" not in markdown
+
+    index = PolicyIndex(index_path, read_only=True)
+    entry = index.lookup("https://a.example.com/privacy")
+    assert entry is not None
+    assert entry.etag == '"v1"'
+    assert index.lookup("https://b.example.com/privacy") is not None
+    index.close()
+
+
+def broken_converter(page_html: str) -> str:
+    raise ValueError("Malformed HTML")
+
+
+def test_store_markdown_conversion_error(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(storage_controller, "html_to_markdown", broken_converter)
+    unstructured = MemoryUnstructuredProvider()
+    controller = StorageController(
+        MemoryStructuredProvider(),
+        unstructured,
+        status_queue=queue.Queue(),
+        completion_queue=queue.Queue(),
+        shutdown_queue=queue.Queue(),
+        policy_index_path=tmp_path / "policy_index.sqlite",
+    )
+    controller.post_processing_pool = ProcessPoolExecutor(max_workers=1)
+    try:
+        # Doesn't raise, so the other records of the connection are still saved
+        asyncio.run(
+            controller.store_markdown("https://a.example.com/privacy", "<html>")
+        )
+    finally:
+        controller.post_processing_pool.shutdown()
+    assert controller.policy_index is not None
+    assert controller.policy_index.lookup("https://a.example.com/privacy") is None
+    unstructured.handle.poll_queue()
+    assert not unstructured.handle.storage
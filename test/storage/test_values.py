@@ -57,6 +57,7 @@ def generate_test_values() -> dt_test_values:
         "error": random_word(12),
         "traceback": random_word(12),
         "duration": random.randint(0, 2**63 - 1),
+        "result": random_word(12),
     }
     test_values[TableName("crawl_history")] = fields
     # http_requests
@@ -234,6 +235,19 @@ def generate_test_values() -> dt_test_values:
         "time_stamp": random_word(12),
     }
     test_values[TableName("dns_responses")] = fields
+    # prebid_bids
+    fields = {
+        "browser_id": random.randint(0, 2**31 - 1),
+        "visit_id": random.randint(0, 2**63 - 1),
+        "ad_unit_code": random_word(12),
+        "bidder": random_word(12),
+        "cpm": random.random() * 10,
+        "currency": random_word(3),
+        "size": random_word(7),
+        "time_to_respond": random.randint(0, 2**63 - 1),
+        "hb_pb": random_word(4),
+    }
+    test_values[TableName("prebid_bids")] = fields
     visit_id_set = set(
         d["visit_id"] for d in filter(lambda d: "visit_id" in d, test_values.values())
     )
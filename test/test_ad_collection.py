@@ -0,0 +1,35 @@
+"""Test the helpers behind the AdSearch command."""
+
+from PIL import Image
+
+from openwpm.commands.ad_collection import crop_slot
+
+
+def test_crop_slot_uses_document_coordinates():
+    page = Image.new("RGB", (1000, 3000))
+    slot = {"x": 100, "y": 2000, "width": 300, "height": 250}
+    creative = crop_slot(page, slot)
+    assert creative is not None
+    assert creative.size == (300, 250)
+
+
+def test_crop_slot_scales_with_device_pixel_ratio():
+    page = Image.new("RGB", (2000, 6000))
+    slot = {"x": 100, "y": 2000, "width": 300, "height": 250}
+    creative = crop_slot(page, slot, device_pixel_ratio=2)
+    assert creative is not None
+    assert creative.size == (600, 500)
+
+
+def test_crop_slot_clips_to_page():
+    page = Image.new("RGB", (1000, 1000))
+    slot = {"x": 900, "y": 900, "width": 300, "height": 250}
+    creative = crop_slot(page, slot)
+    assert creative is not None
+    assert creative.size == (100, 100)
+
+
+def test_crop_slot_skips_hidden_slots():
+    page = Image.new("RGB", (1000, 1000))
+    assert crop_slot(page, {"x": 10, "y": 10, "width": 0, "height": 0}) is None
+    assert crop_slot(page, {"x": 10, "y": 1500, "width": 300, "height": 250}) is None
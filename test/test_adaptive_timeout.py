@@ -0,0 +1,53 @@
+from openwpm.utilities.adaptive_timeout import (
+    MIN_SAMPLES,
+    AdaptiveTimeouts,
+    StreamingPercentile,
+)
+
+
+def test_streaming_percentile_window():
+    estimator = StreamingPercentile(window=10)
+    for value in range(100):
+        estimator.add(value)
+    assert len(estimator) == 10
+    assert estimator.percentile(0) == 90
+    assert estimator.percentile(50) == 94
+    assert estimator.percentile(100) == 99
+
+
+def test_default_until_enough_samples():
+    timeouts = AdaptiveTimeouts(percentile=90, margin=2)
+    for _ in range(MIN_SAMPLES - 1):
+        timeouts.record("GetCommand", 3.0)
+    assert timeouts.timeout("GetCommand", 60) == 60
+    timeouts.record("GetCommand", 3.0)
+    assert timeouts.timeout("GetCommand", 60) == 5
+    # Other commands keep their static timeout
+    assert timeouts.timeout("BrowseCommand", 60) == 60
+
+
+def test_never_above_default():
+    timeouts = AdaptiveTimeouts(percentile=90, margin=10)
+    for _ in range(MIN_SAMPLES):
+        timeouts.record("GetCommand", 100.0)
+    assert timeouts.timeout("GetCommand", 60) == 60
+
+
+def test_per_domain():
+    timeouts = AdaptiveTimeouts(percentile=100, margin=0, per_domain=True)
+    for _ in range(MIN_SAMPLES):
+        timeouts.record("GetCommand", 2.0, "fast.com")
+        timeouts.record("GetCommand", 20.0, "slow.com")
+    assert timeouts.timeout("GetCommand", 60, "fast.com") == 2
+    assert timeouts.timeout("GetCommand", 60, "slow.com") == 20
+    # Domains without enough samples fall back to all durations of the command
+    assert timeouts.timeout("GetCommand", 60, "new.com") == 20
+
+
+def test_wait_isnt_learned():
+    timeouts = AdaptiveTimeouts(percentile=100, margin=2)
+    for _ in range(MIN_SAMPLES):
+        timeouts.record("GetCommand", 5.0, wait=3)
+    assert timeouts.timeout("GetCommand", 60, wait=3) == 7
+    # A GetCommand sleeping longer keeps the time it sleeps
+    assert timeouts.timeout("GetCommand", 60, wait=30) == 34
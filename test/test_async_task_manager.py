@@ -0,0 +1,33 @@
+import asyncio
+
+from openwpm.async_task_manager import AsyncTaskManager
+from openwpm.command_sequence import CommandSequence
+from openwpm.storage.sql_provider import SQLiteStorageProvider
+from openwpm.utilities import db_utils
+
+from .utilities import BASE_TEST_URL
+
+
+def test_visit(server, xpi, default_params):
+    manager_params, browser_params = default_params
+    manager_params.num_browsers = 2
+    db_path = manager_params.data_directory / "crawl-data.sqlite"
+
+    async def crawl():
+        async with AsyncTaskManager(
+            manager_params, browser_params[:2], SQLiteStorageProvider(db_path)
+        ) as manager:
+            sequences = []
+            for i in range(3):
+                cs = CommandSequence(f"{BASE_TEST_URL}/simple_a.html", site_rank=i)
+                cs.get()
+                sequences.append(cs)
+            return await asyncio.gather(*(manager.visit(cs) for cs in sequences))
+
+    results = asyncio.run(crawl())
+    assert all(result.success for result in results)
+    assert [result.site_rank for result in results] == [0, 1, 2]
+    visit_ids = db_utils.query_db(
+        db_path, "SELECT visit_id FROM site_visits ORDER BY site_rank", as_tuple=True
+    )
+    assert [(result.visit_id,) for result in results] == visit_ids
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from openwpm.utilities.backpressure import Backpressure
+
+
+def test_hysteresis() -> None:
+    backpressure = Backpressure(high_watermark=10, low_watermark=5)
+    backpressure.update(9)
+    assert not backpressure.throttled
+    backpressure.update(10)
+    assert backpressure.throttled
+    # Dropping below the high watermark isn't enough
+    backpressure.update(6)
+    assert backpressure.throttled
+    backpressure.update(5)
+    assert not backpressure.throttled
+    assert backpressure.metrics()["throttle_events"] == 1
+
+
+def test_memory_watermarks() -> None:
+    backpressure = Backpressure(
+        high_watermark=10,
+        low_watermark=5,
+        memory_high_watermark=1000,
+        memory_low_watermark=800,
+    )
+    backpressure.update(0, 1000)
+    assert backpressure.throttled
+    backpressure.update(0, 900)
+    assert backpressure.throttled
+    backpressure.update(0, 800)
+    assert not backpressure.throttled
+
+
+def test_wait_blocks_until_drained() -> None:
+    backpressure = Backpressure(high_watermark=10, low_watermark=5)
+    assert backpressure.wait() == 0.0
+    backpressure.update(10)
+
+    blocked = []
+    producer = threading.Thread(target=lambda: blocked.append(backpressure.wait()))
+    producer.start()
+    deadline = time.time() + 5
+    while backpressure.metrics()["waiting"] == 0:
+        assert time.time() < deadline, "producer never blocked"
+        time.sleep(0.01)
+    time.sleep(0.2)
+    assert producer.is_alive()
+
+    backpressure.update(4)
+    producer.join(5)
+    assert not producer.is_alive()
+    assert blocked[0] >= 0.2
+    metrics = backpressure.metrics()
+    assert metrics["throttled_time"] >= blocked[0]
+    assert metrics["blocked_time"] == blocked[0]
+    assert metrics["waiting"] == 0
+
+
+def test_release_unblocks() -> None:
+    backpressure = Backpressure(high_watermark=1, low_watermark=0)
+    backpressure.update(1)
+    producer = threading.Thread(target=backpressure.wait)
+    producer.start()
+    backpressure.release()
+    producer.join(5)
+    assert not producer.is_alive()
+    assert backpressure.wait() == 0.0
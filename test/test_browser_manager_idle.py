@@ -0,0 +1,67 @@
+"""Benchmark the CPU an idle BrowserManager uses while waiting for commands"""
+
+import time
+
+import psutil
+from multiprocess import Process, Queue
+
+from openwpm.browser_manager import BrowserManager
+from openwpm.commands.types import ShutdownSignal
+from openwpm.config import BrowserParamsInternal, ManagerParamsInternal
+
+MEASUREMENT_TIME = 3  # seconds
+
+
+def wait_for_commands(browser_manager: BrowserManager) -> None:
+    while not isinstance(browser_manager._next_command(), ShutdownSignal):
+        pass
+
+
+def idle_cpu_percent() -> float:
+    """Percentage of a core used by a BrowserManager waiting for commands
+    while it isn't sent any"""
+    browser_manager = BrowserManager(
+        Queue(),
+        Queue(),
+        BrowserParamsInternal(browser_id=1),
+        ManagerParamsInternal(),
+        False,
+    )
+    process = Process(target=wait_for_commands, args=(browser_manager,))
+    process.start()
+    try:
+        time.sleep(0.5)  # let it settle
+        cpu_times = psutil.Process(process.pid).cpu_times()
+        start = time.time()
+        time.sleep(MEASUREMENT_TIME)
+        cpu_times_after = psutil.Process(process.pid).cpu_times()
+        elapsed = time.time() - start
+    finally:
+        browser_manager.command_queue.put(ShutdownSignal())
+        process.join(5)
+    assert process.exitcode == 0
+    used = (cpu_times_after.user + cpu_times_after.system) - (
+        cpu_times.user + cpu_times.system
+    )
+    return 100 * used / elapsed
+
+
+def test_idle_browser_manager_cpu(record_property):
+    idle = idle_cpu_percent()
+    record_property("idle_cpu_percent", round(idle, 2))
+    assert idle < 1
+
+
+def test_browser_manager_stops_without_task_manager():
+    browser_manager = BrowserManager(
+        Queue(),
+        Queue(),
+        BrowserParamsInternal(browser_id=1),
+        ManagerParamsInternal(),
+        False,
+    )
+    # Pretend the BrowserManager was launched by a process that has exited
+    browser_manager._parent_pid = -1
+    start = time.time()
+    assert isinstance(browser_manager._next_command(), ShutdownSignal)
+    assert time.time() - start < 5
@@ -0,0 +1,58 @@
+"""Test the worker that runs the CommandSequences of a BrowserManagerHandle"""
+
+import threading
+
+from openwpm.browser_manager import BrowserManagerHandle
+from openwpm.command_sequence import CommandSequence
+from openwpm.config import BrowserParamsInternal, ManagerParamsInternal
+
+
+def make_handle() -> BrowserManagerHandle:
+    return BrowserManagerHandle(
+        ManagerParamsInternal(), BrowserParamsInternal(browser_id=1)
+    )
+
+
+def test_worker_runs_assigned_sequences_in_order():
+    handle = make_handle()
+    ran = []
+
+    def run(browser, command_sequence):
+        ran.append(command_sequence.url)
+        browser.finished()
+
+    handle.start_worker(run)
+    done = [handle.assign(CommandSequence(f"https://{i}.com")) for i in range(3)]
+    assert all(event.wait(5) for event in done)
+    assert ran == ["https://0.com", "https://1.com", "https://2.com"]
+    assert handle.idle.is_set()
+    assert handle.stop_worker() == []
+    handle.worker.join(5)
+    assert not handle.worker.is_alive()
+
+
+def test_ready_while_finalizing():
+    handle = make_handle()
+    started = threading.Event()
+    release = threading.Event()
+
+    def run(browser, command_sequence):
+        started.set()
+        release.wait(5)
+
+    handle.start_worker(run)
+    assert handle.ready()
+
+    handle.assign(CommandSequence("https://a.com"))
+    assert started.wait(5)
+    assert not handle.ready()
+    # The next CommandSequence may be prefetched during the FinalizeCommand
+    handle.finalizing = True
+    assert handle.ready()
+    handle.assign(CommandSequence("https://b.com"))
+    assert not handle.ready()
+
+    dropped = handle.stop_worker()
+    assert [cs.url for cs in dropped] == ["https://b.com"]
+    release.set()
+    handle.worker.join(5)
@@ -0,0 +1,37 @@
+import dill
+
+from openwpm.command_sequence import CommandSequence
+from openwpm.commands.browser_commands import GetCommand
+from openwpm.commands.prebid import GetPrebids, bids_found, prebid_detected
+
+
+def test_should_run() -> None:
+    sequence = CommandSequence("http://example.com")
+    command = GetPrebids()
+    sequence.append_command(
+        command,
+        run_if=lambda results: "GetCommand" in results,
+        skip_if=lambda results: results.get("GetCommand") == "skip",
+        name="bids",
+    )
+    assert command.name == "bids"
+    assert GetCommand("http://example.com", 0).name == "GetCommand"
+    assert GetCommand("http://example.com", 0).should_run({})
+
+    assert not command.should_run({})
+    assert command.should_run({"GetCommand": None})
+    assert not command.should_run({"GetCommand": "skip"})
+
+    # Predicates travel to the browser process with the command
+    command = dill.loads(dill.dumps(command))
+    assert command.should_run({"GetCommand": None})
+
+
+def test_prebid_predicates() -> None:
+    assert not prebid_detected({})
+    assert not prebid_detected({"DetectHeaderBidding": {"libraries": ["amazon"]}})
+    assert prebid_detected({"DetectHeaderBidding": {"libraries": ["prebid"]}})
+
+    assert not bids_found({})
+    assert not bids_found({"GetPrebids": {"state": "absent", "wait_time": 0}})
+    assert bids_found({"GetPrebids": {"state": "settled", "bids": 3}})
@@ -100,3 +100,52 @@ def test_num_browser_crawl_config():
 
     browser_params.append(BrowserParams())
     validate_crawl_configs(manager_params, browser_params)
+
+
+def test_storage_watermarks():
+    manager_params = ManagerParams()
+
+    manager_params.storage_low_watermark = manager_params.storage_high_watermark + 1
+    with pytest.raises(ConfigError):
+        validate_manager_params(manager_params)
+
+    manager_params.storage_low_watermark = 10
+    manager_params.storage_memory_high_watermark = 1000
+    manager_params.storage_memory_low_watermark = 2000
+    with pytest.raises(ConfigError):
+        validate_manager_params(manager_params)
+
+    manager_params.storage_memory_low_watermark = 500
+    validate_manager_params(manager_params)
+
+
+def test_num_standby_browsers():
+    manager_params = ManagerParams()
+
+    manager_params.num_standby_browsers = -1
+    with pytest.raises(ConfigError):
+        validate_manager_params(manager_params)
+
+    manager_params.num_standby_browsers = 2
+    validate_manager_params(manager_params)
+
+
+def test_launch_concurrency():
+    manager_params = ManagerParams()
+
+    manager_params.launch_concurrency = 0
+    with pytest.raises(ConfigError):
+        validate_manager_params(manager_params)
+
+
+def test_adaptive_timeouts():
+    manager_params = ManagerParams()
+
+    manager_params.adaptive_timeout_percentile = 0
+    with pytest.raises(ConfigError):
+        validate_manager_params(manager_params)
+
+    manager_params.adaptive_timeout_percentile = 95
+    manager_params.adaptive_timeout_margin = -1
+    with pytest.raises(ConfigError):
+        validate_manager_params(manager_params)
@@ -441,3 +441,48 @@ def test_audio_fingerprinting(default_params, task_manager_creator):
     for item in rows:
         observed_symbols.add(item[1])
     assert AUDIO_SYMBOLS == observed_symbols
+
+
+def test_late_records_stay_with_their_visit(default_params, task_manager_creator):
+    """Records a page still produces while its visit is finalized belong to
+    that visit, not to the next one on the same browser"""
+    manager_params, browser_params = default_params
+    manager_params.num_browsers = 1
+    browser_params[0].js_instrument = True
+    browser_params[0].cookie_instrument = True
+    tm, db = task_manager_creator((manager_params, browser_params[:1]))
+    late_url = utilities.BASE_TEST_URL + "/late_records.html"
+    # Doesn't read navigator.userAgent or set cookies
+    next_url = utilities.BASE_TEST_URL + "/simple_b.html"
+    for url in [late_url, next_url]:
+        cs = CommandSequence(url)
+        cs.get()
+        tm.execute_command_sequence(cs)
+    tm.close()
+
+    visit_ids = dict(
+        db_utils.query_db(
+            db, "SELECT site_url, visit_id FROM site_visits", as_tuple=True
+        )
+    )
+    js_visit_ids = db_utils.query_db(
+        db,
+        "SELECT DISTINCT visit_id FROM javascript WHERE symbol = ?",
+        ("window.navigator.userAgent",),
+        as_tuple=True,
+    )
+    assert js_visit_ids == [(visit_ids[late_url],)]
+    cookie_visit_ids = db_utils.query_db(
+        db,
+        "SELECT DISTINCT visit_id FROM javascript_cookies WHERE name = ?",
+        ("late_cookie",),
+        as_tuple=True,
+    )
+    assert cookie_visit_ids == [(visit_ids[late_url],)]
+    next_visit_ids = db_utils.query_db(
+        db,
+        "SELECT DISTINCT visit_id FROM javascript WHERE symbol = ?",
+        ("window.navigator.platform",),
+        as_tuple=True,
+    )
+    assert next_visit_ids == [(visit_ids[next_url],)]
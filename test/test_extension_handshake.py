@@ -0,0 +1,108 @@
+"""Test the handshake through which the extension reports its startup
+and its replies to the BrowserManager"""
+
+import queue
+import socket
+import time
+
+import pytest
+from multiprocess import Queue
+
+from openwpm import browser_manager
+from openwpm.browser_manager import BrowserManager
+from openwpm.commands import browser_commands
+from openwpm.commands.browser_commands import FinalizeCommand
+from openwpm.config import BrowserParamsInternal, ManagerParamsInternal
+from openwpm.errors import BrowserConfigError
+from openwpm.socket_interface import ClientSocket, ExtensionSocket, ServerSocket
+from openwpm.utilities import db_utils
+
+from . import utilities
+
+
+def make_browser_manager() -> BrowserManager:
+    return BrowserManager(
+        Queue(),
+        Queue(),
+        BrowserParamsInternal(browser_id=1),
+        ManagerParamsInternal(),
+        False,
+    )
+
+
+def test_connects_to_announced_port():
+    # Stands in for the socket the extension receives commands on
+    extension = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    extension.bind(("127.0.0.1", 0))
+    extension.listen(1)
+    startup_socket = ServerSocket(name="test")
+    startup_socket.start_accepting()
+
+    announcement = ClientSocket(serialization="json")
+    announcement.connect(*startup_socket.sock.getsockname())
+    announcement.send({"port": extension.getsockname()[1]})
+    announcement.close()
+
+    extension_socket = make_browser_manager()._start_extension(startup_socket)
+    connection, _ = extension.accept()
+    extension_socket.close()
+    connection.close()
+    extension.close()
+
+
+def test_times_out_without_announcement(monkeypatch):
+    monkeypatch.setattr(browser_manager, "EXTENSION_STARTUP_TIMEOUT", 0.1)
+    startup_socket = ServerSocket(name="test")
+    startup_socket.start_accepting()
+    with pytest.raises(BrowserConfigError) as error:
+        make_browser_manager()._start_extension(startup_socket)
+    assert error.value.message == "The extension did not boot up in time"
+
+
+def test_browser_launch_completes_handshake(task_manager_creator, default_params):
+    manager_params, browser_params = default_params
+    manager_params.num_browsers = 1
+    manager, db = task_manager_creator((manager_params, browser_params[:1]))
+    with manager:
+        (timings,) = manager.launch_timings.values()
+        # Only reached once the BrowserManager connected to the announced port
+        assert "Browser Ready" in timings
+        manager.get(utilities.BASE_TEST_URL + "/simple_a.html")
+    # The visit was finalized through the extension
+    assert db_utils.query_db(db, "SELECT COUNT(*) FROM site_visits")[0][0] == 1
+
+
+class FakeExtensionSocket(ExtensionSocket):
+    """Records the messages sent to the extension instead of sending them"""
+
+    def __init__(self) -> None:
+        super().__init__(queue.Queue())
+        self.sent: list = []
+
+    def send(self, msg) -> None:
+        self.sent.append(msg)
+
+
+def test_finalize_waits_for_extension(monkeypatch):
+    monkeypatch.setattr(browser_commands, "tab_restart_browser", lambda _: None)
+    extension_socket = FakeExtensionSocket()
+    # A late reply to the previous visit doesn't count
+    extension_socket.replies.put({"action": "Finalized", "visit_id": 1})
+    extension_socket.replies.put({"action": "Finalized", "visit_id": 2})
+    command = FinalizeCommand(sleep=5)
+    command.set_visit_browser_id(2, 1)
+    start = time.time()
+    command.execute(None, None, None, extension_socket)
+    assert time.time() - start < 1
+    assert extension_socket.sent == [
+        {"action": "Finalize", "visit_id": 2, "drain_timeout": 5}
+    ]
+    assert extension_socket.replies.empty()
+
+    # Gives up once the extension had its drain timeout and the margin
+    monkeypatch.setattr(browser_commands, "FINALIZE_REPLY_MARGIN", 0.2)
+    command = FinalizeCommand(sleep=0)
+    command.set_visit_browser_id(3, 1)
+    start = time.time()
+    command.execute(None, None, None, extension_socket)
+    assert 0.2 <= time.time() - start < 1
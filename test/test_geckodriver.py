@@ -0,0 +1,113 @@
+"""Test the geckodriver lookup and the Service for a long-lived geckodriver"""
+
+import json
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import psutil
+import pytest
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.firefox.service import Service
+
+from openwpm.browser_manager import BrowserManagerHandle
+from openwpm.config import BrowserParamsInternal, ManagerParamsInternal
+from openwpm.deploy_browsers.selenium_firefox import AttachedService
+from openwpm.utilities.platform_utils import get_geckodriver_path
+
+
+def test_geckodriver_lookup_cached_per_path(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    geckodriver = bin_dir / "geckodriver"
+    geckodriver.write_text("#!/bin/sh\n")
+    geckodriver.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir))
+    assert get_geckodriver_path() == str(geckodriver)
+
+    # Not looked up again while the PATH stays the same
+    geckodriver.unlink()
+    assert get_geckodriver_path() == str(geckodriver)
+
+    monkeypatch.setenv("PATH", str(tmp_path))
+    with pytest.raises(RuntimeError):
+        get_geckodriver_path()
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    ready = True
+
+    def do_GET(self) -> None:
+        body = json.dumps({"value": {"ready": self.ready}}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class BusyStatusHandler(StatusHandler):
+    ready = False
+
+
+def serve_status(handler):
+    """Stands in for the geckodriver, returns the server and its port"""
+    server = HTTPServer(("localhost", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def test_attached_service_leaves_geckodriver_running():
+    geckodriver, port = serve_status(StatusHandler)
+    service = AttachedService("geckodriver", port)
+    service.start()
+    service.stop()
+    assert service.ready()
+    geckodriver.shutdown()
+    geckodriver.server_close()
+
+
+def test_attached_service_requires_ready_geckodriver():
+    # A geckodriver that still has a session can't start another one,
+    # even though its port accepts connections
+    geckodriver, port = serve_status(BusyStatusHandler)
+    with pytest.raises(WebDriverException):
+        AttachedService("geckodriver", port).start()
+    geckodriver.shutdown()
+    geckodriver.server_close()
+
+    # Nothing listens on the port anymore
+    assert not AttachedService("geckodriver", port).ready()
+
+
+GECKODRIVER_STAND_IN = """import subprocess, time
+subprocess.Popen(["sleep", "60"]).wait()
+time.sleep(60)"""
+
+
+def test_forced_kill_keeps_long_lived_geckodriver():
+    handle = BrowserManagerHandle(
+        ManagerParamsInternal(reuse_geckodriver=True),
+        BrowserParamsInternal(browser_id=1),
+    )
+    # Stands in for the geckodriver, which outlives its firefox child
+    handle.geckodriver = Service()
+    handle.geckodriver.process = subprocess.Popen(
+        [sys.executable, "-c", GECKODRIVER_STAND_IN]
+    )
+    handle.geckodriver_pid = handle.geckodriver.process.pid
+    geckodriver = psutil.Process(handle.geckodriver_pid)
+    while not geckodriver.children():
+        time.sleep(0.05)
+    firefox = geckodriver.children()[0]
+
+    handle.kill_browser_manager()
+
+    assert not firefox.is_running()
+    assert handle.geckodriver.process.poll() is None
+    handle.geckodriver.process.kill()
+    handle.geckodriver.process.wait()
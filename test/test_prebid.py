@@ -0,0 +1,42 @@
+"""Test collecting Prebid bids from a page"""
+
+import json
+
+from openwpm.command_sequence import CommandSequence
+from openwpm.commands.prebid import DetectHeaderBidding, GetPrebids
+from openwpm.utilities import db_utils
+
+from . import utilities
+
+DEADLINE = 10
+
+
+def test_renamed_prebid_global(default_params, task_manager_creator):
+    manager_params, browser_params = default_params
+    manager_params.num_browsers = 1
+    manager, db = task_manager_creator((manager_params, browser_params[:1]))
+    cs = CommandSequence(utilities.BASE_TEST_URL + "/prebid_renamed_global.html")
+    cs.get()
+    cs.append_command(DetectHeaderBidding())
+    cs.append_command(GetPrebids(deadline=DEADLINE), timeout=DEADLINE + 10)
+    manager.execute_command_sequence(cs)
+    manager.close()
+
+    results = dict(
+        db_utils.query_db(
+            db,
+            "SELECT command, result FROM crawl_history WHERE result IS NOT NULL",
+            as_tuple=True,
+        )
+    )
+    assert json.loads(results["DetectHeaderBidding"]) == {"libraries": ["prebid"]}
+    readiness = json.loads(results["GetPrebids"])
+    # Settled by the auction rather than waiting for the deadline
+    assert readiness["state"] == "settled"
+    assert readiness["wait_time"] < DEADLINE * 1000
+    assert readiness["bids"] == 1
+
+    bids = db_utils.query_db(
+        db, "SELECT bidder, cpm, size FROM prebid_bids", as_tuple=True
+    )
+    assert bids == [("appnexus", 1.5, "300x250")]
@@ -0,0 +1,56 @@
+"""Test the revalidation of known privacy policies in DNSMPISearch"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openwpm.commands.privacy_link_dig import revalidate_all
+from openwpm.storage.policy_index import PolicyEntry
+
+ETAG = '"v1"'
+
+
+class PolicyHandler(BaseHTTPRequestHandler):
+    """Serves /unchanged, /changed and /slow policies"""
+
+    def do_HEAD(self) -> None:
+        if self.path.startswith("/slow"):
+            time.sleep(3)
+        if self.path == "/unchanged" and self.headers["If-None-Match"] == ETAG:
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header("ETag", '"v2"')
+        self.end_headers()
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def entry(url: str) -> PolicyEntry:
+    return PolicyEntry(url, "hash", ETAG, None, 0, 0, 0)
+
+
+def test_revalidate_all_concurrently_within_deadline():
+    server = ThreadingHTTPServer(("localhost", 0), PolicyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://localhost:%i" % server.server_address[1]
+    entries = {
+        base_url + path: entry(base_url + path)
+        for path in ["/unchanged", "/changed", "/slow", "/slow?page=2"]
+    }
+    try:
+        start = time.time()
+        results = revalidate_all(entries, "OpenWPM test", deadline=1)
+        assert time.time() - start < 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert results == {
+        base_url + "/unchanged": (True, ETAG, None),
+        base_url + "/changed": (False, '"v2"', None),
+        # Didn't answer in time
+        base_url + "/slow": (False, None, None),
+        base_url + "/slow?page=2": (False, None, None),
+    }
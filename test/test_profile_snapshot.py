@@ -0,0 +1,70 @@
+"""Test the incremental snapshots used to recover the state of crashed browsers"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from openwpm.utilities.profile_snapshot import ProfileSnapshot
+
+
+def make_profile(path: Path) -> Path:
+    (path / "storage" / "default").mkdir(parents=True)
+    (path / "cookies.sqlite").write_bytes(b"cookies")
+    (path / "cookies.sqlite-wal").write_bytes(b"wal")
+    (path / "places.sqlite").write_bytes(b"places")
+    (path / "storage" / "default" / "idb.sqlite").write_bytes(b"idb")
+    (path / "prefs.js").write_bytes(b"prefs")
+    return path
+
+
+def touch(path: Path, content: bytes) -> None:
+    mtime_ns = os.stat(path).st_mtime_ns
+    path.write_bytes(content)
+    os.utime(path, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_snapshot_restores_state_files(tmp_path, compress):
+    if compress:
+        pytest.importorskip("zstandard")
+    profile = make_profile(tmp_path / "profile")
+    snapshot_path = tmp_path / "snapshot"
+    snapshot_path.mkdir()
+    snapshot = ProfileSnapshot(snapshot_path, compress)
+    assert sorted(snapshot.update(profile)) == [
+        "cookies.sqlite",
+        "cookies.sqlite-wal",
+        "places.sqlite",
+        "storage/default/idb.sqlite",
+    ]
+
+    restored = tmp_path / "restored"
+    restored.mkdir()
+    assert ProfileSnapshot.restore(snapshot_path, restored) == 4
+    assert (restored / "cookies.sqlite-wal").read_bytes() == b"wal"
+    assert (restored / "storage" / "default" / "idb.sqlite").read_bytes() == b"idb"
+    assert not (restored / "prefs.js").exists()
+
+
+def test_snapshot_only_copies_changed_files(tmp_path):
+    profile = make_profile(tmp_path / "profile")
+    snapshot_path = tmp_path / "snapshot"
+    snapshot_path.mkdir()
+    snapshot = ProfileSnapshot(snapshot_path)
+    snapshot.update(profile)
+
+    # The browser running on the restored profile crashes again
+    restored = tmp_path / "restored"
+    restored.mkdir()
+    ProfileSnapshot.restore(snapshot_path, restored)
+    touch(restored / "cookies.sqlite", b"more cookies")
+    (restored / "cookies.sqlite-wal").unlink()
+    assert snapshot.update(restored) == ["cookies.sqlite"]
+
+    recovered = tmp_path / "recovered"
+    recovered.mkdir()
+    assert ProfileSnapshot.restore(snapshot_path, recovered) == 3
+    assert (recovered / "cookies.sqlite").read_bytes() == b"more cookies"
+    assert not (recovered / "cookies.sqlite-wal").exists()
+    assert (recovered / "places.sqlite").read_bytes() == b"places"
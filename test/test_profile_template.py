@@ -0,0 +1,65 @@
+"""Test the cache of initialized profiles new browser profiles are cloned from"""
+
+from pathlib import Path
+
+from selenium.webdriver.firefox.options import Options
+
+from openwpm.deploy_browsers import profile_template
+from openwpm.deploy_browsers.profile_template import (
+    clone_profile_template,
+    template_key,
+)
+
+
+def make_files(tmp_path: Path):
+    binary = tmp_path / "firefox-bin"
+    binary.write_bytes(b"firefox")
+    extension = tmp_path / "openwpm.xpi"
+    extension.write_bytes(b"extension")
+    return str(binary), str(extension)
+
+
+def test_template_key_changes_with_prefs_and_extension(tmp_path):
+    binary, extension = make_files(tmp_path)
+    key = template_key({"a": 1}, binary, extension)
+    assert template_key({"a": 1}, binary, extension) == key
+    assert template_key({"a": 2}, binary, extension) != key
+
+    Path(extension).write_bytes(b"new extension")
+    assert template_key({"a": 1}, binary, extension) != key
+
+
+def test_template_built_once_and_cloned(tmp_path, monkeypatch):
+    binary, extension = make_files(tmp_path)
+    builds = []
+
+    def build_template(template_path, fo, firefox_binary_path, geckodriver_path):
+        builds.append(template_path)
+        (template_path / "storage").mkdir(parents=True)
+        (template_path / "places.sqlite").write_bytes(b"places")
+        (template_path / "storage" / "ls-archive.sqlite").write_bytes(b"ls")
+
+    monkeypatch.setattr(profile_template, "_build_template", build_template)
+    fo = Options()
+    fo.set_preference("a", 1)
+    for name in ("profile_1", "profile_2"):
+        profile = tmp_path / name
+        profile.mkdir()
+        clone_profile_template(
+            profile, tmp_path / "templates", fo, binary, "geckodriver", extension
+        )
+        assert (profile / "places.sqlite").read_bytes() == b"places"
+        assert (profile / "storage" / "ls-archive.sqlite").read_bytes() == b"ls"
+    assert len(builds) == 1
+
+    # Writing to a clone doesn't affect the template
+    (tmp_path / "profile_1" / "places.sqlite").write_bytes(b"visited")
+    assert (builds[0] / "places.sqlite").read_bytes() == b"places"
+
+    fo.set_preference("a", 2)
+    profile = tmp_path / "profile_3"
+    profile.mkdir()
+    clone_profile_template(
+        profile, tmp_path / "templates", fo, binary, "geckodriver", extension
+    )
+    assert len(builds) == 2
@@ -0,0 +1,73 @@
+from concurrent.futures import Future
+
+from openwpm.command_sequence import CommandSequence
+from openwpm.scheduler import SiteScheduler
+
+
+def submission(url, site_rank=None, index=None):
+    return CommandSequence(url, site_rank=site_rank), index, Future()
+
+
+def urls(submissions):
+    return [s[0].url for s in submissions]
+
+
+def test_site_rank_priority():
+    scheduler = SiteScheduler(1, None)
+    scheduler.put(submission("https://c.com", site_rank=3))
+    scheduler.put(submission("https://unranked.com"))
+    scheduler.put(submission("https://a.com", site_rank=1))
+    scheduler.put(submission("https://b.com", site_rank=2))
+    taken = [scheduler.take(0) for _ in range(4)]
+    assert urls(taken) == [
+        "https://a.com",
+        "https://b.com",
+        "https://c.com",
+        "https://unranked.com",
+    ]
+    assert scheduler.take(0) is None
+
+
+def test_domain_limit():
+    scheduler = SiteScheduler(2, 1)
+    scheduler.put(submission("https://www.example.com/a", site_rank=0))
+    scheduler.put(submission("https://shop.example.com/b", site_rank=1))
+    scheduler.put(submission("https://other.org", site_rank=2))
+
+    first = scheduler.take(0)
+    assert urls([first]) == ["https://www.example.com/a"]
+    scheduler.started(first[0].url)
+    # The second example.com visit has to wait for the first one
+    second = scheduler.take(1)
+    assert urls([second]) == ["https://other.org"]
+    scheduler.started(second[0].url)
+    assert scheduler.take(1) is None
+
+    scheduler.finished(first[0].url)
+    assert urls([scheduler.take(1)]) == ["https://shop.example.com/b"]
+
+
+def test_idle_browsers_steal_work():
+    scheduler = SiteScheduler(2, None)
+    for i in range(3):
+        scheduler.put(submission(f"https://example.com/{i}", site_rank=i))
+    # All visits to a domain are queued for the same browser
+    assert len(scheduler._queues[0]) == 3
+    assert urls([scheduler.take(1)]) == ["https://example.com/0"]
+    assert scheduler.steals == 1
+    assert urls([scheduler.take(0)]) == ["https://example.com/1"]
+
+
+def test_pinned_submissions_are_not_stolen():
+    scheduler = SiteScheduler(2, None)
+    scheduler.put(submission("https://example.com", index=0))
+    assert scheduler.take(1) is None
+    assert urls([scheduler.take(0)]) == ["https://example.com"]
+
+
+def test_clear():
+    scheduler = SiteScheduler(2, None)
+    scheduler.put(submission("https://example.com"))
+    scheduler.put(submission("https://example.org", index=1))
+    assert len(scheduler.clear()) == 2
+    assert len(scheduler) == 0
@@ -0,0 +1,61 @@
+import io
+from pathlib import Path
+
+import pytest
+
+from openwpm.utilities.site_list import Checkpoint, read_sites
+
+
+def test_read_tranco() -> None:
+    source = io.StringIO("1,google.com\n2,http://example.com/\n")
+    assert list(read_sites(source)) == [
+        (1, "https://google.com"),
+        (2, "http://example.com/"),
+    ]
+
+
+def test_read_csv() -> None:
+    source = io.StringIO("Rank,URL,category\n5,a.com,news\n7,b.com,shop\n")
+    assert list(read_sites(source)) == [(5, "https://a.com"), (7, "https://b.com")]
+
+    source = io.StringIO("domain,category\na.com,news\n\nb.com,shop\n")
+    assert list(read_sites(source, "csv")) == [
+        (0, "https://a.com"),
+        (1, "https://b.com"),
+    ]
+
+
+def test_read_plain() -> None:
+    source = io.StringIO("# top sites\na.com\n\nhttps://b.com/\n")
+    assert list(read_sites(source)) == [(0, "https://a.com"), (1, "https://b.com/")]
+
+
+def test_read_sites_is_lazy() -> None:
+    def lines():
+        yield "1,a.com\n"
+        raise AssertionError("Read more lines than requested")
+
+    sites = read_sites(lines())  # type: ignore[arg-type]
+    assert next(sites) == (1, "https://a.com")
+
+
+def test_unsupported_format() -> None:
+    with pytest.raises(ValueError):
+        list(read_sites(io.StringIO(""), "xml"))
+
+
+def test_checkpoint_resume(tmp_path: Path) -> None:
+    path = tmp_path / "checkpoint.csv"
+    sites = [(1, "https://a.com"), (2, "https://b.com"), (3, "https://c.com")]
+    checkpoint = Checkpoint(path)
+    checkpoint.mark_done(1, True)
+    checkpoint.mark_done(2, False)
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path)
+    assert list(checkpoint.remaining(iter(sites))) == [(3, "https://c.com")]
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path, retry_failed=True)
+    assert list(checkpoint.remaining(iter(sites))) == sites[1:]
+    checkpoint.close()
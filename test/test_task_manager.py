@@ -1,5 +1,6 @@
 """Test TaskManager functionality."""
 
+import time
 from contextlib import nullcontext as does_not_raise
 
 import pytest
@@ -7,6 +8,7 @@ import pytest
 from openwpm.command_sequence import CommandSequence
 from openwpm.commands.types import BaseCommand
 from openwpm.errors import CommandExecutionError
+from openwpm.utilities import db_utils
 
 from .utilities import BASE_TEST_URL
 
@@ -82,3 +84,57 @@ def test_assertion_error_propagation(
     with expectation:
         with manager:
             manager.execute_command_sequence(cs)
+
+
+def test_submit_returns_futures(task_manager_creator, default_params):
+    """Test that submit doesn't block and resolves futures once visits are saved"""
+    manager_params, browser_params = default_params
+    manager_params.num_browsers = 2
+    manager, _ = task_manager_creator((manager_params, browser_params[:2]))
+    futures = []
+    with manager:
+        for _ in range(4):
+            cs = CommandSequence(BASE_TEST_URL)
+            cs.get()
+            futures.append(manager.submit(cs))
+        assert all(future.result(timeout=180) for future in futures)
+
+
+def test_standby_browser_swapped_in(task_manager_creator, default_params):
+    """Test that a stateless restart swaps in the spare browser"""
+    manager_params, browser_params = default_params
+    manager_params.num_browsers = 1
+    manager_params.num_standby_browsers = 1
+    manager, db = task_manager_creator((manager_params, browser_params[:1]))
+    with manager:
+        browser = manager.browsers[0]
+        deadline = time.time() + 120
+        while not manager.standby_pool.available(browser.browser_id):
+            assert time.time() < deadline, "Standby browser didn't launch"
+            time.sleep(1)
+        first_pid = browser.geckodriver_pid
+        for _ in range(2):
+            cs = CommandSequence(BASE_TEST_URL, reset=True)
+            cs.get()
+            manager.execute_command_sequence(cs)
+    assert manager.standby_pool.swaps >= 1
+    assert browser.geckodriver_pid != first_pid
+    browser_ids = db_utils.query_db(
+        db, "SELECT DISTINCT browser_id FROM site_visits", as_tuple=True
+    )
+    assert browser_ids == [(browser.browser_id,)]
+
+
+def test_parallel_launch_timings(task_manager_creator, default_params):
+    manager_params, browser_params = default_params
+    manager_params.num_browsers = 2
+    manager_params.launch_concurrency = 2
+    manager, _ = task_manager_creator((manager_params, browser_params[:2]))
+    with manager:
+        timings = manager.launch_timings
+    assert len(timings) == 2
+    for stages in timings.values():
+        assert "Browser Launched" in stages
+        assert stages["Total"] == pytest.approx(
+            sum(t for stage, t in stages.items() if stage != "Total")
+        )